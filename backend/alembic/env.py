@@ -0,0 +1,56 @@
+"""
+Alembic environment for 8pilot backend
+"""
+
+from logging.config import fileConfig
+
+from alembic import context
+from sqlalchemy import create_engine, pool
+
+from app.core.database import Base, SQLALCHEMY_DATABASE_URL
+
+# Import all models to ensure they are registered with Base
+from app.core import cache  # noqa: F401
+from app.models import user, workflow, settings as settings_models  # noqa: F401
+
+config = context.config
+
+if config.config_file_name is not None:
+    fileConfig(config.config_file_name)
+
+target_metadata = Base.metadata
+
+# SQLite can't ALTER most things in place; batch mode recreates tables
+RENDER_AS_BATCH = SQLALCHEMY_DATABASE_URL.startswith("sqlite")
+
+def run_migrations_offline():
+    """Emit migration SQL without a database connection"""
+    context.configure(
+        url=SQLALCHEMY_DATABASE_URL,
+        target_metadata=target_metadata,
+        literal_binds=True,
+        dialect_opts={"paramstyle": "named"},
+        render_as_batch=RENDER_AS_BATCH
+    )
+
+    with context.begin_transaction():
+        context.run_migrations()
+
+def run_migrations_online():
+    """Run migrations against the configured database"""
+    connectable = create_engine(SQLALCHEMY_DATABASE_URL, poolclass=pool.NullPool)
+
+    with connectable.connect() as connection:
+        context.configure(
+            connection=connection,
+            target_metadata=target_metadata,
+            render_as_batch=RENDER_AS_BATCH
+        )
+
+        with context.begin_transaction():
+            context.run_migrations()
+
+if context.is_offline_mode():
+    run_migrations_offline()
+else:
+    run_migrations_online()
@@ -0,0 +1,24 @@
+"""Index users on (created_at, id) for keyset pagination
+
+Tables are created by create_tables(), which also builds this index on
+new databases, so the index is only added where it is missing.
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-18
+"""
+
+from alembic import op
+
+revision = "0001"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.create_index(
+        "ix_users_created_at_id", "users", ["created_at", "id"], if_not_exists=True
+    )
+
+def downgrade():
+    op.drop_index("ix_users_created_at_id", table_name="users", if_exists=True)
@@ -3,7 +3,7 @@ Main API router for v1 endpoints
 """
 
 from fastapi import APIRouter
-from app.api.v1.endpoints import chat, workflow, settings, auth
+from app.api.v1.endpoints import chat, workflow, settings, auth, admin
 
 api_router = APIRouter()
 
@@ -12,6 +12,7 @@ api_router.include_router(auth.router, prefix="/auth", tags=["authentication"])
 api_router.include_router(chat.router, prefix="/chat", tags=["chat"])
 api_router.include_router(workflow.router, prefix="/workflow", tags=["workflow"])
 api_router.include_router(settings.router, prefix="/settings", tags=["settings"])
+api_router.include_router(admin.router, prefix="/admin", tags=["admin"])
 
 @api_router.get("/")
 async def root():
@@ -0,0 +1,48 @@
+"""
+Admin endpoints for looking inside a running worker
+"""
+
+from fastapi import APIRouter, HTTPException, Depends, Query
+from fastapi.responses import PlainTextResponse
+from typing import Literal
+import logging
+
+from app.core.config import settings
+from app.core.dependencies import get_worker_admin_user
+from app.core.loop_monitor import loop_monitor
+from app.core.profiler import ProfilerBusyError, profiler
+
+router = APIRouter()
+logger = logging.getLogger(__name__)
+
+@router.post("/profile")
+async def profile_worker(
+    seconds: float = Query(10.0, gt=0, le=settings.profiler_max_seconds),
+    interval_ms: float = Query(5.0, ge=1, le=100, description="Time between stack samples"),
+    slow_callback_ms: float = Query(50.0, ge=1, description="Report loop callbacks running at least this long"),
+    include_idle: bool = Query(False, description="Also count samples of threads waiting for work"),
+    format: Literal["json", "collapsed"] = Query("json", description="collapsed: only the stacks, for flamegraph.pl"),
+    current_user = Depends(get_worker_admin_user)
+):
+    """Sample the stacks of the worker handling this request (admin only)"""
+    try:
+        report = await profiler.profile(
+            seconds,
+            interval=interval_ms / 1000,
+            slow_callback_seconds=slow_callback_ms / 1000,
+            include_idle=include_idle
+        )
+    except ProfilerBusyError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error profiling worker: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail="Failed to profile worker")
+    
+    if format == "collapsed":
+        return PlainTextResponse(report["collapsed"] + "\n")
+    return report
+
+@router.get("/loop")
+async def event_loop_stats(current_user = Depends(get_worker_admin_user)):
+    """Event loop lag and the slowest callbacks seen by this worker (admin only)"""
+    return loop_monitor.stats()
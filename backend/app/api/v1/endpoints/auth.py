@@ -1,35 +1,41 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from typing import List
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Optional
 
-from ....core.dependencies import get_current_user, get_current_active_user, get_current_admin_user
-from ....core.database import get_db
+from fastapi.security import HTTPAuthorizationCredentials
+from ....core.dependencies import (
+    get_current_user, get_current_active_user, get_current_admin_user,
+    get_worker_admin_user, security
+)
+from ....core.database import get_async_db
+from ....core.hashing import password_hasher
+from ....core.token_cache import token_cache
 from ....services.user_service import UserService
 from ....models.user import (
     UserCreate, UserResponse, UserUpdate, UserLogin, 
-    UserLoginResponse, Token
+    UserLoginResponse, UserPage, Token
 )
 
 router = APIRouter()
 
 @router.post("/register", response_model=UserResponse, status_code=status.HTTP_201_CREATED)
-def register_user(
+async def register_user(
     user_data: UserCreate,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Register a new user"""
     user_service = UserService(db)
-    user = user_service.create_user(user_data)
+    user = await user_service.create_user(user_data)
     return UserResponse.model_validate(user)
 
 @router.post("/login", response_model=UserLoginResponse)
-def login_user(
+async def login_user(
     user_data: UserLogin,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Login user and get access token"""
     user_service = UserService(db)
-    return user_service.login_user(user_data)
+    return await user_service.login_user(user_data)
 
 @router.get("/me", response_model=UserResponse)
 def get_current_user_info(
@@ -39,14 +45,14 @@ def get_current_user_info(
     return UserResponse.model_validate(current_user)
 
 @router.put("/me", response_model=UserResponse)
-def update_current_user(
+async def update_current_user(
     user_data: UserUpdate,
     current_user = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Update current user profile"""
     user_service = UserService(db)
-    updated_user = user_service.update_user(current_user.id, user_data)
+    updated_user = await user_service.update_user(current_user.id, user_data)
     return UserResponse.model_validate(updated_user)
 
 from pydantic import BaseModel
@@ -56,14 +62,14 @@ class PasswordChangeRequest(BaseModel):
     new_password: str
 
 @router.post("/me/change-password")
-def change_password(
+async def change_password(
     password_data: PasswordChangeRequest,
     current_user = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Change current user password"""
     user_service = UserService(db)
-    success = user_service.change_password(
+    success = await user_service.change_password(
         current_user.id, 
         password_data.current_password, 
         password_data.new_password
@@ -75,26 +81,30 @@ def change_password(
         detail="Failed to change password"
     )
 
-@router.get("/users", response_model=List[UserResponse])
-def get_all_users(
+@router.get("/users", response_model=UserPage)
+async def get_all_users(
+    limit: int = Query(50, ge=1, le=500),
+    cursor: Optional[str] = Query(None, description="next_cursor of the previous page"),
     current_user = Depends(get_current_admin_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    """Get all users (admin only)"""
+    """List users page by page, oldest first (admin only)"""
     user_service = UserService(db)
-    # This would need to be implemented in UserService
-    # For now, return empty list
-    return []
+    users, next_cursor = await user_service.list_users(limit, cursor)
+    return UserPage(
+        users=[UserResponse.model_validate(user) for user in users],
+        next_cursor=next_cursor
+    )
 
 @router.get("/users/{user_id}", response_model=UserResponse)
-def get_user_by_id(
+async def get_user_by_id(
     user_id: int,
     current_user = Depends(get_current_admin_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Get user by ID (admin only)"""
     user_service = UserService(db)
-    user = user_service.get_user_by_id(user_id)
+    user = await user_service.get_user_snapshot(user_id)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -103,26 +113,26 @@ def get_user_by_id(
     return UserResponse.model_validate(user)
 
 @router.put("/users/{user_id}", response_model=UserResponse)
-def update_user_by_id(
+async def update_user_by_id(
     user_id: int,
     user_data: UserUpdate,
     current_user = Depends(get_current_admin_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Update user by ID (admin only)"""
     user_service = UserService(db)
-    updated_user = user_service.update_user(user_id, user_data)
+    updated_user = await user_service.update_user(user_id, user_data)
     return UserResponse.model_validate(updated_user)
 
 @router.delete("/users/{user_id}")
-def deactivate_user(
+async def deactivate_user(
     user_id: int,
     current_user = Depends(get_current_admin_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Deactivate user account (admin only)"""
     user_service = UserService(db)
-    success = user_service.deactivate_user(user_id)
+    success = await user_service.deactivate_user(user_id)
     if success:
         return {"message": "User deactivated successfully"}
     raise HTTPException(
@@ -130,10 +140,17 @@ def deactivate_user(
         detail="Failed to deactivate user"
     )
 
+@router.get("/hashing-stats")
+def get_hashing_stats(
+    current_user = Depends(get_worker_admin_user)
+):
+    """Password hashing queue depth and latency (admin only)"""
+    return password_hasher.stats()
+
 @router.post("/refresh", response_model=Token)
 def refresh_token(
     current_user = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Refresh access token"""
     user_service = UserService(db)
@@ -144,11 +161,14 @@ def refresh_token(
 
 @router.post("/logout")
 def logout_user(
-    current_user = Depends(get_current_active_user)
+    current_user = Depends(get_current_active_user),
+    credentials: HTTPAuthorizationCredentials = Depends(security)
 ):
     """Logout user and invalidate token"""
     # Since we're using stateless JWT tokens, we can't truly invalidate them
     # on the server side without maintaining a blacklist. For now, we'll
-    # return success and rely on the client to clear the token.
+    # drop the verified token from this worker's cache and rely on the client
+    # to clear the token.
     # In a production system, you might want to implement a token blacklist.
+    token_cache.invalidate_token(credentials.credentials)
     return {"message": "Successfully logged out"}
@@ -2,19 +2,27 @@
 Chat API endpoints for AI interactions
 """
 
-from fastapi import APIRouter, HTTPException, Depends, BackgroundTasks
+from fastapi import APIRouter, HTTPException, Depends, BackgroundTasks, Header, Query
 from fastapi.responses import StreamingResponse
-from typing import List, Optional
+from datetime import datetime
+from typing import List, Literal, Optional
 import time
 import logging
 
 from app.models.chat import (
     ChatRequest, ChatResponse, ChatSession, 
-    ChatHistory, StreamingChatResponse
+    ChatHistory, StreamingChatResponse, WorkflowCandidate,
+    ChatSessionPage, ChatMessagePage, ChatSearchResults
 )
 from app.services.chat_service import ChatService
 from app.services.ai_service import AIService
+from app.services.workflow_service import validate_workflow_data
+from app.services.workflow_extractor import WorkflowJsonExtractor
+from app.services.settings_service import SettingsService, get_settings_service
 from app.core.config import settings
+from app.core.dependencies import get_settings_owner
+from app.core.etag import etag_matches, make_etag, not_modified
+from app.core.responses import FastJSONResponse
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
@@ -26,7 +34,9 @@ ai_service = AIService()
 @router.post("/send", response_model=ChatResponse)
 async def send_message(
     request: ChatRequest,
-    background_tasks: BackgroundTasks
+    background_tasks: BackgroundTasks,
+    settings_service: SettingsService = Depends(get_settings_service),
+    owner: str = Depends(get_settings_owner)
 ):
     """Send a message and get AI response"""
     try:
@@ -38,8 +48,14 @@ async def send_message(
             session_id=request.session_id
         )
         
-        # Add user message to session
-        await chat_service.add_message(session.session_id, "user", request.message)
+        # History sent to the provider; the new message is sent separately
+        history = await chat_service.get_recent_messages(session)
+        
+        # Add user message to session, within the user's history limit
+        max_history = (await settings_service.get_user_settings(owner)).max_history
+        await chat_service.add_message(
+            session.session_id, "user", request.message, max_history=max_history
+        )
         
         # Get AI response using provided or configured API keys
         api_key = None
@@ -53,12 +69,14 @@ async def send_message(
             provider=request.provider,
             model=request.model,
             context=request.context,
-            session_history=session.messages,
+            session_history=history,
             api_key=api_key
         )
         
         # Add AI response to session
-        await chat_service.add_message(session.session_id, "assistant", ai_response)
+        await chat_service.add_message(
+            session.session_id, "assistant", ai_response, max_history=max_history
+        )
         
         response_time = time.time() - start_time
         
@@ -82,7 +100,9 @@ async def send_message(
 
 @router.post("/stream")
 async def stream_message(
-    request: ChatRequest
+    request: ChatRequest,
+    settings_service: SettingsService = Depends(get_settings_service),
+    owner: str = Depends(get_settings_owner)
 ):
     """Stream AI response in real-time"""
     try:
@@ -92,8 +112,14 @@ async def stream_message(
             session_id=request.session_id
         )
         
-        # Add user message to session
-        await chat_service.add_message(session.session_id, "user", request.message)
+        # History sent to the provider; the new message is sent separately
+        history = await chat_service.get_recent_messages(session)
+        
+        # Add user message to session, within the user's history limit
+        max_history = (await settings_service.get_user_settings(owner)).max_history
+        await chat_service.add_message(
+            session.session_id, "user", request.message, max_history=max_history
+        )
         
         async def generate_stream():
             """Generate streaming response"""
@@ -104,22 +130,43 @@ async def stream_message(
                     api_key = request.openai_api_key
                 elif request.provider == "anthropic" and request.anthropic_api_key:
                     api_key = request.anthropic_api_key
+                
+                # Workflows are picked out of the reply while it streams
+                extractor = WorkflowJsonExtractor()
+                candidates = 0
                     
                 async for chunk in ai_service.stream_response(
                     message=request.message,
                     provider=request.provider,
                     model=request.model,
                     context=request.context,
-                    session_history=session.messages,
+                    session_history=history,
                     api_key=api_key
                 ):
-                    yield f"data: {chunk.json()}\n\n"
+                    text = chunk.get("chunk", "")
+                    stream_chunk = StreamingChatResponse(
+                        chunk=text,
+                        session_id=session.session_id
+                    )
+                    yield f"data: {stream_chunk.json()}\n\n"
+                    
+                    for workflow in extractor.feed(text):
+                        validation = validate_workflow_data(workflow)
+                        candidate = WorkflowCandidate(
+                            session_id=session.session_id,
+                            index=candidates,
+                            workflow=workflow,
+                            **validation
+                        )
+                        candidates += 1
+                        yield f"event: workflow_candidate\ndata: {candidate.model_dump_json()}\n\n"
                 
                 # Final chunk
                 final_chunk = StreamingChatResponse(
                     chunk="",
                     session_id=session.session_id,
-                    is_complete=True
+                    is_complete=True,
+                    metadata={"workflow_candidates": candidates}
                 )
                 yield f"data: {final_chunk.json()}\n\n"
                 
@@ -146,24 +193,96 @@ async def stream_message(
         logger.error(f"Error in stream_message: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.get("/search", response_model=ChatSearchResults)
+async def search_chat_history(
+    q: str = Query(..., min_length=1, max_length=200),
+    workflow_id: Optional[str] = None,
+    role: Optional[Literal["user", "assistant", "system"]] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    limit: int = Query(20, ge=1, le=100)
+):
+    """Search messages across all chat sessions"""
+    try:
+        results = await chat_service.search_messages(q, workflow_id, role, since, until, limit)
+        return FastJSONResponse(results)
+    except RuntimeError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error searching chat history: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+
 @router.get("/sessions/{workflow_id}", response_model=ChatHistory)
 async def get_chat_history(workflow_id: str):
     """Get chat history for a specific workflow"""
     try:
         history = await chat_service.get_workflow_history(workflow_id)
-        return history
+        return FastJSONResponse(history)
     except Exception as e:
         logger.error(f"Error getting chat history: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.get("/sessions/{workflow_id}/page", response_model=ChatSessionPage)
+async def get_chat_session_page(
+    workflow_id: str,
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = None,
+    message_limit: int = Query(0, ge=0, le=500)
+):
+    """Get a page of a workflow's sessions, most recently active first"""
+    try:
+        page = await chat_service.get_session_page(workflow_id, limit, cursor, message_limit)
+        return FastJSONResponse(page)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error getting chat session page: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/sessions/{workflow_id}/stream")
+async def stream_chat_history(workflow_id: str):
+    """Stream a workflow's chat history as NDJSON, one session per line"""
+    
+    async def generate_lines():
+        try:
+            async for session in chat_service.iter_workflow_history(workflow_id):
+                yield session.model_dump_json() + "\n"
+        except Exception as e:
+            # Headers are already sent, so the stream just ends early
+            logger.error(f"Error streaming chat history: {e}", exc_info=True)
+    
+    return StreamingResponse(generate_lines(), media_type="application/x-ndjson")
+
+@router.get("/sessions/{session_id}/messages", response_model=ChatMessagePage)
+async def get_chat_messages(
+    session_id: str,
+    limit: int = Query(50, ge=1, le=500),
+    before: Optional[int] = Query(None, ge=0)
+):
+    """Get a page of a session's messages, walking back from the latest"""
+    try:
+        page = await chat_service.get_message_page(session_id, limit, before)
+        if page is None:
+            raise HTTPException(status_code=404, detail="Chat session not found")
+        return FastJSONResponse(page)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error getting chat messages: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+
 @router.get("/sessions/{workflow_id}/latest", response_model=ChatSession)
-async def get_latest_session(workflow_id: str):
+async def get_latest_session(workflow_id: str, if_none_match: Optional[str] = Header(None)):
     """Get the latest chat session for a workflow"""
     try:
-        session = await chat_service.get_latest_session(workflow_id)
-        if not session:
+        stamp = await chat_service.get_latest_session_stamp(workflow_id)
+        if stamp is None:
             raise HTTPException(status_code=404, detail="No chat session found")
-        return session
+        etag = make_etag("session", *stamp)
+        if etag_matches(if_none_match, etag):
+            return not_modified(etag)
+        session = await chat_service.get_latest_session(workflow_id)
+        return FastJSONResponse(session, headers={"ETag": etag})
     except HTTPException:
         raise
     except Exception as e:
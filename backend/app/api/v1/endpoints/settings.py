@@ -2,7 +2,7 @@
 Settings API endpoints for user configuration
 """
 
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Header
 from typing import List, Optional
 import logging
 
@@ -10,51 +10,71 @@ from app.models.settings import (
     UserSettings, SettingsUpdate, N8nInstance, 
     N8nInstanceCreate, N8nInstanceUpdate
 )
-from app.services.settings_service import SettingsService
+from app.core.dependencies import get_settings_owner
+from app.core.etag import etag_matches, make_etag, not_modified
+from app.core.responses import FastJSONResponse
+from app.services.settings_service import SettingsService, get_settings_service
 from app.services.n8n_service import N8nService
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
 
 # Service instances
-# settings_service = SettingsService()  # Remove global initialization
 # n8n_service = N8nService()  # Remove global initialization
 
 @router.get("/", response_model=UserSettings)
-async def get_user_settings():
+async def get_user_settings(
+    settings_service: SettingsService = Depends(get_settings_service),
+    owner: str = Depends(get_settings_owner),
+    if_none_match: Optional[str] = Header(None)
+):
     """Get current user settings"""
     try:
-        settings = await SettingsService().get_user_settings()
-        return settings
+        etag = make_etag("settings", owner, await settings_service.get_settings_version(owner))
+        if etag_matches(if_none_match, etag):
+            return not_modified(etag)
+        settings = await settings_service.get_user_settings(owner)
+        return FastJSONResponse(settings, headers={"ETag": etag})
     except Exception as e:
         logger.error(f"Error getting user settings: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.put("/", response_model=UserSettings)
-async def update_user_settings(settings_update: SettingsUpdate):
+async def update_user_settings(
+    settings_update: SettingsUpdate,
+    settings_service: SettingsService = Depends(get_settings_service),
+    owner: str = Depends(get_settings_owner)
+):
     """Update user settings"""
     try:
-        updated_settings = await SettingsService().update_settings(settings_update)
+        updated_settings = await settings_service.update_settings(settings_update, owner)
         return updated_settings
     except Exception as e:
         logger.error(f"Error updating user settings: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/n8n-instances", response_model=List[N8nInstance])
-async def get_n8n_instances():
+async def get_n8n_instances(
+    settings_service: SettingsService = Depends(get_settings_service),
+    owner: str = Depends(get_settings_owner)
+):
     """Get all configured n8n instances"""
     try:
-        instances = await SettingsService().get_n8n_instances()
+        instances = await settings_service.get_n8n_instances(owner)
         return instances
     except Exception as e:
         logger.error(f"Error getting n8n instances: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.post("/n8n-instances", response_model=N8nInstance)
-async def create_n8n_instance(instance: N8nInstanceCreate):
+async def create_n8n_instance(
+    instance: N8nInstanceCreate,
+    settings_service: SettingsService = Depends(get_settings_service),
+    owner: str = Depends(get_settings_owner)
+):
     """Create new n8n instance configuration"""
     try:
-        created_instance = await SettingsService().create_n8n_instance(instance)
+        created_instance = await settings_service.create_n8n_instance(instance, owner)
         return created_instance
     except Exception as e:
         logger.error(f"Error creating n8n instance: {e}", exc_info=True)
@@ -63,12 +83,14 @@ async def create_n8n_instance(instance: N8nInstanceCreate):
 @router.put("/n8n-instances/{instance_id}", response_model=N8nInstance)
 async def update_n8n_instance(
     instance_id: str, 
-    instance_update: N8nInstanceUpdate
+    instance_update: N8nInstanceUpdate,
+    settings_service: SettingsService = Depends(get_settings_service),
+    owner: str = Depends(get_settings_owner)
 ):
     """Update n8n instance configuration"""
     try:
-        updated_instance = await SettingsService().update_n8n_instance(
-            instance_id, instance_update
+        updated_instance = await settings_service.update_n8n_instance(
+            instance_id, instance_update, owner
         )
         return updated_instance
     except Exception as e:
@@ -76,21 +98,29 @@ async def update_n8n_instance(
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.delete("/n8n-instances/{instance_id}")
-async def delete_n8n_instance(instance_id: str):
+async def delete_n8n_instance(
+    instance_id: str,
+    settings_service: SettingsService = Depends(get_settings_service),
+    owner: str = Depends(get_settings_owner)
+):
     """Delete n8n instance configuration"""
     try:
-        await SettingsService().delete_n8n_instance(instance_id)
+        await settings_service.delete_n8n_instance(instance_id, owner)
         return {"message": "n8n instance deleted successfully"}
     except Exception as e:
         logger.error(f"Error deleting n8n instance: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.post("/n8n-instances/{instance_id}/test")
-async def test_n8n_connection(instance_id: str):
+async def test_n8n_connection(
+    instance_id: str,
+    settings_service: SettingsService = Depends(get_settings_service),
+    owner: str = Depends(get_settings_owner)
+):
     """Test connection to n8n instance"""
     try:
         # Get instance configuration
-        instance = await SettingsService().get_n8n_instance(instance_id)
+        instance = await settings_service.get_n8n_instance(instance_id, owner)
         if not instance:
             raise HTTPException(status_code=404, detail="n8n instance not found")
         
@@ -114,40 +144,53 @@ async def test_n8n_connection(instance_id: str):
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.post("/n8n-instances/{instance_id}/set-default")
-async def set_default_n8n_instance(instance_id: str):
+async def set_default_n8n_instance(
+    instance_id: str,
+    settings_service: SettingsService = Depends(get_settings_service),
+    owner: str = Depends(get_settings_owner)
+):
     """Set n8n instance as default"""
     try:
-        await SettingsService().set_default_n8n_instance(instance_id)
+        await settings_service.set_default_n8n_instance(instance_id, owner)
         return {"message": "Default n8n instance updated successfully"}
     except Exception as e:
         logger.error(f"Error setting default n8n instance: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/ai-providers")
-async def get_ai_providers():
+async def get_ai_providers(
+    settings_service: SettingsService = Depends(get_settings_service),
+    owner: str = Depends(get_settings_owner)
+):
     """Get available AI providers and their status"""
     try:
-        providers = await SettingsService().get_ai_providers_status()
+        providers = await settings_service.get_ai_providers_status(owner)
         return providers
     except Exception as e:
         logger.error(f"Error getting AI providers status: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.post("/reset")
-async def reset_settings():
+async def reset_settings(
+    settings_service: SettingsService = Depends(get_settings_service),
+    owner: str = Depends(get_settings_owner)
+):
     """Reset settings to default values"""
     try:
-        await SettingsService().reset_to_defaults()
+        await settings_service.reset_to_defaults(owner)
         return {"message": "Settings reset to defaults successfully"}
     except Exception as e:
         logger.error(f"Error resetting settings: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/export")
-async def export_settings():
+async def export_settings(
+    settings_service: SettingsService = Depends(get_settings_service),
+    owner: str = Depends(get_settings_owner)
+):
     """Export user settings"""
     try:
-        settings_data = await SettingsService().export_settings()
+        settings_data = await settings_service.export_settings(owner)
         return {
             "message": "Settings exported successfully",
             "data": settings_data
@@ -157,10 +200,14 @@ async def export_settings():
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.post("/import")
-async def import_settings(settings_data: dict):
+async def import_settings(
+    settings_data: dict,
+    settings_service: SettingsService = Depends(get_settings_service),
+    owner: str = Depends(get_settings_owner)
+):
     """Import user settings"""
     try:
-        await SettingsService().import_settings(settings_data)
+        await settings_service.import_settings(settings_data, owner)
         return {"message": "Settings imported successfully"}
     except Exception as e:
         logger.error(f"Error importing settings: {e}", exc_info=True)
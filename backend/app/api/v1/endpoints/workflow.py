@@ -2,15 +2,21 @@
 Workflow API endpoints for n8n integration
 """
 
-from fastapi import APIRouter, HTTPException, Depends, BackgroundTasks
+from fastapi import APIRouter, HTTPException, Depends, Header, Query
+from pydantic import ValidationError
 from typing import List, Optional
 import logging
 
 from app.models.workflow import (
     Workflow, WorkflowUpdate, WorkflowTemplate, 
-    WorkflowStats, WorkflowExecution
+    WorkflowStats, WorkflowExecution, WorkflowPatchOperation, TemplateSearchResult
+)
+from app.core.etag import etag_matches, make_etag, not_modified
+from app.core.json_patch import JsonPatchError
+from app.core.responses import FastJSONResponse
+from app.services.workflow_service import (
+    WorkflowService, WorkflowNotFoundError, WorkflowVersionConflict, WorkflowHistoryError
 )
-from app.services.workflow_service import WorkflowService
 from app.services.n8n_service import N8nService
 
 router = APIRouter()
@@ -20,14 +26,148 @@ logger = logging.getLogger(__name__)
 workflow_service = WorkflowService()
 # n8n_service = N8nService()  # Remove global initialization
 
+def _version_etag(version: int) -> str:
+    """Build the ETag for a workflow version"""
+    return f'"{version}"'
+
+def _parse_if_match(if_match: Optional[str]) -> Optional[int]:
+    """Parse an If-Match header into the expected workflow version"""
+    if if_match is None or if_match.strip() == "*":
+        return None
+    value = if_match.strip()
+    if value.startswith("W/"):
+        value = value[2:]
+    try:
+        return int(value.strip('"'))
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Invalid If-Match header: {if_match}")
+
+# Expected outcomes of revision requests, answered with 4xx
+REVISION_ERRORS = (
+    WorkflowVersionConflict, WorkflowNotFoundError, WorkflowHistoryError, JsonPatchError, ValidationError
+)
+
+def _revision_error(e: Exception) -> HTTPException:
+    """Map one of REVISION_ERRORS to an HTTP error"""
+    if isinstance(e, WorkflowVersionConflict):
+        return HTTPException(
+            status_code=412, 
+            detail=str(e), 
+            headers={"ETag": _version_etag(e.current_version)}
+        )
+    if isinstance(e, WorkflowNotFoundError):
+        return HTTPException(status_code=404, detail=str(e))
+    if isinstance(e, WorkflowHistoryError):
+        return HTTPException(status_code=409, detail=str(e))
+    return HTTPException(status_code=422, detail=str(e))
+
+# Template routes are registered before /{workflow_id} so they are not shadowed by it
+@router.post("/templates", response_model=WorkflowTemplate)
+async def create_workflow_template(template: WorkflowTemplate):
+    """Create a new workflow template"""
+    try:
+        created_template = await workflow_service.create_template(template)
+        return created_template
+    except Exception as e:
+        logger.error(f"Error creating template: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/templates", response_model=List[WorkflowTemplate])
+async def get_workflow_templates(
+    category: Optional[str] = None,
+    limit: int = 50,
+    offset: int = 0
+):
+    """Get workflow templates"""
+    try:
+        templates = await workflow_service.get_templates(
+            category=category,
+            limit=limit,
+            offset=offset
+        )
+        return templates
+    except Exception as e:
+        logger.error(f"Error getting templates: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/templates/search", response_model=TemplateSearchResult)
+async def search_workflow_templates(
+    q: Optional[str] = None,
+    category: Optional[str] = None,
+    tag: Optional[List[str]] = Query(None),
+    node_type: Optional[List[str]] = Query(None),
+    limit: int = Query(50, ge=1, le=200),
+    cursor: Optional[str] = None
+):
+    """Search workflow templates by text, category, tags and node types"""
+    try:
+        return await workflow_service.search_templates(
+            query=q,
+            category=category,
+            tags=tag,
+            node_types=node_type,
+            limit=limit,
+            cursor=cursor
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error searching templates: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/templates/{template_id}", response_model=WorkflowTemplate)
+async def get_workflow_template(template_id: str):
+    """Get specific workflow template"""
+    try:
+        template = await workflow_service.get_template(template_id)
+        if not template:
+            raise HTTPException(status_code=404, detail="Template not found")
+        return template
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error getting template: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/templates/{template_id}/use")
+async def use_workflow_template(
+    template_id: str,
+    workflow_id: str
+):
+    """Use a workflow template"""
+    try:
+        result = await workflow_service.use_template(template_id, workflow_id)
+        return {
+            "message": "Template applied successfully",
+            "template_id": template_id,
+            "workflow_id": workflow_id,
+            "result": result
+        }
+    except Exception as e:
+        logger.error(f"Error using template: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.delete("/templates/{template_id}")
+async def delete_workflow_template(template_id: str):
+    """Delete workflow template"""
+    try:
+        await workflow_service.delete_template(template_id)
+        return {"message": "Template deleted successfully"}
+    except Exception as e:
+        logger.error(f"Error deleting template: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+
 @router.get("/{workflow_id}", response_model=Workflow)
-async def get_workflow(workflow_id: str):
+async def get_workflow(workflow_id: str, if_none_match: Optional[str] = Header(None)):
     """Get workflow by ID"""
     try:
         workflow = await workflow_service.get_workflow(workflow_id)
         if not workflow:
             raise HTTPException(status_code=404, detail="Workflow not found")
-        return workflow
+        etag = _version_etag(workflow.version)
+        if etag_matches(if_none_match, etag):
+            return not_modified(etag)
+        return FastJSONResponse(workflow, headers={"ETag": etag})
     except HTTPException:
         raise
     except Exception as e:
@@ -37,23 +177,113 @@ async def get_workflow(workflow_id: str):
 @router.put("/{workflow_id}", response_model=Workflow)
 async def update_workflow(
     workflow_id: str, 
-    workflow_update: WorkflowUpdate
+    workflow_update: WorkflowUpdate,
+    if_match: Optional[str] = Header(None)
 ):
     """Update workflow"""
     try:
         updated_workflow = await workflow_service.update_workflow(
-            workflow_id, workflow_update
+            workflow_id, workflow_update, _parse_if_match(if_match)
         )
-        return updated_workflow
+        return FastJSONResponse(updated_workflow, headers={"ETag": _version_etag(updated_workflow.version)})
+    except HTTPException:
+        raise
+    except REVISION_ERRORS as e:
+        logger.info(f"Workflow update rejected: {e}")
+        raise _revision_error(e)
     except Exception as e:
         logger.error(f"Error updating workflow: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
 
-@router.post("/{workflow_id}/apply")
-async def apply_workflow_to_n8n(
+@router.patch("/{workflow_id}", response_model=Workflow)
+async def patch_workflow(
+    workflow_id: str,
+    operations: List[WorkflowPatchOperation],
+    if_match: Optional[str] = Header(None)
+):
+    """Apply a JSON Patch (RFC 6902) to a workflow"""
+    try:
+        updated_workflow = await workflow_service.patch_workflow(
+            workflow_id,
+            [operation.to_operation() for operation in operations],
+            _parse_if_match(if_match)
+        )
+        return FastJSONResponse(updated_workflow, headers={"ETag": _version_etag(updated_workflow.version)})
+    except HTTPException:
+        raise
+    except REVISION_ERRORS as e:
+        logger.info(f"Workflow patch rejected: {e}")
+        raise _revision_error(e)
+    except Exception as e:
+        logger.error(f"Error patching workflow: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/{workflow_id}/undo", response_model=Workflow)
+async def undo_workflow(
     workflow_id: str,
-    background_tasks: BackgroundTasks
+    if_match: Optional[str] = Header(None)
 ):
+    """Revert the most recent workflow revision"""
+    try:
+        workflow = await workflow_service.undo_workflow(workflow_id, _parse_if_match(if_match))
+        return FastJSONResponse(workflow, headers={"ETag": _version_etag(workflow.version)})
+    except HTTPException:
+        raise
+    except REVISION_ERRORS as e:
+        logger.info(f"Workflow undo rejected: {e}")
+        raise _revision_error(e)
+    except Exception as e:
+        logger.error(f"Error undoing workflow revision: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/{workflow_id}/redo", response_model=Workflow)
+async def redo_workflow(
+    workflow_id: str,
+    if_match: Optional[str] = Header(None)
+):
+    """Re-apply the most recently undone workflow revision"""
+    try:
+        workflow = await workflow_service.redo_workflow(workflow_id, _parse_if_match(if_match))
+        return FastJSONResponse(workflow, headers={"ETag": _version_etag(workflow.version)})
+    except HTTPException:
+        raise
+    except REVISION_ERRORS as e:
+        logger.info(f"Workflow redo rejected: {e}")
+        raise _revision_error(e)
+    except Exception as e:
+        logger.error(f"Error redoing workflow revision: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/{workflow_id}/history")
+async def get_workflow_history(workflow_id: str):
+    """Get the undo/redo history of a workflow"""
+    try:
+        return await workflow_service.get_workflow_history(workflow_id)
+    except REVISION_ERRORS as e:
+        logger.info(f"Workflow history request rejected: {e}")
+        raise _revision_error(e)
+    except Exception as e:
+        logger.error(f"Error getting workflow history: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/{workflow_id}/canvas")
+async def get_workflow_canvas(workflow_id: str, layout: str = "auto"):
+    """Get workflow canvas data, optionally with an automatic layout"""
+    try:
+        canvas = await workflow_service.get_workflow_canvas(workflow_id, layout)
+        if not canvas:
+            raise HTTPException(status_code=404, detail="Workflow not found")
+        return canvas
+    except HTTPException:
+        raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error getting workflow canvas: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/{workflow_id}/apply")
+async def apply_workflow_to_n8n(workflow_id: str):
     """Apply workflow changes to n8n instance"""
     try:
         # Get workflow
@@ -67,13 +297,6 @@ async def apply_workflow_to_n8n(
         # Apply to n8n
         result = await n8n_service.apply_workflow(workflow)
         
-        # Update workflow in our system
-        background_tasks.add_task(
-            workflow_service.update_workflow_metadata,
-            workflow_id,
-            {"last_applied": "now"}
-        )
-        
         return {
             "message": "Workflow applied successfully",
             "workflow_id": workflow_id,
@@ -98,11 +321,15 @@ async def execute_workflow(workflow_id: str):
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/{workflow_id}/stats", response_model=WorkflowStats)
-async def get_workflow_stats(workflow_id: str):
+async def get_workflow_stats(workflow_id: str, if_none_match: Optional[str] = Header(None)):
     """Get workflow statistics"""
     try:
+        stamp = await workflow_service.get_workflow_stats_stamp(workflow_id)
+        etag = make_etag("stats", workflow_id, *stamp)
+        if etag_matches(if_none_match, etag):
+            return not_modified(etag)
         stats = await workflow_service.get_workflow_stats(workflow_id)
-        return stats
+        return FastJSONResponse(stats, headers={"ETag": etag})
     except Exception as e:
         logger.error(f"Error getting workflow stats: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
@@ -122,73 +349,3 @@ async def get_workflow_executions(
     except Exception as e:
         logger.error(f"Error getting workflow executions: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
-
-@router.post("/templates", response_model=WorkflowTemplate)
-async def create_workflow_template(template: WorkflowTemplate):
-    """Create a new workflow template"""
-    try:
-        created_template = await workflow_service.create_template(template)
-        return created_template
-    except Exception as e:
-        logger.error(f"Error creating template: {e}", exc_info=True)
-        raise HTTPException(status_code=500, detail=str(e))
-
-@router.get("/templates", response_model=List[WorkflowTemplate])
-async def get_workflow_templates(
-    category: Optional[str] = None,
-    limit: int = 50,
-    offset: int = 0
-):
-    """Get workflow templates"""
-    try:
-        templates = await workflow_service.get_templates(
-            category=category,
-            limit=limit,
-            offset=offset
-        )
-        return templates
-    except Exception as e:
-        logger.error(f"Error getting templates: {e}", exc_info=True)
-        raise HTTPException(status_code=500, detail=str(e))
-
-@router.get("/templates/{template_id}", response_model=WorkflowTemplate)
-async def get_workflow_template(template_id: str):
-    """Get specific workflow template"""
-    try:
-        template = await workflow_service.get_template(template_id)
-        if not template:
-            raise HTTPException(status_code=404, detail="Template not found")
-        return template
-    except HTTPException:
-        raise
-    except Exception as e:
-        logger.error(f"Error getting template: {e}", exc_info=True)
-        raise HTTPException(status_code=500, detail=str(e))
-
-@router.post("/templates/{template_id}/use")
-async def use_workflow_template(
-    template_id: str,
-    workflow_id: str
-):
-    """Use a workflow template"""
-    try:
-        result = await workflow_service.use_template(template_id, workflow_id)
-        return {
-            "message": "Template applied successfully",
-            "template_id": template_id,
-            "workflow_id": workflow_id,
-            "result": result
-        }
-    except Exception as e:
-        logger.error(f"Error using template: {e}", exc_info=True)
-        raise HTTPException(status_code=500, detail=str(e))
-
-@router.delete("/templates/{template_id}")
-async def delete_workflow_template(template_id: str):
-    """Delete workflow template"""
-    try:
-        await workflow_service.delete_template(template_id)
-        return {"message": "Template deleted successfully"}
-    except Exception as e:
-        logger.error(f"Error deleting template: {e}", exc_info=True)
-        raise HTTPException(status_code=500, detail=str(e))
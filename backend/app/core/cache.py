@@ -0,0 +1,258 @@
+"""
+Per-worker caches and cross-worker cache invalidation
+"""
+
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, Hashable, List, Optional, Set, Tuple
+from sqlalchemy import Column, DateTime, Integer, String, func, select, delete
+from .config import settings
+from .database import Base, SessionLocal, engine
+
+logger = logging.getLogger(__name__)
+
+# How long invalidation records are kept for slow pollers
+INVALIDATION_RETENTION = timedelta(hours=1)
+PRUNE_INTERVAL_SECONDS = 300
+
+# How long a skipped seq is polled for, in case its transaction commits
+# late; the number of such seqs tracked at once is bounded
+GAP_SECONDS = 60
+MAX_GAPS = 1000
+
+class LRUCache:
+    """Bounded least-recently-used cache"""
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self.data: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self.data)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self.data
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        try:
+            value = self.data[key]
+        except KeyError:
+            self.misses += 1
+            return default
+        self.data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: Hashable, value: Any):
+        self.data[key] = value
+        self.data.move_to_end(key)
+        while len(self.data) > self.maxsize:
+            self.data.popitem(last=False)
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        return self.data.pop(key, default)
+
+    def clear(self):
+        self.data.clear()
+
+    def stats(self) -> Dict[str, int]:
+        return {"size": len(self.data), "hits": self.hits, "misses": self.misses}
+
+class InvalidationRecord(Base):
+    """Change notice shared by all workers through the database"""
+    __tablename__ = "cache_invalidations"
+
+    seq = Column(Integer, primary_key=True, autoincrement=True)
+    namespace = Column(String(64), nullable=False, index=True)
+    key = Column(String(255), nullable=False)
+    version = Column(Integer, nullable=True)
+    created_at = Column(DateTime, server_default=func.now(), index=True)
+
+InvalidationListener = Callable[[str, Optional[int]], None]
+
+class InvalidationLog:
+    """Cross-worker invalidation through an append-only database table.
+
+    Writers append a (namespace, key, version) record in the same transaction
+    as their change. Every worker reads the records added since its last
+    refresh, at most once per poll interval, and notifies its local caches.
+    Reads between refreshes never touch the database.
+
+    Records older than INVALIDATION_RETENTION are pruned. A worker that did
+    not poll for longer may have missed some; when the records following
+    its last one are gone, every subscribed cache is reset instead.
+
+    Seqs are taken when a record is inserted, not when it commits, so with
+    concurrent writers (PostgreSQL) a lower seq can become visible after a
+    higher one was read. Seqs skipped over are kept as gaps and polled for
+    again for GAP_SECONDS; a gap that stays empty is a rolled back write.
+    """
+
+    def __init__(self, poll_interval: float, session_factory=SessionLocal):
+        self.poll_interval = poll_interval
+        self.session_factory = session_factory
+        self.listeners: Dict[str, List[InvalidationListener]] = {}
+        self.resets: List[Callable[[], None]] = []
+        self.published: Set[int] = set()
+        self.last_seq: Optional[int] = None
+        # Skipped seqs still polled for, with the time they were first skipped
+        self.gaps: Dict[int, float] = {}
+        self.next_poll = 0.0
+        self.next_prune = 0.0
+        self.schema_ready = False
+
+    def subscribe(
+        self,
+        namespace: str,
+        listener: InvalidationListener,
+        reset: Optional[Callable[[], None]] = None
+    ):
+        """Register a callback for changes in a namespace, and one to drop everything"""
+        self.listeners.setdefault(namespace, []).append(listener)
+        if reset is not None:
+            self.resets.append(reset)
+
+    def ensure_schema(self):
+        if not self.schema_ready:
+            Base.metadata.create_all(bind=engine, tables=[InvalidationRecord.__table__])
+            self.schema_ready = True
+
+    def publish(self, session, namespace: str, key: str, version: Optional[int] = None):
+        """Record a change; other workers see it once the session commits.
+
+        Call ensure_schema before the session starts its transaction.
+        """
+        record = InvalidationRecord(namespace=namespace, key=key, version=version)
+        session.add(record)
+        session.flush()
+        # This worker already updated its own caches
+        self.published.add(record.seq)
+
+    async def publish_async(self, session, namespace: str, key: str, version: Optional[int] = None):
+        """Record a change through an AsyncSession; see publish"""
+        record = InvalidationRecord(namespace=namespace, key=key, version=version)
+        session.add(record)
+        await session.flush()
+        self.published.add(record.seq)
+
+    async def refresh(self):
+        """Apply invalidations from other workers if the poll interval has passed"""
+        now = time.monotonic()
+        if now < self.next_poll:
+            return
+        self.next_poll = now + self.poll_interval
+
+        try:
+            rows = await asyncio.to_thread(self.fetch)
+        except Exception as e:
+            logger.error(f"Error polling cache invalidations: {e}", exc_info=True)
+            return
+        if rows is None:
+            logger.warning("Cache invalidations were pruned before this worker read them; resetting caches")
+            self._reset_all()
+        else:
+            self.dispatch(rows)
+        self._forget_published()
+
+    def fetch(self) -> Optional[List[Tuple[int, str, str, Optional[int]]]]:
+        """Read invalidation records added since the previous fetch.
+
+        Returns None when some of them may have been pruned already.
+        """
+        self.ensure_schema()
+
+        with self.session_factory() as session:
+            if self.last_seq is None:
+                # Start from the current end of the log; local caches are empty
+                self.last_seq = session.execute(
+                    select(func.coalesce(func.max(InvalidationRecord.seq), 0))
+                ).scalar_one()
+                return []
+
+            oldest, newest = session.execute(
+                select(func.min(InvalidationRecord.seq), func.max(InvalidationRecord.seq))
+            ).one()
+            if newest is None or oldest > self.last_seq + 1 or newest < self.last_seq:
+                # Records after last_seq were pruned, or the log was emptied
+                # and its numbering restarted
+                missed = self.last_seq > 0 or newest is not None
+                self.last_seq = newest if newest is not None else 0
+                self.gaps.clear()
+                return None if missed else []
+
+            start = min(self.gaps) - 1 if self.gaps else self.last_seq
+            rows = session.execute(
+                select(
+                    InvalidationRecord.seq,
+                    InvalidationRecord.namespace,
+                    InvalidationRecord.key,
+                    InvalidationRecord.version
+                )
+                .where(InvalidationRecord.seq > start)
+                .order_by(InvalidationRecord.seq)
+            ).all()
+            rows = [row for row in rows if row[0] > self.last_seq or row[0] in self.gaps]
+            self._advance(rows)
+
+            if time.monotonic() >= self.next_prune:
+                self.next_prune = time.monotonic() + PRUNE_INTERVAL_SECONDS
+                session.execute(
+                    delete(InvalidationRecord)
+                    .where(InvalidationRecord.created_at < datetime.utcnow() - INVALIDATION_RETENTION)
+                )
+                session.commit()
+
+        return rows
+
+    def _advance(self, rows: List[Tuple[int, str, str, Optional[int]]]):
+        """Move last_seq past the rows read, keeping the seqs skipped as gaps"""
+        now = time.monotonic()
+        expected = self.last_seq + 1
+        for row in rows:
+            seq = row[0]
+            if seq in self.gaps:
+                del self.gaps[seq]
+                continue
+            for missing in range(max(expected, seq - MAX_GAPS), seq):
+                self.gaps[missing] = now
+            expected = seq + 1
+            self.last_seq = seq
+
+        # Gaps are added in seq order, so the oldest come first
+        for seq, skipped in list(self.gaps.items()):
+            if len(self.gaps) <= MAX_GAPS and now - skipped < GAP_SECONDS:
+                break
+            del self.gaps[seq]
+
+    def dispatch(self, rows: List[Tuple[int, str, str, Optional[int]]]):
+        """Notify listeners about records written by other workers"""
+        for seq, namespace, key, version in rows:
+            if seq in self.published:
+                self.published.discard(seq)
+                continue
+            for listener in self.listeners.get(namespace, ()):
+                try:
+                    listener(key, version)
+                except Exception as e:
+                    logger.error(f"Invalidation listener for {namespace} failed: {e}", exc_info=True)
+
+    def _reset_all(self):
+        for reset in self.resets:
+            try:
+                reset()
+            except Exception as e:
+                logger.error(f"Cache reset failed: {e}", exc_info=True)
+
+    def _forget_published(self):
+        # Records at or below last_seq will not be read again, including
+        # those pruned before they were, unless they are still a gap
+        for seq in list(self.published):
+            if seq <= self.last_seq and seq not in self.gaps:
+                self.published.discard(seq)
+
+invalidation_log = InvalidationLog(settings.cache_invalidation_poll_seconds)
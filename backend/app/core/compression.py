@@ -0,0 +1,152 @@
+"""
+Response body codecs and Accept-Encoding negotiation
+"""
+
+import zlib
+from typing import Dict, List, Optional, Tuple
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - depends on the installation
+    zstandard = None
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - depends on the installation
+    brotli = None
+
+# Levels suited to dynamic responses; higher ones cost far more CPU for little gain
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 4
+ZSTD_LEVEL = 3
+
+# Accept-Encoding values remembered per worker; browsers send only a handful
+NEGOTIATION_CACHE_SIZE = 256
+
+class _ZlibStream:
+    def __init__(self):
+        self.compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+
+    def chunk(self, data: bytes) -> bytes:
+        # Sync flush so each chunk can be decoded on arrival
+        return self.compressor.compress(data) + self.compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        return self.compressor.flush()
+
+class GzipCodec:
+    name = "gzip"
+
+    def compress(self, data: bytes) -> bytes:
+        compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+        return compressor.compress(data) + compressor.flush()
+
+    def stream(self) -> _ZlibStream:
+        return _ZlibStream()
+
+class _BrotliStream:
+    def __init__(self):
+        self.compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+
+    def chunk(self, data: bytes) -> bytes:
+        return self.compressor.process(data) + self.compressor.flush()
+
+    def finish(self) -> bytes:
+        return self.compressor.finish()
+
+class BrotliCodec:
+    name = "br"
+
+    def compress(self, data: bytes) -> bytes:
+        return brotli.compress(data, quality=BROTLI_QUALITY)
+
+    def stream(self) -> _BrotliStream:
+        return _BrotliStream()
+
+class _ZstdStream:
+    def __init__(self):
+        # A compressor's context can't be shared by streams that interleave
+        self.compressor = zstandard.ZstdCompressor(level=ZSTD_LEVEL).compressobj()
+
+    def chunk(self, data: bytes) -> bytes:
+        return self.compressor.compress(data) + self.compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+    def finish(self) -> bytes:
+        return self.compressor.flush()
+
+class ZstdCodec:
+    name = "zstd"
+
+    def __init__(self):
+        # Reused for every whole-body response of this worker; compress()
+        # runs to completion on the event loop, so calls never overlap
+        self.compressor = zstandard.ZstdCompressor(level=ZSTD_LEVEL)
+
+    def compress(self, data: bytes) -> bytes:
+        return self.compressor.compress(data)
+
+    def stream(self) -> _ZstdStream:
+        return _ZstdStream()
+
+def available_codecs() -> List[object]:
+    """Installed codecs, most preferred first"""
+    codecs = []
+    if zstandard is not None:
+        codecs.append(ZstdCodec())
+    if brotli is not None:
+        codecs.append(BrotliCodec())
+    codecs.append(GzipCodec())
+    return codecs
+
+def parse_accept_encoding(header: str) -> List[Tuple[str, float]]:
+    """Parse an Accept-Encoding header into (coding, q) pairs"""
+    codings = []
+    for item in header.split(","):
+        coding, _, params = item.strip().partition(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        for param in params.split(";"):
+            name, _, value = param.strip().partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        codings.append((coding, q))
+    return codings
+
+class EncodingNegotiator:
+    """Picks the codec for an Accept-Encoding header.
+
+    The client's q-values decide; ties go to the server's preference order.
+    Results are cached since the same few headers repeat on every request.
+    """
+
+    def __init__(self, codecs: List[object]):
+        self.codecs = codecs
+        self.cache: Dict[str, Optional[object]] = {}
+
+    def select(self, accept_encoding: str) -> Optional[object]:
+        try:
+            return self.cache[accept_encoding]
+        except KeyError:
+            pass
+
+        codec = self._negotiate(accept_encoding)
+        if len(self.cache) >= NEGOTIATION_CACHE_SIZE:
+            self.cache.clear()
+        self.cache[accept_encoding] = codec
+        return codec
+
+    def _negotiate(self, accept_encoding: str) -> Optional[object]:
+        weights = dict(parse_accept_encoding(accept_encoding))
+        wildcard = weights.get("*", 0.0)
+
+        best, best_q = None, 0.0
+        for codec in self.codecs:
+            q = weights.get(codec.name, wildcard)
+            if q > best_q:
+                best, best_q = codec, q
+        return best
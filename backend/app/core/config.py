@@ -3,7 +3,7 @@ Configuration settings for n8n-copilot backend
 """
 
 from pydantic_settings import BaseSettings
-from typing import List, Optional
+from typing import Dict, List, Optional
 import os
 from pathlib import Path
 
@@ -28,14 +28,37 @@ class Settings(BaseSettings):
     ]
     allowed_hosts: List[str] = ["*"]
     
+    # Response compression
+    compression_enabled: bool = True  # zstd, brotli or gzip by Accept-Encoding
+    compression_minimum_size: int = 1024  # bytes; smaller bodies are sent as is
+    
     # Security
     secret_key: str = "your-secret-key-change-in-production"
     algorithm: str = "HS256"
     access_token_expire_minutes: int = 129600  # 90 days (3 months)
+    token_cache_size: int = 10000  # verified tokens kept per worker
+    token_cache_ttl_seconds: int = 300  # re-verify cached tokens at least this often
+    
+    # Password hashing
+    password_hash_workers: int = 2  # dedicated threads; bcrypt releases the GIL
+    password_hash_max_pending: int = 32  # queued hashes before auth requests get 503
+    password_hash_target_ms: int = 250  # bcrypt cost is calibrated to about this duration
+    password_hash_rounds: Optional[int] = None  # fixed bcrypt cost, skips calibration
     
     # Database
     database_url: Optional[str] = None
+    db_pool_size: int = 5  # async engine connections kept open per worker
+    db_max_overflow: int = 10  # extra connections allowed under load
+    db_pool_timeout: int = 30  # seconds to wait for a free connection
+    db_pool_recycle: int = 1800  # seconds before a connection is replaced
+    sqlite_wal: bool = True  # WAL journal, pooled readers and a single writer for file databases
+    sqlite_synchronous: str = "NORMAL"  # fsync at checkpoints only; safe with WAL
+    sqlite_busy_timeout_ms: int = 5000  # wait this long for another process's write lock
+    sqlite_mmap_size: int = 268435456  # bytes of the database file read through mmap
+    sqlite_cache_size_kb: Optional[int] = None  # page cache per connection, sized from RAM if unset
     redis_url: Optional[str] = "redis://localhost:6379"
+    redis_max_connections: int = 50  # connection pool size per worker
+    redis_key_prefix: str = "8pilot"  # namespace for keys and the invalidation channel
     
     # AI Providers - API keys stored in backend config
     openai_api_key: Optional[str] = None
@@ -50,13 +73,45 @@ class Settings(BaseSettings):
     max_chat_history: int = 100
     max_message_length: int = 4000
     chat_memory_ttl: int = 86400  # 24 hours in seconds
+    chat_storage: str = "memory"  # "memory" or "redis"
+    chat_cache_size: int = 2048  # sessions kept per worker when stored in Redis
+    chat_hot_messages: int = 16  # recent messages per session kept as objects
+    chat_segment_size: int = 32  # older messages are packed and compressed in groups of this size
+    chat_summarizer: Optional[str] = None  # "module:function" collapsing trimmed messages into a summary
+    chat_search: str = "auto"  # "memory", "database", "off", or "auto": memory with in-memory chats, else database
+    chat_search_max_candidates: int = 5000  # newest candidate messages the in-memory index examines per query
+    
+    # Workflow settings
+    workflow_history_limit: int = 50  # undo/redo revisions kept per workflow
+    workflow_storage: str = "database"  # "database", "redis" or "memory"
+    workflow_cache_size: int = 1024  # decoded workflows kept per worker
+    
+    # Settings storage
+    settings_storage: str = "database"  # "database", "redis" or "memory"
+    settings_cache_size: int = 4096  # users whose settings are kept per worker
+    
+    # Cache settings
+    cache_invalidation_poll_seconds: float = 1.0  # how often workers check for changes made elsewhere
     
     # Rate limiting
     rate_limit_per_minute: int = 60
     
     # Logging
     log_level: str = "INFO"
-    log_format: str = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+    log_format: str = "%(asctime)s - %(name)s - %(levelname)s - [%(request_id)s] %(message)s"
+    log_json: bool = False  # one JSON object per line instead of log_format
+    log_queue_size: int = 10000  # records waiting for the writer thread; more are dropped and counted
+    log_sample_rates: Dict[str, float] = {}  # fraction of DEBUG records kept per logger, e.g. {"app.services.chat_service": 0.01}
+    
+    # Metrics
+    metrics_enabled: bool = True  # per-route and hot-path histograms, served at /metrics
+    metrics_server_timing: bool = True  # phase timings in a Server-Timing response header
+    admin_emails: List[str] = []  # users allowed to use /admin; the admin API is off while empty
+    profiler_max_seconds: int = 60  # longest profile /admin/profile may take
+    loop_monitor_enabled: bool = True  # measure event loop lag and catch slow callbacks
+    loop_monitor_interval_ms: float = 10  # time between loop lag measurements
+    loop_slow_callback_ms: float = 100  # callbacks blocking the loop this long are recorded with their stacks
+    loop_monitor_report_seconds: int = 60  # how often the slowest callbacks are logged
     
     class Config:
         env_file = ".env"
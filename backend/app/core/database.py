@@ -1,7 +1,10 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import Session, sessionmaker
 from sqlalchemy.pool import StaticPool
+from sqlalchemy.sql.dml import UpdateBase
 from .config import settings
 import os
 
@@ -15,10 +18,117 @@ else:
     # Default to SQLite for development
     SQLALCHEMY_DATABASE_URL = "sqlite:///./app.db"
 
+IS_SQLITE = SQLALCHEMY_DATABASE_URL.startswith("sqlite")
+
+# WAL lets readers run alongside the writer; needs a database file
+SQLITE_WAL = IS_SQLITE and settings.sqlite_wal and ":memory:" not in SQLALCHEMY_DATABASE_URL
+
+# Page cache per SQLite connection when not configured: 1/512 of RAM, 8-64 MiB
+SQLITE_CACHE_FRACTION = 512
+SQLITE_CACHE_MIN_KB = 8 * 1024
+SQLITE_CACHE_MAX_KB = 64 * 1024
+
+def get_sqlite_cache_size_kb() -> int:
+    """SQLite page cache size per connection in KiB"""
+    if settings.sqlite_cache_size_kb:
+        return settings.sqlite_cache_size_kb
+    try:
+        ram_kb = os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES") // 1024
+    except (AttributeError, ValueError, OSError):
+        return SQLITE_CACHE_MIN_KB
+    return max(SQLITE_CACHE_MIN_KB, min(ram_kb // SQLITE_CACHE_FRACTION, SQLITE_CACHE_MAX_KB))
+
+def configure_sqlite_connection(dbapi_connection, read_only: bool):
+    """Apply the WAL profile pragmas to a new SQLite connection"""
+    pragmas = [
+        "journal_mode=WAL",
+        f"synchronous={settings.sqlite_synchronous}",
+        f"busy_timeout={settings.sqlite_busy_timeout_ms}",
+        f"mmap_size={settings.sqlite_mmap_size}",
+        # Negative values are in KiB rather than pages
+        f"cache_size=-{get_sqlite_cache_size_kb()}",
+        "temp_store=MEMORY",
+        "foreign_keys=ON",
+    ]
+    if read_only:
+        pragmas.append("query_only=ON")
+
+    cursor = dbapi_connection.cursor()
+    try:
+        for pragma in pragmas:
+            cursor.execute(f"PRAGMA {pragma}")
+    finally:
+        cursor.close()
+
+def _on_connect(sync_engine, read_only: bool):
+    event.listen(
+        sync_engine,
+        "connect",
+        lambda dbapi_connection, record: configure_sqlite_connection(dbapi_connection, read_only)
+    )
+
+class RoutingSession(Session):
+    """Session that reads through a connection pool and writes through a single writer.
+
+    Once a transaction has written, the rest of it also goes to the writer
+    so the session sees its own changes.
+    """
+
+    def __init__(self, reader=None, writer=None, **kwargs):
+        super().__init__(**kwargs)
+        self.reader = reader
+        self.writer = writer
+        self.writing = False
+
+    def get_bind(self, mapper=None, clause=None, **kwargs):
+        if self.writing or self._flushing or isinstance(clause, UpdateBase):
+            self.writing = True
+            return self.writer
+        return self.reader
+
+    def commit(self):
+        try:
+            super().commit()
+        finally:
+            self.writing = False
+
+    def rollback(self):
+        try:
+            super().rollback()
+        finally:
+            self.writing = False
+
+    def close(self):
+        try:
+            super().close()
+        finally:
+            self.writing = False
+
 # Create engine
-if SQLALCHEMY_DATABASE_URL.startswith("sqlite"):
-    # SQLite specific configuration
+if SQLITE_WAL:
+    # One pooled connection serializes writers in this process; other
+    # processes wait on busy_timeout
     engine = create_engine(
+        SQLALCHEMY_DATABASE_URL,
+        connect_args={"check_same_thread": False},
+        pool_size=1,
+        max_overflow=0,
+        pool_timeout=settings.db_pool_timeout,
+        echo=settings.debug
+    )
+    read_engine = create_engine(
+        SQLALCHEMY_DATABASE_URL,
+        connect_args={"check_same_thread": False},
+        pool_size=settings.db_pool_size,
+        max_overflow=settings.db_max_overflow,
+        pool_timeout=settings.db_pool_timeout,
+        echo=settings.debug
+    )
+    _on_connect(engine, read_only=False)
+    _on_connect(read_engine, read_only=True)
+elif IS_SQLITE:
+    # SQLite specific configuration
+    engine = read_engine = create_engine(
         SQLALCHEMY_DATABASE_URL,
         connect_args={"check_same_thread": False},
         poolclass=StaticPool,
@@ -26,14 +136,87 @@ if SQLALCHEMY_DATABASE_URL.startswith("sqlite"):
     )
 else:
     # PostgreSQL/other databases
-    engine = create_engine(
+    engine = read_engine = create_engine(
         SQLALCHEMY_DATABASE_URL,
         echo=settings.debug,
         pool_pre_ping=True
     )
 
 # Create SessionLocal class
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+if SQLITE_WAL:
+    SessionLocal = sessionmaker(
+        class_=RoutingSession, reader=read_engine, writer=engine,
+        autocommit=False, autoflush=False
+    )
+else:
+    SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+# Async drivers for the same database
+ASYNC_DRIVERS = {
+    "sqlite": "sqlite+aiosqlite",
+    "postgresql": "postgresql+asyncpg",
+    "postgres": "postgresql+asyncpg",
+}
+
+def get_async_database_url(url: str) -> str:
+    """Swap the sync driver of a database URL for its async counterpart"""
+    parsed = make_url(url)
+    backend = parsed.get_backend_name()
+    if parsed.get_driver_name() in ("aiosqlite", "asyncpg"):
+        return url
+    if backend not in ASYNC_DRIVERS:
+        raise ValueError(f"No async driver configured for {backend} databases")
+    return parsed.set(drivername=ASYNC_DRIVERS[backend]).render_as_string(hide_password=False)
+
+ASYNC_DATABASE_URL = get_async_database_url(SQLALCHEMY_DATABASE_URL)
+
+# Create async engine
+if SQLITE_WAL:
+    async_engine = create_async_engine(
+        ASYNC_DATABASE_URL,
+        pool_size=1,
+        max_overflow=0,
+        pool_timeout=settings.db_pool_timeout,
+        echo=settings.debug
+    )
+    async_read_engine = create_async_engine(
+        ASYNC_DATABASE_URL,
+        pool_size=settings.db_pool_size,
+        max_overflow=settings.db_max_overflow,
+        pool_timeout=settings.db_pool_timeout,
+        echo=settings.debug
+    )
+    _on_connect(async_engine.sync_engine, read_only=False)
+    _on_connect(async_read_engine.sync_engine, read_only=True)
+elif ":memory:" in ASYNC_DATABASE_URL:
+    # Every connection to an in-memory database is a separate database
+    async_engine = async_read_engine = create_async_engine(
+        ASYNC_DATABASE_URL,
+        poolclass=StaticPool,
+        echo=settings.debug
+    )
+else:
+    async_engine = async_read_engine = create_async_engine(
+        ASYNC_DATABASE_URL,
+        echo=settings.debug,
+        pool_size=settings.db_pool_size,
+        max_overflow=settings.db_max_overflow,
+        pool_timeout=settings.db_pool_timeout,
+        pool_recycle=settings.db_pool_recycle,
+        pool_pre_ping=not IS_SQLITE
+    )
+
+# Create AsyncSessionLocal class; objects stay usable after commit
+if SQLITE_WAL:
+    AsyncSessionLocal = async_sessionmaker(
+        class_=AsyncSession, sync_session_class=RoutingSession,
+        reader=async_read_engine.sync_engine, writer=async_engine.sync_engine,
+        autoflush=False, expire_on_commit=False
+    )
+else:
+    AsyncSessionLocal = async_sessionmaker(
+        async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False
+    )
 
 # Create Base class
 Base = declarative_base()
@@ -46,6 +229,11 @@ def get_db():
     finally:
         db.close()
 
+async def get_async_db():
+    """Dependency to get an async database session"""
+    async with AsyncSessionLocal() as db:
+        yield db
+
 def create_tables():
     """Create all tables in the database"""
     Base.metadata.create_all(bind=engine)
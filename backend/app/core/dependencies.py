@@ -1,51 +1,92 @@
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from sqlalchemy.orm import Session
 from typing import Optional
 
-from .database import get_db
+from .cache import invalidation_log
+from .config import settings
+from .database import AsyncSessionLocal
+from .token_cache import UserSnapshot, token_cache
+from ..services.settings_service import DEFAULT_USER_ID
 from ..services.user_service import UserService
-from ..models.user import User
 
 # Security scheme
 security = HTTPBearer()
 
-def get_current_user(
-    credentials: HTTPAuthorizationCredentials = Depends(security),
-    db: Session = Depends(get_db)
-):
+# Security scheme for endpoints that also serve anonymous requests
+optional_security = HTTPBearer(auto_error=False)
+
+async def get_current_user(
+    credentials: HTTPAuthorizationCredentials = Depends(security)
+) -> UserSnapshot:
     """Get current authenticated user from JWT token"""
     token = credentials.credentials
-    user_service = UserService(db)
     
-    payload = user_service.verify_token(token)
-    if payload is None:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Could not validate credentials",
-            headers={"WWW-Authenticate": "Bearer"},
-        )
+    # Previously verified tokens skip JWT decoding and the user lookup
+    await invalidation_log.refresh()
+    user = token_cache.get(token)
+    if user is None:
+        user = await _resolve_user(token)
+    return user
+
+async def _resolve_user(token: str) -> UserSnapshot:
+    """Verify a token, load its user and cache the result"""
+    async with AsyncSessionLocal() as db:
+        user_service = UserService(db)
+        
+        payload = user_service.verify_token(token)
+        if payload is None:
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Could not validate credentials",
+                headers={"WWW-Authenticate": "Bearer"},
+            )
+        
+        email: str = payload.get("sub")
+        user_id: int = payload.get("user_id")
+        
+        if email is None or user_id is None:
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Could not validate credentials",
+                headers={"WWW-Authenticate": "Bearer"},
+            )
+        
+        # Get user from database
+        snapshot = await user_service.get_user_snapshot(user_id)
+        if snapshot is None:
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="User not found",
+                headers={"WWW-Authenticate": "Bearer"},
+            )
     
-    email: str = payload.get("sub")
-    user_id: int = payload.get("user_id")
+    token_cache.put(token, snapshot, payload.get("exp"))
+    return snapshot
+
+async def get_optional_user_id(
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(optional_security)
+) -> Optional[int]:
+    """Get the user ID from a JWT token if one was sent, without a database lookup"""
+    if credentials is None:
+        return None
     
-    if email is None or user_id is None:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Could not validate credentials",
-            headers={"WWW-Authenticate": "Bearer"},
-        )
+    cached_user = token_cache.get(credentials.credentials)
+    if cached_user is not None:
+        return cached_user.id
     
-    # Get user from database
-    user = user_service.get_user_by_id(user_id)
-    if user is None:
+    payload = UserService(None).verify_token(credentials.credentials)
+    if payload is None or payload.get("user_id") is None:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="User not found",
+            detail="Could not validate credentials",
             headers={"WWW-Authenticate": "Bearer"},
         )
     
-    return user
+    return payload["user_id"]
+
+def get_settings_owner(user_id: Optional[int] = Depends(get_optional_user_id)) -> str:
+    """Settings belong to the authenticated user, or to the default profile"""
+    return str(user_id) if user_id is not None else DEFAULT_USER_ID
 
 def get_current_active_user(current_user = Depends(get_current_user)):
     """Get current active user"""
@@ -59,3 +100,13 @@ def get_current_admin_user(current_user = Depends(get_current_user)):
     """Get current admin user"""
     # For now, allow all authenticated users as admin since we removed roles
     return current_user
+
+def get_worker_admin_user(current_user = Depends(get_current_user)):
+    """Get current user if listed in ADMIN_EMAILS; guards the worker admin API"""
+    admins = {email.lower() for email in settings.admin_emails}
+    if current_user.email.lower() not in admins:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Admin access required"
+        )
+    return current_user
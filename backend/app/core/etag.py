@@ -0,0 +1,29 @@
+"""
+Entity tags and conditional GET handling
+"""
+
+import hashlib
+from typing import Any, Optional
+from fastapi import Response
+
+def make_etag(*parts: Any) -> str:
+    """Weak ETag for a representation identified by parts, e.g. an owner and a version stamp"""
+    digest = hashlib.blake2b("\x1f".join(map(str, parts)).encode(), digest_size=8).hexdigest()
+    return f'W/"{digest}"'
+
+def _opaque_tag(etag: str) -> str:
+    etag = etag.strip()
+    return etag[2:] if etag.startswith("W/") else etag
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Whether an If-None-Match header names the current ETag (weak comparison)"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    current = _opaque_tag(etag)
+    return any(_opaque_tag(candidate) == current for candidate in if_none_match.split(","))
+
+def not_modified(etag: str) -> Response:
+    """304 response telling the client its cached copy is current"""
+    return Response(status_code=304, headers={"ETag": etag})
@@ -0,0 +1,58 @@
+"""
+Immutable JSON containers for structure shared between workflows
+"""
+
+from typing import Any
+
+def _readonly(self, *args, **kwargs):
+    raise TypeError(f"{type(self).__name__} is immutable; copy it before modifying")
+
+class FrozenDict(dict):
+    """Read-only dict.
+
+    Still a dict for serialization and isinstance checks. ``dict(frozen)`` or
+    ``frozen.copy()`` returns a regular, mutable dict.
+    """
+    __slots__ = ()
+
+    __setitem__ = __delitem__ = __ior__ = _readonly
+    clear = pop = popitem = setdefault = update = _readonly
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def __reduce__(self):
+        return (type(self), (dict(self),))
+
+class FrozenList(list):
+    """Read-only list.
+
+    Still a list for serialization and isinstance checks. ``list(frozen)``
+    returns a regular, mutable list.
+    """
+    __slots__ = ()
+
+    __setitem__ = __delitem__ = __iadd__ = __imul__ = _readonly
+    append = extend = insert = pop = remove = clear = sort = reverse = _readonly
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def __reduce__(self):
+        return (type(self), (list(self),))
+
+def deep_freeze(value: Any) -> Any:
+    """Recursively convert dicts and lists into their frozen counterparts"""
+    if isinstance(value, (FrozenDict, FrozenList)):
+        return value
+    if isinstance(value, dict):
+        return FrozenDict((key, deep_freeze(item)) for key, item in value.items())
+    if isinstance(value, (list, tuple)):
+        return FrozenList(deep_freeze(item) for item in value)
+    return value
@@ -0,0 +1,166 @@
+"""
+Password hashing on a dedicated, bounded worker pool
+"""
+
+import asyncio
+import logging
+import math
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from passlib.context import CryptContext
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+# bcrypt cost bounds for calibration; every step doubles the hashing time
+MIN_BCRYPT_ROUNDS = 10
+MAX_BCRYPT_ROUNDS = 16
+CALIBRATION_ROUNDS = 8
+
+# Number of recent hashes kept for latency percentiles
+LATENCY_WINDOW = 1024
+
+class HashingOverloadedError(RuntimeError):
+    """Raised when too many password hashes are already waiting"""
+
+def _percentiles(samples: List[float]) -> Dict[str, Optional[float]]:
+    """p50/p95/max of samples in milliseconds"""
+    if not samples:
+        return {"p50": None, "p95": None, "max": None}
+    ordered = sorted(samples)
+    pick = lambda q: round(ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000, 2)
+    return {"p50": pick(0.5), "p95": pick(0.95), "max": round(ordered[-1] * 1000, 2)}
+
+class PasswordHasher:
+    """Runs bcrypt on its own thread pool instead of the request threadpool.
+
+    bcrypt releases the GIL, so a few dedicated threads hash in parallel
+    without competing with other blocking work. At most ``max_pending``
+    hashes may be queued or running; further requests are rejected with
+    HashingOverloadedError so a login storm sheds load instead of piling up.
+    The bcrypt cost is calibrated on first use to take about
+    ``target_seconds``, and hashes with a lower cost are flagged for rehashing.
+    """
+
+    def __init__(
+        self,
+        workers: int,
+        max_pending: int,
+        target_seconds: float,
+        rounds: Optional[int] = None
+    ):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.target_seconds = target_seconds
+        self.rounds = rounds
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="password-hash")
+        self.context: Optional[CryptContext] = None
+        self.pending = 0
+        self.completed = 0
+        self.rejected = 0
+        # (queue wait, hashing time) in seconds
+        self.latencies: "deque[Tuple[float, float]]" = deque(maxlen=LATENCY_WINDOW)
+        self.lock = threading.Lock()
+        self.context_lock = threading.Lock()
+
+    async def hash(self, password: str) -> str:
+        """Hash a password with the current cost"""
+        return await self._run(lambda context: context.hash(password))
+
+    async def verify(self, password: str, hashed_password: str) -> bool:
+        """Verify a password against its hash"""
+        return await self._run(lambda context: context.verify(password, hashed_password))
+
+    async def verify_and_update(self, password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+        """Verify a password and return a new hash if the stored one is below the current cost"""
+        return await self._run(lambda context: context.verify_and_update(password, hashed_password))
+
+    def stats(self) -> Dict[str, Any]:
+        """Queue state and hash latency over the recent window"""
+        samples = list(self.latencies)
+        return {
+            "rounds": self.rounds,
+            "workers": self.workers,
+            "pending": self.pending,
+            "max_pending": self.max_pending,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "hash_ms": _percentiles([run for _, run in samples]),
+            "queue_wait_ms": _percentiles([wait for wait, _ in samples])
+        }
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    async def _run(self, operation: Callable[[CryptContext], Any]) -> Any:
+        with self.lock:
+            if self.pending >= self.max_pending:
+                self.rejected += 1
+                raise HashingOverloadedError(
+                    f"{self.pending} password hashes pending, limit is {self.max_pending}"
+                )
+            self.pending += 1
+
+        submitted = time.perf_counter()
+
+        def timed():
+            started = time.perf_counter()
+            try:
+                return operation(self._get_context())
+            finally:
+                finished = time.perf_counter()
+                self.latencies.append((started - submitted, finished - started))
+                with self.lock:
+                    self.completed += 1
+
+        def done(future):
+            # Also runs for jobs cancelled before they started
+            with self.lock:
+                self.pending -= 1
+
+        future = self.executor.submit(timed)
+        future.add_done_callback(done)
+        return await asyncio.wrap_future(future)
+
+    def _get_context(self) -> CryptContext:
+        """Build the hashing context, calibrating the bcrypt cost on first use"""
+        if self.context is None:
+            # Only taken on pool threads, so calibrating never blocks the event loop
+            with self.context_lock:
+                if self.context is None:
+                    if self.rounds is None:
+                        self.rounds = self._calibrate()
+                    self.context = CryptContext(
+                        schemes=["bcrypt"],
+                        deprecated="auto",
+                        bcrypt__default_rounds=self.rounds,
+                        bcrypt__min_rounds=self.rounds
+                    )
+        return self.context
+
+    def _calibrate(self) -> int:
+        """Pick the bcrypt cost whose hashing time is closest to the target"""
+        probe = CryptContext(schemes=["bcrypt"], bcrypt__rounds=CALIBRATION_ROUNDS)
+        # The first hash also loads and self-tests the bcrypt backend
+        probe.hash("calibration-warm-up")
+        started = time.perf_counter()
+        probe.hash("calibration-probe")
+        elapsed = max(time.perf_counter() - started, 1e-6)
+
+        rounds = CALIBRATION_ROUNDS + round(math.log2(self.target_seconds / elapsed))
+        rounds = max(MIN_BCRYPT_ROUNDS, min(MAX_BCRYPT_ROUNDS, rounds))
+        logger.info(
+            f"Calibrated bcrypt cost to {rounds} rounds "
+            f"({elapsed * 1000:.1f} ms at {CALIBRATION_ROUNDS} rounds)"
+        )
+        return rounds
+
+password_hasher = PasswordHasher(
+    workers=settings.password_hash_workers,
+    max_pending=settings.password_hash_max_pending,
+    target_seconds=settings.password_hash_target_ms / 1000,
+    rounds=settings.password_hash_rounds
+)
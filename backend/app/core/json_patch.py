@@ -0,0 +1,251 @@
+"""
+JSON Patch (RFC 6902) over persistent, structurally shared documents
+"""
+
+from typing import Any, List, Tuple, Dict
+from pydantic import BaseModel
+
+class JsonPatchError(ValueError):
+    """Raised when a patch cannot be applied to a document"""
+
+_MISSING = object()
+
+def escape_token(token: str) -> str:
+    """Escape a single JSON Pointer reference token"""
+    return token.replace("~", "~0").replace("/", "~1")
+
+def parse_pointer(pointer: str) -> List[str]:
+    """Split a JSON Pointer (RFC 6901) into reference tokens"""
+    if pointer == "":
+        return []
+    if not pointer.startswith("/"):
+        raise JsonPatchError(f"Invalid JSON pointer: {pointer!r}")
+    return [
+        token.replace("~1", "/").replace("~0", "~")
+        for token in pointer[1:].split("/")
+    ]
+
+def build_pointer(tokens: List[Any]) -> str:
+    """Join reference tokens into a JSON Pointer"""
+    return "".join(f"/{escape_token(str(token))}" for token in tokens)
+
+def _list_index(container: list, token: str, allow_end: bool = False) -> int:
+    """Resolve a list reference token to an index"""
+    if allow_end and token == "-":
+        return len(container)
+    if not token.isdigit() or (len(token) > 1 and token.startswith("0")):
+        raise JsonPatchError(f"Invalid array index: {token!r}")
+    index = int(token)
+    limit = len(container) + 1 if allow_end else len(container)
+    if index >= limit:
+        raise JsonPatchError(f"Array index out of range: {index}")
+    return index
+
+def _get_child(container: Any, token: str) -> Any:
+    """Get a child value of a container"""
+    if isinstance(container, BaseModel):
+        if token not in type(container).model_fields:
+            raise JsonPatchError(f"Unknown field: {token!r}")
+        return getattr(container, token)
+    if isinstance(container, dict):
+        if token not in container:
+            raise JsonPatchError(f"Missing member: {token!r}")
+        return container[token]
+    if isinstance(container, list):
+        return container[_list_index(container, token)]
+    raise JsonPatchError(f"Cannot descend into {type(container).__name__} at {token!r}")
+
+def _with_child(container: Any, token: str, value: Any) -> Any:
+    """Return a shallow copy of a container with one child replaced"""
+    if isinstance(container, BaseModel):
+        return container.model_copy(update={token: value})
+    if isinstance(container, dict):
+        updated = dict(container)
+        updated[token] = value
+        return updated
+    if isinstance(container, list):
+        updated = list(container)
+        updated[_list_index(container, token)] = value
+        return updated
+    raise JsonPatchError(f"Cannot update {type(container).__name__} at {token!r}")
+
+def resolve(document: Any, pointer: str) -> Any:
+    """Get the value a JSON Pointer refers to"""
+    value = document
+    for token in parse_pointer(pointer):
+        value = _get_child(value, token)
+    return value
+
+def _update_in(document: Any, tokens: List[str], update) -> Tuple[Any, Any]:
+    """Path-copy the containers leading to tokens[:-1] and apply update to the parent.
+
+    Only the containers along the path are copied; every untouched subtree is
+    shared with the previous revision of the document.
+    """
+    if len(tokens) == 1:
+        return update(document, tokens[0])
+    child = _get_child(document, tokens[0])
+    new_child, result = _update_in(child, tokens[1:], update)
+    return _with_child(document, tokens[0], new_child), result
+
+def _add(document: Any, path: str, value: Any) -> Tuple[Any, List[Dict[str, Any]]]:
+    tokens = parse_pointer(path)
+    if not tokens:
+        return value, [{"op": "replace", "path": "", "value": document}]
+
+    def update(parent, token):
+        if isinstance(parent, list):
+            index = _list_index(parent, token, allow_end=True)
+            updated = list(parent)
+            updated.insert(index, value)
+            inverse_path = build_pointer(tokens[:-1] + [index])
+            return updated, [{"op": "remove", "path": inverse_path}]
+        if isinstance(parent, BaseModel):
+            old = _get_child(parent, token)
+            return _with_child(parent, token, value), [{"op": "replace", "path": path, "value": old}]
+        if isinstance(parent, dict):
+            old = parent.get(token, _MISSING)
+            inverse = (
+                {"op": "remove", "path": path} if old is _MISSING
+                else {"op": "replace", "path": path, "value": old}
+            )
+            return _with_child(parent, token, value), [inverse]
+        raise JsonPatchError(f"Cannot add to {type(parent).__name__} at {path!r}")
+
+    return _update_in(document, tokens, update)
+
+def _remove(document: Any, path: str) -> Tuple[Any, List[Dict[str, Any]]]:
+    tokens = parse_pointer(path)
+    if not tokens:
+        raise JsonPatchError("Cannot remove the document root")
+
+    def update(parent, token):
+        old = _get_child(parent, token)
+        if isinstance(parent, list):
+            updated = list(parent)
+            del updated[_list_index(parent, token)]
+        elif isinstance(parent, dict):
+            updated = dict(parent)
+            del updated[token]
+        else:
+            raise JsonPatchError(f"Cannot remove field {token!r}")
+        return updated, [{"op": "add", "path": path, "value": old}]
+
+    return _update_in(document, tokens, update)
+
+def _replace(document: Any, path: str, value: Any) -> Tuple[Any, List[Dict[str, Any]]]:
+    tokens = parse_pointer(path)
+    if not tokens:
+        return value, [{"op": "replace", "path": "", "value": document}]
+
+    def update(parent, token):
+        old = _get_child(parent, token)
+        return _with_child(parent, token, value), [{"op": "replace", "path": path, "value": old}]
+
+    return _update_in(document, tokens, update)
+
+def _plain(value: Any) -> Any:
+    """Convert models to plain JSON-compatible values for comparison"""
+    if isinstance(value, BaseModel):
+        return value.model_dump(mode="json")
+    if isinstance(value, dict):
+        return {key: _plain(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_plain(item) for item in value]
+    return value
+
+def _apply_operation(document: Any, operation: Dict[str, Any]) -> Tuple[Any, List[Dict[str, Any]]]:
+    """Apply a single operation, returning the new document and its inverse operations"""
+    op = operation.get("op")
+    path = operation.get("path")
+    if not isinstance(path, str):
+        raise JsonPatchError(f"Operation {op!r} is missing 'path'")
+
+    if op in ("add", "replace", "test") and "value" not in operation:
+        raise JsonPatchError(f"Operation {op!r} is missing 'value'")
+
+    if op == "add":
+        return _add(document, path, operation["value"])
+    if op == "remove":
+        return _remove(document, path)
+    if op == "replace":
+        return _replace(document, path, operation["value"])
+    if op == "test":
+        if _plain(resolve(document, path)) != _plain(operation["value"]):
+            raise JsonPatchError(f"Test failed at {path!r}")
+        return document, []
+    if op in ("move", "copy"):
+        source = operation.get("from")
+        if not isinstance(source, str):
+            raise JsonPatchError(f"Operation {op!r} is missing 'from'")
+        value = resolve(document, source)
+        if op == "copy":
+            return _add(document, path, value)
+        if path == source:
+            return document, []
+        if path.startswith(source + "/"):
+            raise JsonPatchError(f"Cannot move {source!r} into its own child {path!r}")
+        document, removed = _remove(document, source)
+        document, added = _add(document, path, value)
+        return document, added + removed
+    raise JsonPatchError(f"Unsupported operation: {op!r}")
+
+def apply_patch(
+    document: Any,
+    operations: List[Dict[str, Any]]
+) -> Tuple[Any, List[Dict[str, Any]]]:
+    """Apply a JSON Patch without mutating the input document.
+
+    Returns the patched document and the inverse patch that restores the
+    original. Both share all untouched structure with the input.
+    """
+    inverse: List[Dict[str, Any]] = []
+    for operation in operations:
+        document, undo = _apply_operation(document, operation)
+        inverse[:0] = undo
+    return document, inverse
+
+def make_patch(old: Any, new: Any, path: str = "") -> List[Dict[str, Any]]:
+    """Compute a patch transforming old into new.
+
+    Subtrees that are the same object are skipped without comparison, so
+    diffing two revisions that share structure is proportional to the change.
+    """
+    if old is new:
+        return []
+
+    if isinstance(old, BaseModel) and type(old) is type(new):
+        operations = []
+        for field in type(old).model_fields:
+            operations.extend(make_patch(
+                getattr(old, field), getattr(new, field), f"{path}/{escape_token(field)}"
+            ))
+        return operations
+
+    if isinstance(old, dict) and isinstance(new, dict):
+        operations = []
+        for key in old:
+            if key not in new:
+                operations.append({"op": "remove", "path": f"{path}/{escape_token(key)}"})
+        for key, value in new.items():
+            child = f"{path}/{escape_token(key)}"
+            if key in old:
+                operations.extend(make_patch(old[key], value, child))
+            else:
+                operations.append({"op": "add", "path": child, "value": value})
+        return operations
+
+    if isinstance(old, list) and isinstance(new, list):
+        operations = []
+        common = min(len(old), len(new))
+        for index in range(common):
+            operations.extend(make_patch(old[index], new[index], f"{path}/{index}"))
+        for index in range(len(old) - 1, common - 1, -1):
+            operations.append({"op": "remove", "path": f"{path}/{index}"})
+        for index in range(common, len(new)):
+            operations.append({"op": "add", "path": f"{path}/{index}", "value": new[index]})
+        return operations
+
+    if old == new and type(old) is type(new):
+        return []
+    return [{"op": "replace", "path": path, "value": new}]
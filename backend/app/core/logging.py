@@ -2,40 +2,238 @@
 Logging configuration for n8n-copilot backend
 """
 
+import atexit
+import json
 import logging
-import sys
-from logging.handlers import RotatingFileHandler
 import os
+import queue
+import random
+import socket
+import sys
+from collections import Counter
+from contextvars import ContextVar
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from typing import Dict, Optional
 from app.core.config import settings
+from app.core.metrics import metrics
+
+# ID of the request being handled, added to every record logged for it
+request_id_var: ContextVar[Optional[str]] = ContextVar("request_id", default=None)
+
+class RequestIdFilter(logging.Filter):
+    """Adds the current request ID to records as ``request_id``"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = request_id_var.get() or "-"
+        return True
+
+class SamplingFilter(logging.Filter):
+    """Keeps a fraction of DEBUG records from chatty loggers.
+
+    Rates are configured per logger name and apply to its children too;
+    records at INFO and above always pass.
+    """
+
+    def __init__(self, rates: Dict[str, float]):
+        super().__init__()
+        self.rates = rates
+        self.resolved: Dict[str, float] = {}
+
+    def rate(self, name: str) -> float:
+        rate = self.resolved.get(name)
+        if rate is None:
+            rate = 1.0
+            prefix = name
+            while prefix:
+                if prefix in self.rates:
+                    rate = self.rates[prefix]
+                    break
+                prefix = prefix.rpartition(".")[0]
+            self.resolved[name] = rate
+        return rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno > logging.DEBUG or not self.rates:
+            return True
+        rate = self.rate(record.name)
+        return rate >= 1.0 or random.random() < rate
+
+class DroppingQueueHandler(QueueHandler):
+    """QueueHandler over a bounded queue that drops records when it is full.
+
+    Logging call sites never wait for the writer thread: when the queue is
+    full the record is dropped and counted per level, and a warning with
+    the count is queued as soon as there is room again.
+    """
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        # Handler.handle holds self.lock around emit, which guards these too
+        self.dropped: Counter = Counter()
+        self.unreported = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Only the message and traceback are rendered here; the listener's
+        # handlers format the rest on the writer thread
+        message = record.getMessage()
+        if record.exc_info and not record.exc_text:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        record = logging.makeLogRecord(record.__dict__)
+        record.message = message
+        record.msg = message
+        record.args = None
+        record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            if self.unreported:
+                self._report_drops()
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped[record.levelname] += 1
+            self.unreported += 1
+
+    def _report_drops(self):
+        count, self.unreported = self.unreported, 0
+        warning = logging.makeLogRecord({
+            "name": __name__,
+            "levelno": logging.WARNING,
+            "levelname": "WARNING",
+            "msg": f"Dropped {count} log records while the log queue was full",
+            "request_id": "-"
+        })
+        try:
+            self.queue.put_nowait(warning)
+        except queue.Full:
+            self.unreported += count
+            raise
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record.
+
+    Fields that are the same for every record (service, host, process) are
+    serialized once, and the timestamp prefix is reused within a second.
+    """
+
+    def __init__(self, static_fields: Optional[Dict[str, object]] = None):
+        super().__init__()
+        static_fields = static_fields or {}
+        self.static_json = json.dumps(static_fields, ensure_ascii=False)[1:-1] if static_fields else ""
+        self.cached_second: Optional[int] = None
+        self.cached_time = ""
+
+    def timestamp(self, record: logging.LogRecord) -> str:
+        second = int(record.created)
+        if second != self.cached_second:
+            self.cached_second = second
+            self.cached_time = self.formatTime(record, "%Y-%m-%dT%H:%M:%S")
+        return f"{self.cached_time}.{int(record.msecs):03d}"
+
+    def format(self, record: logging.LogRecord) -> str:
+        fields = {
+            "time": self.timestamp(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "request_id": getattr(record, "request_id", "-")
+        }
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            fields["exception"] = record.exc_text
+        document = json.dumps(fields, ensure_ascii=False)
+        if self.static_json:
+            document = f"{document[:-1]}, {self.static_json}}}"
+        return document
+
+class _QueueListener(QueueListener):
+    def enqueue_sentinel(self):
+        # The queue may be full; the listener thread is draining it
+        self.queue.put(self._sentinel)
+
+_listener: Optional[QueueListener] = None
+queue_handler: Optional[DroppingQueueHandler] = None
+
+def _dropped_records() -> Dict[tuple, float]:
+    if queue_handler is None:
+        return {}
+    return {(level,): count for level, count in queue_handler.dropped.items()}
+
+metrics.callback(
+    "log_records_dropped_total",
+    "Log records dropped because the log queue was full",
+    ["level"],
+    "counter",
+    _dropped_records
+)
 
 def setup_logging():
-    """Setup logging configuration"""
-    
+    """Setup logging configuration.
+
+    Records are put on a bounded queue by the root logger's only handler
+    and written to the console and the rotating log file by a listener
+    thread, so logging in the request path does no I/O on the event loop.
+    """
+    global _listener, queue_handler
+
     # Create logs directory if it doesn't exist
     os.makedirs("logs", exist_ok=True)
-    
+
+    if settings.log_json:
+        formatter = JsonFormatter({
+            "service": "8pilot-backend",
+            "host": socket.gethostname(),
+            "pid": os.getpid()
+        })
+    else:
+        formatter = logging.Formatter(settings.log_format)
+
+    # Console handler
+    console_handler = logging.StreamHandler(sys.stdout)
+    # File handler with rotation
+    file_handler = RotatingFileHandler(
+        "logs/app.log",
+        maxBytes=10*1024*1024,  # 10MB
+        backupCount=5
+    )
+    for handler in (console_handler, file_handler):
+        handler.setFormatter(formatter)
+
+    shutdown_logging()
+    log_queue = queue.Queue(maxsize=settings.log_queue_size)
+    queue_handler = DroppingQueueHandler(log_queue)
+    # Sampled-out records are dropped before anything else is done with them
+    if settings.log_sample_rates:
+        queue_handler.addFilter(SamplingFilter(settings.log_sample_rates))
+    queue_handler.addFilter(RequestIdFilter())
+    _listener = _QueueListener(log_queue, console_handler, file_handler, respect_handler_level=True)
+    _listener.start()
+
+    atexit.register(shutdown_logging)
+
     # Configure root logger
     logging.basicConfig(
         level=getattr(logging, settings.log_level.upper()),
-        format=settings.log_format,
-        handlers=[
-            # Console handler
-            logging.StreamHandler(sys.stdout),
-            # File handler with rotation
-            RotatingFileHandler(
-                "logs/app.log",
-                maxBytes=10*1024*1024,  # 10MB
-                backupCount=5
-            )
-        ]
+        handlers=[queue_handler],
+        force=True
     )
-    
+
     # Set specific logger levels
     logging.getLogger("uvicorn").setLevel(logging.INFO)
     logging.getLogger("uvicorn.access").setLevel(logging.WARNING)
-    
+
     # Log startup message
     logger = logging.getLogger(__name__)
     logger.info("Logging configured successfully")
     logger.info(f"Log level: {settings.log_level}")
     logger.info(f"Debug mode: {settings.debug}")
+
+def shutdown_logging():
+    """Write out queued records and stop the listener thread"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+        _listener = None
@@ -0,0 +1,215 @@
+"""
+Event loop lag monitor and slow callback detector
+"""
+
+import asyncio
+import logging
+import sys
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, List, Optional, Tuple
+from .config import settings
+from .metrics import metrics
+from .profiler import FrameNames, current_task_name, lag_percentiles, loop_base_frames, stack_names
+
+logger = logging.getLogger(__name__)
+
+LAG_BUCKETS = (
+    0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+    0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0
+)
+
+LOOP_LAG_SECONDS = metrics.histogram(
+    "event_loop_lag_seconds",
+    "How late the event loop ran a timer that was due",
+    buckets=LAG_BUCKETS
+)
+SLOW_CALLBACKS = metrics.counter(
+    "event_loop_slow_callbacks_total",
+    "Times a callback kept the event loop busy longer than the slow callback threshold"
+)
+BLOCKED_SECONDS = metrics.counter(
+    "event_loop_blocked_seconds_total",
+    "Time the event loop spent in callbacks longer than the slow callback threshold"
+)
+
+# Recent lag samples kept for percentiles in stats()
+LAG_WINDOW = 4096
+
+# Distinct slow callback stacks kept; the least costly is dropped beyond this
+MAX_OFFENDERS = 100
+
+# Frames of an offender's stack shown in log lines, innermost last
+LOGGED_FRAMES = 4
+
+class _Offender:
+    """Slow callbacks seen with the same task and stack"""
+
+    __slots__ = ("task", "stack", "count", "total", "max", "last_seen")
+
+    def __init__(self, task: Optional[str], stack: Tuple[str, ...]):
+        self.task = task
+        self.stack = stack
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.last_seen = 0.0
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "task": self.task,
+            "count": self.count,
+            "total_ms": round(self.total * 1000, 1),
+            "max_ms": round(self.max * 1000, 1),
+            "last_seen": self.last_seen,
+            "stack": list(self.stack)
+        }
+
+class LoopMonitor:
+    """Measures event loop lag and catches the callbacks that cause it.
+
+    A heartbeat coroutine sleeps ``interval`` seconds at a time and
+    records how late it wakes up in the lag histogram. A watchdog thread
+    checks the heartbeat; when it is overdue by more than ``threshold``
+    the loop is stuck in one callback, so the watchdog takes the loop
+    thread's stack and the running task at that moment. When the
+    heartbeat resumes, the stall is counted against that stack, and the
+    costliest stacks are logged every ``report_seconds``.
+    """
+
+    def __init__(self, interval: float, threshold: float, report_seconds: float):
+        self.interval = interval
+        self.threshold = threshold
+        self.report_seconds = report_seconds
+        self.lag: deque = deque(maxlen=LAG_WINDOW)
+        self.offenders: Dict[Tuple[Optional[str], Tuple[str, ...]], _Offender] = {}
+        self.stalls_since_report = 0
+        self.frame_names = FrameNames()
+        self.heartbeat = 0.0
+        self.task: Optional[asyncio.Task] = None
+        self.thread: Optional[threading.Thread] = None
+        self.stop_event = threading.Event()
+        self.lock = threading.Lock()
+
+    def start(self):
+        """Start monitoring the running loop; call from a coroutine on it"""
+        if self.task is not None:
+            return
+        loop = asyncio.get_running_loop()
+        self.heartbeat = time.perf_counter()
+        self.stop_event.clear()
+        self.task = loop.create_task(self._beat(loop), name="loop-monitor")
+        self.thread = threading.Thread(
+            target=self._watch,
+            args=(loop, threading.get_ident(), loop_base_frames()),
+            name="loop-monitor",
+            daemon=True
+        )
+        self.thread.start()
+        logger.info(
+            f"Event loop monitor started: lag every {self.interval * 1000:g}ms, "
+            f"slow callbacks over {self.threshold * 1000:g}ms"
+        )
+
+    async def stop(self):
+        """Stop the heartbeat and the watchdog, and log what is left to report"""
+        if self.task is None:
+            return
+        self.task.cancel()
+        try:
+            await self.task
+        except asyncio.CancelledError:
+            pass
+        self.task = None
+        self.stop_event.set()
+        self.thread.join()
+        self.thread = None
+        self._report()
+
+    async def _beat(self, loop: asyncio.AbstractEventLoop):
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, loop.time() - expected)
+            self.heartbeat = time.perf_counter()
+            self.lag.append(lag)
+            LOOP_LAG_SECONDS.observe(lag)
+
+    def _watch(self, loop: asyncio.AbstractEventLoop, loop_thread: int, base_frames: List[Any]):
+        # Checked often enough to catch a stall while it lasts
+        check = min(self.interval, self.threshold / 4)
+        next_report = time.perf_counter() + self.report_seconds
+        stall: Optional[Tuple[float, Optional[str], Tuple[str, ...]]] = None
+        while not self.stop_event.wait(check):
+            now = time.perf_counter()
+            heartbeat = self.heartbeat
+            if stall is not None and heartbeat != stall[0]:
+                # The loop is running again; the stall lasted until this beat
+                self._record(stall[1], stall[2], heartbeat - stall[0] - self.interval)
+                stall = None
+            if stall is None and now - heartbeat > self.interval + self.threshold:
+                frame = sys._current_frames().get(loop_thread)
+                if frame is not None:
+                    stack = tuple(stack_names(frame, self.frame_names, base_frames))
+                    stall = (heartbeat, current_task_name(loop), stack)
+                del frame
+            if now >= next_report:
+                self._report()
+                next_report = now + self.report_seconds
+
+    def _record(self, task: Optional[str], stack: Tuple[str, ...], duration: float):
+        SLOW_CALLBACKS.inc()
+        BLOCKED_SECONDS.inc(duration)
+        with self.lock:
+            key = (task, stack)
+            offender = self.offenders.get(key)
+            if offender is None:
+                if len(self.offenders) >= MAX_OFFENDERS:
+                    cheapest = min(self.offenders, key=lambda k: self.offenders[k].total)
+                    del self.offenders[cheapest]
+                offender = self.offenders[key] = _Offender(task, stack)
+            offender.count += 1
+            offender.total += duration
+            offender.max = max(offender.max, duration)
+            offender.last_seen = time.time()
+            self.stalls_since_report += 1
+
+    def top_offenders(self, limit: int = 10) -> List[Dict[str, Any]]:
+        """Slow callback stacks that blocked the loop the longest in total"""
+        with self.lock:
+            offenders = sorted(self.offenders.values(), key=lambda offender: offender.total, reverse=True)
+            return [offender.as_dict() for offender in offenders[:limit]]
+
+    def _report(self):
+        with self.lock:
+            stalls, self.stalls_since_report = self.stalls_since_report, 0
+        if not stalls:
+            return
+        lines = []
+        for offender in self.top_offenders(5):
+            frames = " > ".join(offender["stack"][-LOGGED_FRAMES:]) or "no Python frames"
+            lines.append(
+                f"  {offender['count']}x, max {offender['max_ms']}ms, total {offender['total_ms']}ms"
+                f" in task {offender['task'] or '-'}: {frames}"
+            )
+        logger.warning(
+            f"Event loop blocked over {self.threshold * 1000:g}ms {stalls} times "
+            f"since the last report; top offenders:\n" + "\n".join(lines)
+        )
+
+    def stats(self) -> Dict[str, Any]:
+        """Recent lag percentiles and the top slow callback stacks"""
+        return {
+            "running": self.task is not None,
+            "interval_ms": self.interval * 1000,
+            "slow_callback_ms": self.threshold * 1000,
+            "lag_ms": lag_percentiles(list(self.lag)),
+            "offenders": self.top_offenders()
+        }
+
+loop_monitor = LoopMonitor(
+    settings.loop_monitor_interval_ms / 1000,
+    settings.loop_slow_callback_ms / 1000,
+    settings.loop_monitor_report_seconds
+)
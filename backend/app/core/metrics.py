@@ -0,0 +1,376 @@
+"""
+Counters and histograms collected in each worker, exposed in Prometheus format
+"""
+
+import abc
+import functools
+import inspect
+import math
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+# Time spent per phase in the request being handled, reported in its
+# Server-Timing header; None outside requests
+request_timings_var: ContextVar[Optional[Dict[str, float]]] = ContextVar("request_timings", default=None)
+
+# Seconds; from a fast dictionary lookup to a slow provider response
+LATENCY_BUCKETS = (
+    0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005,
+    0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0
+)
+
+RATE_BUCKETS = (1, 5, 10, 20, 40, 60, 80, 100, 150, 200, 300, 500)
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+class _Sharded:
+    """Values written by one thread at a time each, summed when read.
+
+    Every thread updates its own list, so updates need no lock and are
+    not lost when the threadpool and the event loop update the same
+    series; only creating a thread's list takes the lock.
+    """
+
+    __slots__ = ("shards", "size", "lock")
+
+    def __init__(self, size: int):
+        self.shards: Dict[int, List[float]] = {}
+        self.size = size
+        self.lock = threading.Lock()
+
+    def shard(self) -> List[float]:
+        shard = self.shards.get(threading.get_ident())
+        if shard is None:
+            with self.lock:
+                shard = self.shards.setdefault(threading.get_ident(), [0] * self.size)
+        return shard
+
+    def totals(self) -> List[float]:
+        totals = [0] * self.size
+        for shard in list(self.shards.values()):
+            for index, value in enumerate(shard):
+                totals[index] += value
+        return totals
+
+class CounterChild(_Sharded):
+    """One labelled series of a counter"""
+
+    __slots__ = ()
+
+    def __init__(self):
+        super().__init__(1)
+
+    def inc(self, amount: float = 1):
+        self.shard()[0] += amount
+
+    def value(self) -> float:
+        return self.totals()[0]
+
+class HistogramChild(_Sharded):
+    """One labelled series of a histogram: bucket counts, then sum"""
+
+    __slots__ = ("bounds", "timing_name")
+
+    def __init__(self, bounds: Tuple[float, ...], timing_name: Optional[str]):
+        super().__init__(len(bounds) + 2)
+        self.bounds = bounds
+        self.timing_name = timing_name
+
+    def observe(self, value: float):
+        shard = self.shard()
+        shard[bisect_left(self.bounds, value)] += 1
+        shard[-1] += value
+        if self.timing_name is not None:
+            timings = request_timings_var.get()
+            if timings is not None:
+                timings[self.timing_name] = timings.get(self.timing_name, 0.0) + value
+
+    def time(self) -> "Span":
+        """Context manager observing the time spent in its block"""
+        return Span(self)
+
+class Span:
+    """Times a block into a histogram series"""
+
+    __slots__ = ("series", "started")
+
+    def __init__(self, series: HistogramChild):
+        self.series = series
+
+    def __enter__(self) -> "Span":
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.series.observe(time.perf_counter() - self.started)
+
+class _Metric(abc.ABC):
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+
+    def _label_text(self, values: Tuple[str, ...], extra: Iterable[Tuple[str, str]] = ()) -> str:
+        pairs = [*zip(self.labelnames, values), *extra]
+        if not pairs:
+            return ""
+        return "{" + ",".join(f'{name}="{_escape(str(value))}"' for name, value in pairs) + "}"
+
+    def _header(self) -> List[str]:
+        return [f"# HELP {self.name} {_escape(self.documentation)}", f"# TYPE {self.name} {self.kind}"]
+
+    @abc.abstractmethod
+    def render(self, worker_label: Tuple[str, str]) -> List[str]:
+        """Exposition lines of every series, labelled with the worker"""
+
+class _SeriesMetric(_Metric):
+    """Metric whose series are updated in process and kept per label values"""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self.children: Dict[Tuple[str, ...], object] = {}
+        self.lock = threading.Lock()
+
+    def labels(self, *values: str):
+        """Series for these label values, created on first use"""
+        child = self.children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} takes labels {self.labelnames}, got {values}")
+            with self.lock:
+                child = self.children.get(values)
+                if child is None:
+                    child = self.children[values] = self._new_child(values)
+        return child
+
+    @abc.abstractmethod
+    def _new_child(self, values: Tuple[str, ...]):
+        """Empty series for these label values"""
+
+    @abc.abstractmethod
+    def _render_child(self, values: Tuple[str, ...], child, worker_label: Tuple[str, str]) -> List[str]:
+        """Exposition lines of one series"""
+
+    def render(self, worker_label: Tuple[str, str]) -> List[str]:
+        lines = self._header()
+        for values, child in list(self.children.items()):
+            # Series are created up front for every store backend and
+            # operation; only those that were used are reported
+            if any(child.totals()):
+                lines.extend(self._render_child(values, child, worker_label))
+        return lines
+
+class Counter(_SeriesMetric):
+    """Monotonic count, optionally labelled"""
+
+    kind = "counter"
+
+    def _new_child(self, values: Tuple[str, ...]) -> CounterChild:
+        return CounterChild()
+
+    def inc(self, amount: float = 1):
+        self.labels().inc(amount)
+
+    def _render_child(self, values, child: CounterChild, worker_label):
+        return [f"{self.name}{self._label_text(values, [worker_label])} {_format_value(child.value())}"]
+
+class Histogram(_SeriesMetric):
+    """Distribution of observations in fixed buckets, optionally labelled.
+
+    With ``timing_name`` set, observations made while handling a request
+    are also added up for that request's Server-Timing header. The name
+    may refer to labels, as in ``"ai_{phase}"``.
+    """
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS,
+        timing_name: Optional[str] = None
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.bounds = tuple(sorted(buckets))
+        self.timing_name = timing_name
+        # Label text of each series' lines, built on first render
+        self.prefixes: Dict[tuple, Tuple[List[str], str, str]] = {}
+
+    def _new_child(self, values: Tuple[str, ...]) -> HistogramChild:
+        timing_name = self.timing_name
+        if timing_name is not None:
+            timing_name = timing_name.format(**dict(zip(self.labelnames, values)))
+        return HistogramChild(self.bounds, timing_name)
+
+    def observe(self, value: float):
+        self.labels().observe(value)
+
+    def time(self) -> Span:
+        return self.labels().time()
+
+    def _line_prefixes(self, values, worker_label) -> Tuple[List[str], str, str]:
+        key = (values, worker_label)
+        prefixes = self.prefixes.get(key)
+        if prefixes is None:
+            buckets = [
+                f"{self.name}_bucket{self._label_text(values, [worker_label, ('le', _format_value(bound))])} "
+                for bound in (*self.bounds, math.inf)
+            ]
+            labels = self._label_text(values, [worker_label])
+            prefixes = self.prefixes[key] = (buckets, f"{self.name}_sum{labels} ", f"{self.name}_count{labels} ")
+        return prefixes
+
+    def _render_child(self, values, child: HistogramChild, worker_label):
+        totals = child.totals()
+        buckets, sum_prefix, count_prefix = self._line_prefixes(values, worker_label)
+        lines = []
+        cumulative = 0
+        for prefix, count in zip(buckets, totals):
+            cumulative += count
+            lines.append(f"{prefix}{cumulative}")
+        lines.append(f"{sum_prefix}{_format_value(totals[-1])}")
+        lines.append(f"{count_prefix}{cumulative}")
+        return lines
+
+class CallbackMetric(_Metric):
+    """Counter or gauge whose series are read from a callback at scrape time"""
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str],
+        kind: str,
+        callback: Callable[[], Dict[Tuple[str, ...], float]]
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.kind = kind
+        self.callback = callback
+
+    def render(self, worker_label: Tuple[str, str]) -> List[str]:
+        lines = self._header()
+        for values, value in self.callback().items():
+            lines.append(f"{self.name}{self._label_text(values, [worker_label])} {_format_value(value)}")
+        return lines
+
+class MetricsRegistry:
+    """Metrics of this worker process.
+
+    Every series carries a ``worker`` label with the process ID, so
+    series scraped from different workers behind one port stay apart and
+    can be summed in queries.
+    """
+
+    def __init__(self):
+        self.metrics: Dict[str, _Metric] = {}
+        self.worker = str(os.getpid())
+
+    def register(self, metric: _Metric) -> _Metric:
+        if metric.name in self.metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS,
+        timing_name: Optional[str] = None
+    ) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets, timing_name))
+
+    def callback(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str],
+        kind: str,
+        callback: Callable[[], Dict[Tuple[str, ...], float]]
+    ) -> CallbackMetric:
+        return self.register(CallbackMetric(name, documentation, labelnames, kind, callback))
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format"""
+        # Forked workers inherit the registry of the parent
+        self.worker = str(os.getpid())
+        lines: List[str] = []
+        for metric in list(self.metrics.values()):
+            lines.extend(metric.render(("worker", self.worker)))
+        return "\n".join(lines) + "\n"
+
+def timed(series: HistogramChild, errors: Optional[CounterChild] = None):
+    """Decorator timing each call of a coroutine function into a series"""
+
+    def decorator(function):
+        @functools.wraps(function)
+        async def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return await function(*args, **kwargs)
+            except Exception:
+                if errors is not None:
+                    errors.inc()
+                raise
+            finally:
+                series.observe(time.perf_counter() - started)
+        return wrapper
+    return decorator
+
+def timed_methods(histogram: Histogram, *labels: str, errors: Optional[Counter] = None):
+    """Class decorator timing every public coroutine method.
+
+    Each method is observed in the series labelled with ``labels`` and
+    the method name.
+    """
+
+    def decorator(cls):
+        for name, function in list(vars(cls).items()):
+            if name.startswith("_") or not inspect.iscoroutinefunction(function):
+                continue
+            values = (*labels, name)
+            setattr(cls, name, timed(
+                histogram.labels(*values),
+                errors.labels(*values) if errors is not None else None
+            )(function))
+        return cls
+    return decorator
+
+def server_timing(timings: Dict[str, float]) -> str:
+    """Server-Timing header value for a request's phase timings"""
+    return ", ".join(f"{name};dur={seconds * 1000:.2f}" for name, seconds in timings.items())
+
+metrics = MetricsRegistry()
+
+# Metrics observed outside any one service
+HTTP_REQUEST_SECONDS = metrics.histogram(
+    "http_request_duration_seconds",
+    "Time from receiving a request until its response has been sent",
+    ["method", "route", "status"]
+)
+SERIALIZATION_SECONDS = metrics.histogram(
+    "response_serialization_seconds",
+    "Time spent rendering JSON response bodies",
+    ["encoder"],
+    timing_name="serialize"
+)
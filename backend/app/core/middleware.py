@@ -0,0 +1,270 @@
+"""
+Pure ASGI middleware for the application stack
+"""
+
+import re
+import time
+import uuid
+from typing import Iterable, List, Optional, Tuple
+from starlette.datastructures import Headers, MutableHeaders
+
+from .compression import EncodingNegotiator, available_codecs
+from .logging import request_id_var
+from .metrics import HTTP_REQUEST_SECONDS, request_timings_var, server_timing
+
+RawHeaders = List[Tuple[bytes, bytes]]
+
+def _encode_headers(headers: Iterable[Tuple[str, str]]) -> RawHeaders:
+    return [(name.lower().encode("latin-1"), value.encode("latin-1")) for name, value in headers]
+
+class CORSMiddleware:
+    """Adds CORS headers to every HTTP response.
+
+    Unlike a BaseHTTPMiddleware, responses are passed through as ASGI
+    messages, so streaming bodies are not buffered or copied. Header tuples
+    are encoded once, and OPTIONS requests are answered here without
+    entering the router.
+    """
+
+    def __init__(
+        self,
+        app,
+        allow_origin: str = "*",
+        allow_methods: Iterable[str] = ("GET", "HEAD", "POST", "PUT", "PATCH", "DELETE", "OPTIONS"),
+        allow_headers: str = "*",
+        # Response headers clients need for If-Match, log lookups and timings
+        expose_headers: Iterable[str] = ("ETag", "X-Request-ID", "Server-Timing"),
+        max_age: int = 600
+    ):
+        self.app = app
+        self.response_headers = _encode_headers([
+            ("Access-Control-Allow-Origin", allow_origin),
+            ("Access-Control-Allow-Methods", ", ".join(allow_methods)),
+            ("Access-Control-Allow-Headers", allow_headers),
+            ("Access-Control-Expose-Headers", ", ".join(expose_headers)),
+        ])
+        self.preflight_headers = self.response_headers + _encode_headers([
+            ("Access-Control-Max-Age", str(max_age)),
+            ("Content-Length", "0"),
+        ])
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        if scope["method"] == "OPTIONS":
+            await send({
+                "type": "http.response.start",
+                "status": 200,
+                "headers": self.preflight_headers
+            })
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        response_headers = self.response_headers
+
+        async def send_with_cors(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = [*message.get("headers", ()), *response_headers]
+            await send(message)
+
+        await self.app(scope, receive, send_with_cors)
+
+# Request IDs taken from clients or proxies must look like IDs
+REQUEST_ID_PATTERN = re.compile(r"[A-Za-z0-9._:-]{1,128}")
+
+class RequestIdMiddleware:
+    """Gives each HTTP request an ID for its log records and response.
+
+    The ID comes from the X-Request-ID header when a client or proxy sent
+    a usable one and is generated otherwise. It is set in a context
+    variable, so every record logged while handling the request carries
+    it, and returned in the X-Request-ID response header.
+    """
+
+    def __init__(self, app, header: str = "X-Request-ID"):
+        self.app = app
+        self.header = header.lower()
+        self.raw_header = self.header.encode("latin-1")
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request_id = Headers(scope=scope).get(self.header)
+        if request_id is None or not REQUEST_ID_PATTERN.fullmatch(request_id):
+            request_id = uuid.uuid4().hex
+        token = request_id_var.set(request_id)
+        raw_id = request_id.encode("latin-1")
+
+        async def send_with_id(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = [*message.get("headers", ()), (self.raw_header, raw_id)]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            request_id_var.reset(token)
+
+# Methods used as a metrics label; anything else is counted as OTHER
+KNOWN_METHODS = frozenset({"GET", "HEAD", "POST", "PUT", "PATCH", "DELETE", "OPTIONS"})
+
+def _route_template(scope) -> str:
+    """Path template of the route that handled a request, with its prefixes"""
+    route = scope.get("route")
+    path_regex = getattr(route, "path_regex", None)
+    if path_regex is None:
+        return "unmatched"
+    path = scope["path"]
+    if path_regex.match(path):
+        return route.path
+    # Routers included lazily keep their routes' paths relative to the
+    # router prefix; the prefix is whatever the route did not match
+    for index, char in enumerate(path):
+        if char == "/" and index and path_regex.match(path[index:]):
+            return path[:index] + route.path
+    return route.path
+
+class MetricsMiddleware:
+    """Observes every HTTP request in the per-route latency histogram.
+
+    Requests are labelled with the path template of the route that
+    handled them, so all sessions share one series per endpoint. Phases
+    timed while the request was handled (store, serialization, provider
+    calls) are returned in a Server-Timing header together with the time
+    until the response started.
+    """
+
+    def __init__(self, app, server_timing_header: bool = True):
+        self.app = app
+        self.server_timing_header = server_timing_header
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        timings = {}
+        token = request_timings_var.set(timings)
+        status = 500
+
+        async def send_with_timing(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if self.server_timing_header:
+                    timings["app"] = time.perf_counter() - started
+                    value = server_timing(timings).encode("latin-1")
+                    message["headers"] = [*message.get("headers", ()), (b"server-timing", value)]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            request_timings_var.reset(token)
+            method = scope["method"] if scope["method"] in KNOWN_METHODS else "OTHER"
+            route = _route_template(scope)
+            HTTP_REQUEST_SECONDS.labels(method, route, str(status)).observe(time.perf_counter() - started)
+
+# Bodies worth compressing; images, archives and the like already are
+COMPRESSIBLE_TYPES = (
+    "text/",
+    "application/json",
+    "application/x-ndjson",
+    "application/javascript",
+    "application/xml",
+)
+
+def _compressible(headers: Headers) -> bool:
+    if "content-encoding" in headers or "content-range" in headers:
+        return False
+    content_type = headers.get("content-type", "")
+    # Server-sent events go out frame by frame and are left as they are
+    if content_type.startswith("text/event-stream"):
+        return False
+    return content_type.startswith(COMPRESSIBLE_TYPES) or "+json" in content_type
+
+class CompressionMiddleware:
+    """Compresses response bodies with zstd, brotli or gzip.
+
+    The codec is negotiated from Accept-Encoding. Whole bodies smaller than
+    ``minimum_size`` are sent as they are. Streamed bodies are compressed
+    chunk by chunk with a flush after each, so clients can decode every
+    chunk as it arrives. Server-sent events are not compressed.
+    """
+
+    def __init__(self, app, minimum_size: int = 1024, codecs: Optional[list] = None):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.negotiator = EncodingNegotiator(codecs if codecs is not None else available_codecs())
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        accept_encoding = Headers(scope=scope).get("accept-encoding")
+        codec = self.negotiator.select(accept_encoding) if accept_encoding else None
+        if codec is None:
+            await self.app(scope, receive, send)
+            return
+
+        start_message = None
+        stream = None
+        passthrough = False
+
+        async def send_compressed(message):
+            nonlocal start_message, stream, passthrough
+
+            if message["type"] == "http.response.start":
+                if _compressible(Headers(raw=message["headers"])):
+                    # Held back until the first body chunk shows the size
+                    start_message = message
+                else:
+                    passthrough = True
+                    await send(message)
+                return
+
+            if message["type"] != "http.response.body" or passthrough:
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+
+            if start_message is not None:
+                start, start_message = start_message, None
+                headers = MutableHeaders(scope=start)
+                headers.add_vary_header("Accept-Encoding")
+
+                if not more_body:
+                    if len(body) < self.minimum_size:
+                        await send(start)
+                        await send(message)
+                        return
+                    body = codec.compress(body)
+                    headers["Content-Encoding"] = codec.name
+                    headers["Content-Length"] = str(len(body))
+                    await send(start)
+                    await send({"type": "http.response.body", "body": body})
+                    return
+
+                stream = codec.stream()
+                headers["Content-Encoding"] = codec.name
+                del headers["Content-Length"]
+                await send(start)
+
+            if stream is not None:
+                data = stream.chunk(body) if body else b""
+                if not more_body:
+                    data += stream.finish()
+                await send({"type": "http.response.body", "body": data, "more_body": more_body})
+                return
+
+            await send(message)
+
+        await self.app(scope, receive, send_compressed)
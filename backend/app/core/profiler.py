@@ -0,0 +1,323 @@
+"""
+On-demand sampling profiler for a running worker
+"""
+
+import asyncio
+import inspect
+import logging
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Innermost frames of threads waiting for work; such samples are idle
+IDLE_FRAMES = {
+    ("threading.py", "wait"),
+    ("threading.py", "_wait_for_tstate_lock"),
+    ("queue.py", "get"),
+    ("thread.py", "_worker"),
+    ("selectors.py", "select"),
+}
+
+# Frames of asyncio's own loop, running callbacks or waiting for events
+LOOP_FRAMES = {
+    ("base_events.py", "_run_once"),
+    ("base_events.py", "run_forever"),
+    ("events.py", "_run"),
+    ("selectors.py", "select"),
+}
+
+# Deepest stack kept per sample; deeper frames are cut off at the root
+MAX_STACK_DEPTH = 128
+
+LOOP_THREAD = "event-loop"
+
+class ProfilerBusyError(RuntimeError):
+    """Raised when a profile is requested while another one is running"""
+
+def frame_key(frame) -> Tuple[str, str]:
+    return os.path.basename(frame.f_code.co_filename), frame.f_code.co_name
+
+def _thread_group(name: str) -> str:
+    """Pool threads are reported together: ThreadPoolExecutor-0_3 -> ThreadPoolExecutor-0"""
+    return re.sub(r"[_ -]?\d+$", "", name) or name
+
+def lag_percentiles(samples: List[float]) -> Dict[str, Optional[float]]:
+    """p50/p90/p99/max of lag samples in milliseconds"""
+    if not samples:
+        return {"p50": None, "p90": None, "p99": None, "max": None}
+    ordered = sorted(samples)
+    pick = lambda q: round(ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000, 2)
+    return {"p50": pick(0.5), "p90": pick(0.9), "p99": pick(0.99), "max": round(ordered[-1] * 1000, 2)}
+
+def loop_base_frames() -> List[Any]:
+    """Frames below the task running the caller: those running the event loop"""
+    frames = []
+    frame = sys._getframe(1)
+    while frame is not None:
+        frames.append(frame)
+        frame = frame.f_back
+    base = []
+    for frame in reversed(frames):
+        if frame.f_code.co_flags & inspect.CO_COROUTINE:
+            break
+        base.append(frame)
+    return base
+
+def stack_names(frame, frame_names: "FrameNames", loop_frames: Optional[List[Any]] = None) -> List[str]:
+    """Names of a frame and its callers, outermost first.
+
+    With ``loop_frames`` (from loop_base_frames) the stack of an event
+    loop thread starts at the running callback; the loop itself is left out.
+    """
+    names = []
+    while frame is not None and len(names) < MAX_STACK_DEPTH:
+        if loop_frames is not None and (
+            frame_key(frame) in LOOP_FRAMES or any(frame is base for base in loop_frames)
+        ):
+            break
+        names.append(frame_names(frame.f_code))
+        frame = frame.f_back
+    names.reverse()
+    return names
+
+def current_task_name(loop: asyncio.AbstractEventLoop) -> Optional[str]:
+    """Coroutine name of the task a loop is running; safe from other threads"""
+    try:
+        task = asyncio.current_task(loop)
+    except RuntimeError:
+        return None
+    if task is None:
+        return None
+    return getattr(task.get_coro(), "__qualname__", None) or task.get_name()
+
+class FrameNames:
+    """Flamegraph names of code objects, built once per code object"""
+
+    def __init__(self):
+        self.names: Dict[Any, str] = {}
+        self.roots = sorted(
+            {os.path.abspath(path) + os.sep for path in sys.path if path and os.path.isdir(path)},
+            key=len,
+            reverse=True
+        )
+
+    def __call__(self, code) -> str:
+        name = self.names.get(code)
+        if name is None:
+            filename = code.co_filename
+            for root in self.roots:
+                if filename.startswith(root):
+                    filename = filename[len(root):]
+                    break
+            qualname = getattr(code, "co_qualname", code.co_name)
+            # ";" separates frames in collapsed stacks
+            name = self.names[code] = f"{qualname} ({filename}:{code.co_firstlineno})".replace(";", ":")
+        return name
+
+class SamplingProfiler:
+    """Samples the stacks of every thread of this worker for a while.
+
+    Nothing runs between profiles. During one, a sampler thread reads
+    ``sys._current_frames()`` every ``interval`` seconds and counts the
+    stacks of busy threads as collapsed stacks, ready for flamegraph.pl
+    or speedscope. Event loop stacks are rooted at the coroutine of the
+    task being run. A probe coroutine on the event loop measures how late
+    its timers fire (loop lag), and runs of consecutive samples in which
+    the loop was busy with the same task are reported as slow callbacks.
+    """
+
+    def __init__(self):
+        self.running = False
+        self.frame_names = FrameNames()
+
+    async def profile(
+        self,
+        seconds: float,
+        interval: float = 0.005,
+        slow_callback_seconds: float = 0.05,
+        include_idle: bool = False
+    ) -> Dict[str, Any]:
+        """Profile this worker for ``seconds``; runs on the event loop being profiled"""
+        if self.running:
+            raise ProfilerBusyError("A profile is already running")
+        self.running = True
+        try:
+            loop = asyncio.get_running_loop()
+            base_frames = loop_base_frames()
+            finished = loop.create_future()
+            stop = threading.Event()
+            sampler = _Sampler(
+                self.frame_names,
+                threading.get_ident(),
+                loop,
+                base_frames,
+                interval,
+                include_idle
+            )
+
+            # The report is put together on the sampler thread too, so the
+            # loop only waits for it
+            def run_sampler():
+                try:
+                    sampler.run(stop)
+                    outcome = (sampler.report(slow_callback_seconds), None)
+                except Exception as e:
+                    outcome = (None, e)
+                loop.call_soon_threadsafe(finished.set_result, outcome)
+
+            logger.info(f"Profiling this worker for {seconds}s every {interval * 1000:g}ms")
+            thread = threading.Thread(target=run_sampler, name="profiler", daemon=True)
+            started = time.perf_counter()
+            thread.start()
+            try:
+                lag = await self._probe_lag(loop, seconds, interval)
+            finally:
+                stop.set()
+            report, error = await finished
+            if error is not None:
+                raise error
+
+            report["duration_seconds"] = round(time.perf_counter() - started, 3)
+            report["loop_lag_ms"] = lag_percentiles(lag)
+            return report
+        finally:
+            self.running = False
+
+    @staticmethod
+    async def _probe_lag(loop: asyncio.AbstractEventLoop, seconds: float, interval: float) -> List[float]:
+        """How late each of a series of short sleeps on the loop woke up"""
+        lag: List[float] = []
+        deadline = loop.time() + seconds
+        while loop.time() < deadline:
+            expected = loop.time() + interval
+            await asyncio.sleep(interval)
+            lag.append(max(0.0, loop.time() - expected))
+        return lag
+
+class _Sampler:
+    """State of one profile; used by the sampler thread only"""
+
+    def __init__(
+        self,
+        frame_names: FrameNames,
+        loop_thread: int,
+        loop: asyncio.AbstractEventLoop,
+        base_frames: List[Any],
+        interval: float,
+        include_idle: bool
+    ):
+        self.frame_names = frame_names
+        self.loop_thread = loop_thread
+        self.loop = loop
+        self.base_frames = base_frames
+        self.interval = interval
+        self.include_idle = include_idle
+        self.stacks: Counter = Counter()
+        self.busy: Counter = Counter()
+        self.idle: Counter = Counter()
+        self.rounds = 0
+        # (time, round, task, stack) of busy event loop samples
+        self.loop_samples: List[Tuple[float, int, Optional[str], str]] = []
+
+    def run(self, stop: threading.Event):
+        own_thread = threading.get_ident()
+        groups: Dict[int, str] = {}
+        while not stop.wait(self.interval):
+            now = time.perf_counter()
+            for ident, frame in sys._current_frames().items():
+                if ident == own_thread:
+                    continue
+                if ident == self.loop_thread:
+                    self._sample_loop(now, frame)
+                    continue
+                group = groups.get(ident)
+                if group is None:
+                    groups = {thread.ident: _thread_group(thread.name) for thread in threading.enumerate()}
+                    group = groups.setdefault(ident, str(ident))
+                self._sample_thread(group, frame)
+            self.rounds += 1
+
+
+    @staticmethod
+    def _is_idle(frame) -> bool:
+        return frame_key(frame) in IDLE_FRAMES
+
+    def _sample_thread(self, group: str, frame):
+        if self._is_idle(frame):
+            self.idle[group] += 1
+            if not self.include_idle:
+                return
+        else:
+            self.busy[group] += 1
+        self.stacks[";".join([group, *stack_names(frame, self.frame_names)])] += 1
+
+    def _loop_idle(self, frame) -> bool:
+        # Skip the frames the loop runs between callbacks; if what is left
+        # is the frame that started the loop, no callback is running
+        while frame is not None and frame_key(frame) in LOOP_FRAMES:
+            frame = frame.f_back
+        return frame is None or any(frame is base for base in self.base_frames)
+
+    def _sample_loop(self, now: float, frame):
+        if self._loop_idle(frame):
+            self.idle[LOOP_THREAD] += 1
+            if self.include_idle:
+                self.stacks[f"{LOOP_THREAD};idle"] += 1
+            return
+        self.busy[LOOP_THREAD] += 1
+        task = current_task_name(self.loop)
+        root = [LOOP_THREAD, f"task:{task}" if task else "callback"]
+        stack = ";".join([*root, *stack_names(frame, self.frame_names, self.base_frames)])
+        self.stacks[stack] += 1
+        self.loop_samples.append((now, self.rounds, task, stack))
+
+    def report(self, slow_callback_seconds: float) -> Dict[str, Any]:
+        return {
+            "interval_ms": round(self.interval * 1000, 3),
+            "samples": self.rounds,
+            "threads": self.thread_report(),
+            "slow_callbacks": self.slow_callbacks(slow_callback_seconds),
+            "collapsed": self.collapsed()
+        }
+
+    def thread_report(self) -> Dict[str, Dict[str, int]]:
+        groups = set(self.busy) | set(self.idle)
+        return {group: {"busy": self.busy[group], "idle": self.idle[group]} for group in sorted(groups)}
+
+    def slow_callbacks(self, threshold: float, limit: int = 20) -> List[Dict[str, Any]]:
+        """Runs of busy loop samples within one task lasting at least threshold"""
+        runs = []
+        start = 0
+        samples = self.loop_samples
+        for index in range(1, len(samples) + 1):
+            if (
+                index == len(samples)
+                or samples[index][2] != samples[start][2]
+                # The loop was idle in the rounds in between
+                or samples[index][1] != samples[index - 1][1] + 1
+            ):
+                first, last = samples[start], samples[index - 1]
+                duration = last[0] - first[0] + self.interval
+                if duration >= threshold:
+                    stack, _ = Counter(sample[3] for sample in samples[start:index]).most_common(1)[0]
+                    runs.append({
+                        "duration_ms": round(duration * 1000, 1),
+                        "task": first[2],
+                        "samples": index - start,
+                        "stack": stack.split(";")
+                    })
+                start = index
+        runs.sort(key=lambda run: run["duration_ms"], reverse=True)
+        return runs[:limit]
+
+    def collapsed(self) -> str:
+        """One "frame;frame;frame count" line per stack, busiest first"""
+        return "\n".join(f"{stack} {count}" for stack, count in self.stacks.most_common())
+
+profiler = SamplingProfiler()
@@ -0,0 +1,61 @@
+"""
+JSON responses serialized with the fastest available encoder
+"""
+
+import json
+from typing import Any, Callable
+
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+
+from .metrics import SERIALIZATION_SECONDS
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - depends on the installation
+    orjson = None
+
+try:
+    import msgspec
+except ImportError:  # pragma: no cover - depends on the installation
+    msgspec = None
+
+def _stdlib_dumps(content: Any) -> bytes:
+    # Same output as Starlette's JSONResponse
+    return json.dumps(
+        content,
+        ensure_ascii=False,
+        allow_nan=False,
+        indent=None,
+        separators=(",", ":")
+    ).encode("utf-8")
+
+if orjson is not None:
+    JSON_ENCODER = "orjson"
+    dumps: Callable[[Any], bytes] = lambda content: orjson.dumps(
+        content, option=orjson.OPT_NON_STR_KEYS
+    )
+elif msgspec is not None:
+    JSON_ENCODER = "msgspec"
+    dumps = msgspec.json.Encoder().encode
+else:
+    JSON_ENCODER = "json"
+    dumps = _stdlib_dumps
+
+_serialization = SERIALIZATION_SECONDS.labels(JSON_ENCODER)
+_model_serialization = SERIALIZATION_SECONDS.labels("pydantic")
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse rendered with orjson or msgspec when installed.
+
+    Pydantic models are serialized directly with model_dump_json, so
+    endpoints can return an already validated model without FastAPI
+    validating it again and converting it to a dict first.
+    """
+
+    def render(self, content: Any) -> bytes:
+        if isinstance(content, BaseModel):
+            with _model_serialization.time():
+                return content.model_dump_json().encode("utf-8")
+        with _serialization.time():
+            return dumps(content)
@@ -0,0 +1,238 @@
+"""
+Shared state in Redis for deployments with several workers
+"""
+
+import asyncio
+import json
+import logging
+import os
+import uuid
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+import redis.asyncio as redis
+
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+InvalidationListener = Callable[[str, Optional[int]], None]
+
+# Seconds to wait before resubscribing after the pub/sub connection fails
+RECONNECT_DELAY_SECONDS = 1.0
+
+# How long the first read waits for the invalidation channel
+SUBSCRIBE_TIMEOUT_SECONDS = 5.0
+
+# Conditional write of a versioned entry; the invalidation is published in
+# the same script, so no worker can read the new value before it is sent.
+# ARGV: expected version ("" for any, "0" for absent), new version, data,
+# TTL in seconds (0 for none), channel, invalidation message
+_COMPARE_AND_SET = """
+local current = redis.call('HGET', KEYS[1], 'v')
+if ARGV[1] ~= '' then
+    if ARGV[1] == '0' then
+        if current then return {0, current} end
+    elseif current ~= ARGV[1] then
+        return {0, current or ''}
+    end
+end
+redis.call('HSET', KEYS[1], 'v', ARGV[2], 'd', ARGV[3])
+if tonumber(ARGV[4]) > 0 then
+    redis.call('EXPIRE', KEYS[1], ARGV[4])
+end
+redis.call('PUBLISH', ARGV[5], ARGV[6])
+return {1, ARGV[2]}
+"""
+
+class SharedState:
+    """Versioned entries in Redis with pub/sub invalidation of local caches.
+
+    Each worker holds one connection pool. Entries are hashes of a version
+    and an opaque payload; multi-key reads go out as a single pipeline.
+    Every write publishes (namespace, key, version) on one channel, and a
+    listener task started on first use passes changes made by other
+    workers to the subscribed near-caches. When the subscription is lost,
+    caches are cleared, since changes may have been missed meanwhile.
+    """
+
+    def __init__(
+        self,
+        url: Optional[str],
+        prefix: str = "8pilot",
+        max_connections: int = 50
+    ):
+        self.url = url
+        self.prefix = prefix
+        self.max_connections = max_connections
+        self.channel = f"{prefix}:invalidate"
+        self.worker_id = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self.listeners: Dict[str, List[InvalidationListener]] = {}
+        self.resets: List[Callable[[], None]] = []
+        self._client: Optional[redis.Redis] = None
+        self._compare_and_set = None
+        self._listener: Optional[asyncio.Task] = None
+        self._subscribed = asyncio.Event()
+
+    @property
+    def client(self) -> redis.Redis:
+        """The worker's Redis client, created on first use"""
+        if self._client is None:
+            if not self.url:
+                raise RuntimeError("REDIS_URL is required for Redis shared state")
+            self._client = redis.Redis.from_url(self.url, max_connections=self.max_connections)
+        return self._client
+
+    def key(self, namespace: str, key: str) -> str:
+        return f"{self.prefix}:{namespace}:{key}"
+
+    def subscribe(
+        self,
+        namespace: str,
+        listener: InvalidationListener,
+        reset: Optional[Callable[[], None]] = None
+    ):
+        """Register a callback for changes in a namespace, and one to drop everything"""
+        self.listeners.setdefault(namespace, []).append(listener)
+        if reset is not None:
+            self.resets.append(reset)
+
+    async def refresh(self):
+        """Make sure invalidations from other workers are being received"""
+        if self._listener is None or self._listener.done():
+            self._listener = asyncio.create_task(self._listen())
+            # Reads that follow must not miss changes published from now on
+            try:
+                await asyncio.wait_for(self._subscribed.wait(), SUBSCRIBE_TIMEOUT_SECONDS)
+            except asyncio.TimeoutError:
+                logger.warning("Redis invalidation channel is not subscribed yet")
+
+    async def get(self, namespace: str, key: str) -> Optional[Tuple[int, bytes]]:
+        """Version and payload of an entry"""
+        version, data = await self.client.hmget(self.key(namespace, key), "v", "d")
+        if version is None:
+            return None
+        return int(version), data
+
+    async def get_many(self, namespace: str, keys: Iterable[str]) -> Dict[str, Tuple[int, bytes]]:
+        """Version and payload of several entries in one round trip"""
+        keys = list(keys)
+        if not keys:
+            return {}
+
+        pipeline = self.client.pipeline(transaction=False)
+        for key in keys:
+            pipeline.hmget(self.key(namespace, key), "v", "d")
+        rows = await pipeline.execute()
+
+        return {
+            key: (int(version), data)
+            for key, (version, data) in zip(keys, rows)
+            if version is not None
+        }
+
+    async def compare_and_set(
+        self,
+        namespace: str,
+        key: str,
+        version: int,
+        data: bytes,
+        expected: Optional[int] = None,
+        ttl: Optional[int] = None
+    ) -> Tuple[bool, Optional[int]]:
+        """Store an entry if its version is still the expected one (0: absent, None: any).
+
+        Returns whether it was written and the version now stored.
+        """
+        if self._compare_and_set is None:
+            self._compare_and_set = self.client.register_script(_COMPARE_AND_SET)
+        written, current = await self._compare_and_set(
+            keys=[self.key(namespace, key)],
+            args=[
+                "" if expected is None else str(expected),
+                str(version),
+                data,
+                str(ttl or 0),
+                self.channel,
+                self.message(namespace, key, version)
+            ]
+        )
+        return bool(written), int(current) if current else None
+
+    async def delete(self, namespace: str, key: str):
+        """Remove an entry and tell the other workers"""
+        pipeline = self.client.pipeline(transaction=True)
+        pipeline.delete(self.key(namespace, key))
+        pipeline.publish(self.channel, self.message(namespace, key, None))
+        await pipeline.execute()
+
+    async def publish(self, namespace: str, key: str, version: Optional[int] = None):
+        """Announce a change to data kept outside versioned entries"""
+        await self.client.publish(self.channel, self.message(namespace, key, version))
+
+    def message(self, namespace: str, key: str, version: Optional[int] = None) -> str:
+        """Invalidation message for publishing on the channel, e.g. from a pipeline"""
+        return json.dumps([self.worker_id, namespace, key, version])
+
+    async def _listen(self):
+        while True:
+            pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+            try:
+                await pubsub.subscribe(self.channel)
+                # Anything cached while unsubscribed may have missed a change
+                self._reset_all()
+                self._subscribed.set()
+                async for message in pubsub.listen():
+                    self.dispatch(message["data"])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Lost Redis invalidation channel: {e}", exc_info=True)
+            finally:
+                self._subscribed.clear()
+                await pubsub.aclose()
+
+            self._reset_all()
+            await asyncio.sleep(RECONNECT_DELAY_SECONDS)
+
+    def dispatch(self, payload: bytes):
+        """Notify listeners about a change made by another worker"""
+        try:
+            worker_id, namespace, key, version = json.loads(payload)
+        except (ValueError, TypeError):
+            logger.warning(f"Ignoring malformed invalidation message: {payload!r}")
+            return
+        if worker_id == self.worker_id:
+            return
+
+        for listener in self.listeners.get(namespace, ()):
+            try:
+                listener(key, version)
+            except Exception as e:
+                logger.error(f"Invalidation listener for {namespace} failed: {e}", exc_info=True)
+
+    def _reset_all(self):
+        for reset in self.resets:
+            try:
+                reset()
+            except Exception as e:
+                logger.error(f"Cache reset failed: {e}", exc_info=True)
+
+    async def close(self):
+        """Stop listening and release the connection pool"""
+        if self._listener is not None:
+            self._listener.cancel()
+            try:
+                await self._listener
+            except (asyncio.CancelledError, Exception):
+                pass
+            self._listener = None
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+            self._compare_and_set = None
+
+shared_state = SharedState(
+    settings.redis_url,
+    prefix=settings.redis_key_prefix,
+    max_connections=settings.redis_max_connections
+)
@@ -0,0 +1,118 @@
+"""
+Cache of verified access tokens and the users they resolve to
+"""
+
+import hashlib
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Dict, Optional, Set, Tuple
+from .cache import LRUCache, invalidation_log
+from .config import settings
+
+INVALIDATION_NAMESPACE = "user"
+
+# Digests tracked per user before evicted ones are pruned from the index
+USER_TOKENS_PRUNE_AT = 8
+
+@dataclass(frozen=True)
+class UserSnapshot:
+    """Detached copy of the user fields needed by request handlers"""
+    id: int
+    email: str
+    created_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
+
+    @classmethod
+    def of(cls, user) -> "UserSnapshot":
+        return cls(
+            id=user.id,
+            email=user.email,
+            created_at=user.created_at,
+            updated_at=user.updated_at
+        )
+
+def token_digest(token: str) -> bytes:
+    """Cache key for a token, so raw tokens are not kept in memory"""
+    return hashlib.blake2b(token.encode(), digest_size=16).digest()
+
+class TokenCache:
+    """Bounded map from token digest to the resolved user.
+
+    Entries expire at the token's ``exp`` claim or after ``max_ttl`` seconds,
+    whichever comes first, so users deleted or changed by another worker
+    are picked up even if an invalidation is missed. Lookups run on the
+    event loop and invalidations may come from sync handlers, so access is
+    serialized with a lock.
+    """
+
+    def __init__(self, maxsize: int, max_ttl: float):
+        self.entries = LRUCache(maxsize)
+        self.max_ttl = max_ttl
+        self.user_tokens: Dict[int, Set[bytes]] = {}
+        self.lock = threading.Lock()
+
+    def get(self, token: str) -> Optional[UserSnapshot]:
+        """Get the user of a previously verified, unexpired token"""
+        key = token_digest(token)
+        with self.lock:
+            entry: Optional[Tuple[UserSnapshot, float]] = self.entries.get(key)
+            if entry is None:
+                return None
+            user, expires_at = entry
+            if time.time() >= expires_at:
+                self._discard(key, user.id)
+                return None
+            return user
+
+    def put(self, token: str, user: UserSnapshot, exp: Optional[float]):
+        """Remember a verified token until it expires"""
+        expires_at = time.time() + self.max_ttl
+        if exp is not None:
+            expires_at = min(expires_at, float(exp))
+
+        key = token_digest(token)
+        with self.lock:
+            self.entries.set(key, (user, expires_at))
+            tokens = self.user_tokens.setdefault(user.id, set())
+            # Drop digests the LRU already evicted so the index stays bounded
+            if len(tokens) >= USER_TOKENS_PRUNE_AT:
+                tokens.intersection_update(self.entries.data.keys())
+            tokens.add(key)
+
+    def invalidate_token(self, token: str):
+        """Forget one token, e.g. on logout"""
+        key = token_digest(token)
+        with self.lock:
+            entry = self.entries.pop(key)
+            if entry is not None:
+                self._discard(key, entry[0].id)
+
+    def invalidate_user(self, user_id: int):
+        """Forget every token of a user after their account changed"""
+        with self.lock:
+            for key in self.user_tokens.pop(user_id, ()):
+                self.entries.pop(key)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.user_tokens.clear()
+
+    def _discard(self, key: bytes, user_id: int):
+        self.entries.pop(key)
+        tokens = self.user_tokens.get(user_id)
+        if tokens is not None:
+            tokens.discard(key)
+            if not tokens:
+                del self.user_tokens[user_id]
+
+token_cache = TokenCache(settings.token_cache_size, settings.token_cache_ttl_seconds)
+
+# Account changes made by other workers
+invalidation_log.subscribe(
+    INVALIDATION_NAMESPACE,
+    lambda user_id, version: token_cache.invalidate_user(int(user_id)),
+    reset=token_cache.clear
+)
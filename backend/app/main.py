@@ -3,20 +3,23 @@
 Main entry point for the backend service
 """
 
-from fastapi import FastAPI, Request
-from fastapi.middleware.cors import CORSMiddleware
+from fastapi import FastAPI, Request, Response
 from fastapi.middleware.trustedhost import TrustedHostMiddleware
 from fastapi.responses import JSONResponse
 import uvicorn
 import logging
 from contextlib import asynccontextmanager
-from starlette.middleware.base import BaseHTTPMiddleware
-from starlette.responses import Response
 
 from app.core.config import settings
 from app.api.v1.api import api_router
 from app.core.logging import setup_logging
+from app.core.loop_monitor import loop_monitor
 from app.core.database import create_tables
+from app.core.hashing import password_hasher
+from app.core.metrics import metrics
+from app.core.middleware import CompressionMiddleware, CORSMiddleware, MetricsMiddleware, RequestIdMiddleware
+from app.core.responses import FastJSONResponse
+from app.core.shared_state import shared_state
 
 # Import all models to ensure they are registered with Base before creating tables
 from app.models.user import User
@@ -25,27 +28,6 @@ from app.models.user import User
 setup_logging()
 logger = logging.getLogger(__name__)
 
-class CustomCORSMiddleware(BaseHTTPMiddleware):
-    async def dispatch(self, request: Request, call_next):
-        # Handle preflight requests
-        if request.method == "OPTIONS":
-            response = Response()
-            response.headers["Access-Control-Allow-Origin"] = "*"
-            response.headers["Access-Control-Allow-Methods"] = "GET, POST, PUT, DELETE, OPTIONS"
-            response.headers["Access-Control-Allow-Headers"] = "*"
-            response.headers["Access-Control-Max-Age"] = "600"
-            return response
-        
-        # Process the request
-        response = await call_next(request)
-        
-        # Add CORS headers to all responses
-        response.headers["Access-Control-Allow-Origin"] = "*"
-        response.headers["Access-Control-Allow-Methods"] = "GET, POST, PUT, DELETE, OPTIONS"
-        response.headers["Access-Control-Allow-Headers"] = "*"
-        
-        return response
-
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Application lifespan events"""
@@ -54,9 +36,14 @@ async def lifespan(app: FastAPI):
     # Skip database tables creation for in-memory mode
     # create_tables()
     logger.info("Using in-memory storage mode")
+    if settings.loop_monitor_enabled:
+        loop_monitor.start()
     yield
     # Shutdown
     logger.info("Shutting down 8pilot backend...")
+    await loop_monitor.stop()
+    password_hasher.shutdown()
+    await shared_state.close()
 
 def create_app() -> FastAPI:
     """Create and configure FastAPI application"""
@@ -67,17 +54,36 @@ def create_app() -> FastAPI:
         version="1.0.0",
         docs_url="/docs" if settings.debug else None,
         redoc_url="/redoc" if settings.debug else None,
+        default_response_class=FastJSONResponse,
         lifespan=lifespan
     )
     
-    # Add custom CORS middleware
-    app.add_middleware(CustomCORSMiddleware)
+    # Add compression middleware; inside CORS so preflight skips it
+    if settings.compression_enabled:
+        app.add_middleware(
+            CompressionMiddleware,
+            minimum_size=settings.compression_minimum_size
+        )
     
-    # Add trusted host middleware
-    app.add_middleware(
-        TrustedHostMiddleware,
-        allowed_hosts=settings.allowed_hosts
-    )
+    # Add CORS middleware; answers preflight requests before routing
+    app.add_middleware(CORSMiddleware)
+    
+    # Add trusted host middleware, unless every host is allowed anyway
+    if "*" not in settings.allowed_hosts:
+        app.add_middleware(
+            TrustedHostMiddleware,
+            allowed_hosts=settings.allowed_hosts
+        )
+    
+    # Add metrics middleware; times the whole stack below it
+    if settings.metrics_enabled:
+        app.add_middleware(
+            MetricsMiddleware,
+            server_timing_header=settings.metrics_server_timing
+        )
+    
+    # Outermost, so everything logged for a request carries its ID
+    app.add_middleware(RequestIdMiddleware)
     
     # Global exception handler
     @app.exception_handler(Exception)
@@ -96,6 +102,12 @@ def create_app() -> FastAPI:
     async def health_check():
         return {"status": "healthy", "service": "8pilot-backend"}
     
+    # Prometheus scrape endpoint; each worker reports its own series
+    if settings.metrics_enabled:
+        @app.get("/metrics", include_in_schema=False)
+        async def prometheus_metrics():
+            return Response(metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+    
     return app
 
 # Create app instance
@@ -73,9 +73,46 @@ class ChatHistory(BaseModel):
             return None
         return max(self.sessions, key=lambda s: s.last_activity)
 
+class ChatSessionPage(BaseModel):
+    """Sessions of a workflow, most recently active first, with their latest messages"""
+    workflow_id: str
+    sessions: List[ChatSession] = []
+    next_cursor: Optional[str] = None
+
+class ChatMessagePage(BaseModel):
+    """Consecutive messages of a session, oldest first"""
+    session_id: str
+    messages: List[Message] = []
+    total_messages: int = 0
+    next_before: Optional[int] = None
+
+class ChatSearchHit(BaseModel):
+    """Message matching a chat search, with matches marked in the snippet"""
+    session_id: str
+    workflow_id: str
+    message_id: Optional[str] = None
+    role: str
+    timestamp: datetime
+    score: float
+    snippet: str
+
+class ChatSearchResults(BaseModel):
+    """Best matching messages, highest score first"""
+    query: str
+    hits: List[ChatSearchHit] = []
+
 class StreamingChatResponse(BaseModel):
     """Streaming response chunk"""
     chunk: str
     session_id: str
     is_complete: bool = False
     metadata: Optional[dict] = {}
+
+class WorkflowCandidate(BaseModel):
+    """Workflow found in a streamed reply, sent as a workflow_candidate event"""
+    session_id: str
+    index: int
+    workflow: dict
+    valid: bool
+    errors: List[str] = []
+    warnings: List[str] = []
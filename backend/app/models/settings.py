@@ -2,10 +2,23 @@
 User settings models
 """
 
+from sqlalchemy import Column, Integer, String, Text, DateTime
 from pydantic import BaseModel, Field, validator
 from typing import Optional, Literal
 from datetime import datetime
 
+# Import Base from database module to avoid conflicts
+from ..core.database import Base
+
+class UserSettingsRecord(Base):
+    """Stored settings and n8n instances of one user as a JSON document"""
+    __tablename__ = "user_settings"
+    
+    user_id = Column(String(255), primary_key=True)
+    version = Column(Integer, nullable=False, default=1)
+    data = Column(Text, nullable=False)
+    updated_at = Column(DateTime, nullable=True)
+
 class UserSettings(BaseModel):
     """User application settings"""
     user_id: Optional[str] = None
@@ -1,21 +1,35 @@
-from sqlalchemy import Column, Integer, String, DateTime
+from sqlalchemy import Column, Integer, String, DateTime, Index
+from sqlalchemy.dialects.sqlite import DATETIME as SQLITE_DATETIME
 from sqlalchemy.sql import func
 from pydantic import BaseModel, Field, validator
 from pydantic.networks import EmailStr
-from typing import Optional
+from typing import List, Optional
 from datetime import datetime
 
 # Import Base from database module to avoid conflicts
 from ..core.database import Base
 
+# SQLite's CURRENT_TIMESTAMP has no fractional seconds; bind created_at the
+# same way so keyset comparisons against stored values are exact
+CREATED_AT_TYPE = DateTime(timezone=True).with_variant(
+    SQLITE_DATETIME(
+        storage_format="%(year)04d-%(month)02d-%(day)02d %(hour)02d:%(minute)02d:%(second)02d"
+    ),
+    "sqlite"
+)
+
 class User(Base):
     """User model for database"""
     __tablename__ = "users"
+    __table_args__ = (
+        # Keyset pagination of the admin listing
+        Index("ix_users_created_at_id", "created_at", "id"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     email = Column(String(255), unique=True, index=True, nullable=False)
     hashed_password = Column(String(255), nullable=False)
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    created_at = Column(CREATED_AT_TYPE, server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
 
 # Pydantic models for API
@@ -43,6 +57,10 @@ class UserResponse(UserBase):
         "from_attributes": True
     }
 
+class UserPage(BaseModel):
+    users: List[UserResponse]
+    next_cursor: Optional[str] = None
+
 class UserLogin(BaseModel):
     email: str
     password: str
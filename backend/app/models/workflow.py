@@ -2,10 +2,33 @@
 n8n Workflow models
 """
 
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, LargeBinary, ForeignKey
 from pydantic import BaseModel, Field, validator
-from typing import List, Optional, Dict, Any, Union
+from typing import List, Optional, Dict, Any, Union, Literal
 from datetime import datetime
 
+# Import Base from database module to avoid conflicts
+from ..core.database import Base
+
+class WorkflowRecord(Base):
+    """Stored workflow: compressed JSON document plus indexed metadata"""
+    __tablename__ = "workflows"
+    
+    id = Column(String(255), primary_key=True)
+    name = Column(String(255), nullable=False, index=True)
+    active = Column(Boolean, nullable=False, default=False, index=True)
+    version = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime, nullable=True)
+    updated_at = Column(DateTime, nullable=True, index=True)
+    data = Column(LargeBinary, nullable=False)
+
+class WorkflowTagRecord(Base):
+    """Workflow tag, one row per tag for indexed lookups"""
+    __tablename__ = "workflow_tags"
+    
+    workflow_id = Column(String(255), ForeignKey("workflows.id", ondelete="CASCADE"), primary_key=True)
+    tag = Column(String(255), primary_key=True, index=True)
+
 class WorkflowNode(BaseModel):
     """n8n workflow node"""
     id: str
@@ -39,6 +62,7 @@ class Workflow(BaseModel):
     staticData: Dict[str, Any] = {}
     tags: Optional[List[str]] = None
     active: bool = False
+    version: int = 0
     createdAt: Optional[datetime] = None
     updatedAt: Optional[datetime] = None
     
@@ -57,6 +81,17 @@ class WorkflowUpdate(BaseModel):
     tags: Optional[List[str]] = None
     active: Optional[bool] = None
 
+class WorkflowPatchOperation(BaseModel):
+    """JSON Patch (RFC 6902) operation on a workflow"""
+    op: Literal["add", "remove", "replace", "move", "copy", "test"]
+    path: str
+    from_: Optional[str] = Field(None, alias="from")
+    value: Any = None
+    
+    def to_operation(self) -> Dict[str, Any]:
+        """Convert to a plain patch operation, keeping explicit null values"""
+        return self.model_dump(by_alias=True, exclude_unset=True)
+
 class WorkflowExecution(BaseModel):
     """Workflow execution result"""
     execution_id: str
@@ -79,6 +114,13 @@ class WorkflowTemplate(BaseModel):
     created_at: datetime = Field(default_factory=datetime.utcnow)
     created_by: Optional[str] = None
 
+class TemplateSearchResult(BaseModel):
+    """Page of template search results"""
+    items: List[WorkflowTemplate] = []
+    total: int = 0
+    facets: Dict[str, Dict[str, int]] = {}
+    next_cursor: Optional[str] = None
+
 class WorkflowStats(BaseModel):
     """Workflow statistics"""
     workflow_id: str
@@ -5,11 +5,96 @@ AI Service for interacting with OpenAI and Anthropic APIs
 import httpx
 import json
 import logging
-from typing import List, Dict, Any, Optional, AsyncGenerator
+import time
+from typing import List, Dict, Any, Optional, AsyncGenerator, Tuple
 from app.core.config import settings
+from app.core.metrics import RATE_BUCKETS, metrics
+from app.services.message_log import MessageRecord
 
 logger = logging.getLogger(__name__)
 
+PROVIDER_PHASE_SECONDS = metrics.histogram(
+    "ai_provider_phase_seconds",
+    "Phases of AI provider requests: connect, ttfb, first_token (streams) and total",
+    ["provider", "model", "phase"],
+    timing_name="ai_{phase}"
+)
+PROVIDER_ERRORS = metrics.counter(
+    "ai_provider_errors_total",
+    "AI provider requests that failed",
+    ["provider", "model"]
+)
+OUTPUT_TOKENS = metrics.counter(
+    "ai_output_tokens_total",
+    "Tokens generated by AI providers",
+    ["provider", "model"]
+)
+OUTPUT_TOKENS_PER_SECOND = metrics.histogram(
+    "ai_output_tokens_per_second",
+    "Generated tokens per second of each AI provider request",
+    ["provider", "model"],
+    buckets=RATE_BUCKETS
+)
+
+class ProviderCall:
+    """Times the phases of one provider request.
+
+    Connect and time to first byte come from httpx's connection trace
+    events, so they are available for buffered responses too. Token
+    counts are taken from the provider's usage report, or counted from
+    stream deltas when there is none.
+    """
+
+    __slots__ = ("labels", "started", "connect_started", "connected", "first_byte", "first_token", "chunks", "output_tokens")
+
+    def __init__(self, provider: str, model: str):
+        self.labels = (provider, model)
+        self.started = time.perf_counter()
+        self.connect_started: Optional[float] = None
+        self.connected: Optional[float] = None
+        self.first_byte: Optional[float] = None
+        self.first_token: Optional[float] = None
+        self.chunks = 0
+        self.output_tokens: Optional[int] = None
+
+    async def trace(self, event_name: str, info: Dict[str, Any]):
+        """httpcore trace callback, passed in the request extensions"""
+        if event_name == "connection.connect_tcp.started":
+            self.connect_started = time.perf_counter()
+        elif event_name in ("connection.connect_tcp.complete", "connection.start_tls.complete"):
+            self.connected = time.perf_counter()
+        elif event_name.endswith("receive_response_headers.complete") and self.first_byte is None:
+            self.first_byte = time.perf_counter()
+
+    def chunk(self):
+        """A content delta of a streamed response arrived"""
+        if self.first_token is None:
+            self.first_token = time.perf_counter()
+        self.chunks += 1
+
+    def __enter__(self) -> "ProviderCall":
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        if exc_type is not None and issubclass(exc_type, Exception):
+            PROVIDER_ERRORS.labels(*self.labels).inc()
+            return
+        # Also reached when a stream's consumer stops reading early
+        total = time.perf_counter() - self.started
+        phases = [("total", total)]
+        if self.connect_started is not None and self.connected is not None:
+            phases.append(("connect", self.connected - self.connect_started))
+        if self.first_byte is not None:
+            phases.append(("ttfb", self.first_byte - self.started))
+        if self.first_token is not None:
+            phases.append(("first_token", self.first_token - self.started))
+        for phase, seconds in phases:
+            PROVIDER_PHASE_SECONDS.labels(*self.labels, phase).observe(seconds)
+        tokens = self.output_tokens if self.output_tokens is not None else self.chunks
+        if tokens:
+            OUTPUT_TOKENS.labels(*self.labels).inc(tokens)
+            OUTPUT_TOKENS_PER_SECOND.labels(*self.labels).observe(tokens / total)
+
 class AIService:
     """Service for handling AI API calls to OpenAI and Anthropic"""
     
@@ -71,13 +156,17 @@ class AIService:
         """Get default model for a provider"""
         return self.default_models.get(provider, "gpt-4o")
     
+    def _provider_call(self, provider: str, model: str) -> ProviderCall:
+        """Start timing a provider request; unknown models share one label"""
+        return ProviderCall(provider, model if model in self.model_configs else "other")
+    
     async def get_response(
         self,
         message: str,
         provider: str,
         model: Optional[str] = None,
         context: Optional[Dict] = None,
-        session_history: Optional[List[Dict]] = None,
+        session_history: Optional[List[MessageRecord]] = None,
         api_key: Optional[str] = None
     ) -> str:
         """Get AI response from the specified provider"""
@@ -117,7 +206,7 @@ class AIService:
         provider: str,
         model: Optional[str] = None,
         context: Optional[Dict] = None,
-        session_history: Optional[List[Dict]] = None,
+        session_history: Optional[List[MessageRecord]] = None,
         api_key: Optional[str] = None
     ) -> AsyncGenerator[Dict[str, Any], None]:
         """Stream AI response from the specified provider"""
@@ -158,7 +247,7 @@ class AIService:
         message: str,
         model: str,
         context: Optional[Dict],
-        session_history: Optional[List[Dict]],
+        session_history: Optional[List[MessageRecord]],
         api_key: Optional[str],
         model_config: Dict[str, Any]
     ) -> str:
@@ -184,28 +273,31 @@ class AIService:
             "Content-Type": "application/json"
         }
         
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                f"{self.openai_base_url}/chat/completions",
-                json=data,
-                headers=headers,
-                timeout=60.0
-            )
-            
-            if response.status_code != 200:
-                error_detail = response.text
-                logger.error(f"OpenAI API error: {response.status_code} - {error_detail}")
-                raise Exception(f"OpenAI API error: {response.status_code}")
-            
-            result = response.json()
-            return result["choices"][0]["message"]["content"]
+        with self._provider_call("openai", model) as call:
+            async with httpx.AsyncClient() as client:
+                response = await client.post(
+                    f"{self.openai_base_url}/chat/completions",
+                    json=data,
+                    headers=headers,
+                    timeout=60.0,
+                    extensions={"trace": call.trace}
+                )
+                
+                if response.status_code != 200:
+                    error_detail = response.text
+                    logger.error(f"OpenAI API error: {response.status_code} - {error_detail}")
+                    raise Exception(f"OpenAI API error: {response.status_code}")
+                
+                result = response.json()
+                call.output_tokens = result.get("usage", {}).get("completion_tokens")
+                return result["choices"][0]["message"]["content"]
     
     async def _get_anthropic_response(
         self,
         message: str,
         model: str,
         context: Optional[Dict],
-        session_history: Optional[List[Dict]],
+        session_history: Optional[List[MessageRecord]],
         api_key: Optional[str],
         model_config: Dict[str, Any]
     ) -> str:
@@ -221,6 +313,7 @@ class AIService:
         data = {
             "model": model,
             "messages": messages,
+            **self._anthropic_system(session_history),
             "max_tokens": model_config["max_tokens"],
             "temperature": model_config["temperature"]
         }
@@ -231,28 +324,31 @@ class AIService:
             "anthropic-version": "2023-06-01"
         }
         
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                f"{self.anthropic_base_url}/messages",
-                json=data,
-                headers=headers,
-                timeout=60.0
-            )
-            
-            if response.status_code != 200:
-                error_detail = response.text
-                logger.error(f"Anthropic API error: {response.status_code} - {error_detail}")
-                raise Exception(f"Anthropic API error: {response.status_code}")
-            
-            result = response.json()
-            return result["content"][0]["text"]
+        with self._provider_call("anthropic", model) as call:
+            async with httpx.AsyncClient() as client:
+                response = await client.post(
+                    f"{self.anthropic_base_url}/messages",
+                    json=data,
+                    headers=headers,
+                    timeout=60.0,
+                    extensions={"trace": call.trace}
+                )
+                
+                if response.status_code != 200:
+                    error_detail = response.text
+                    logger.error(f"Anthropic API error: {response.status_code} - {error_detail}")
+                    raise Exception(f"Anthropic API error: {response.status_code}")
+                
+                result = response.json()
+                call.output_tokens = result.get("usage", {}).get("output_tokens")
+                return result["content"][0]["text"]
     
     async def _stream_openai_response(
         self,
         message: str,
         model: str,
         context: Optional[Dict],
-        session_history: Optional[List[Dict]],
+        session_history: Optional[List[MessageRecord]],
         api_key: Optional[str],
         model_config: Dict[str, Any]
     ) -> AsyncGenerator[Dict[str, Any], None]:
@@ -270,7 +366,9 @@ class AIService:
             "messages": messages,
             "max_tokens": model_config["max_tokens"],
             "temperature": model_config["temperature"],
-            "stream": True
+            "stream": True,
+            # The last chunk then reports the token usage
+            "stream_options": {"include_usage": True}
         }
         
         headers = {
@@ -278,44 +376,49 @@ class AIService:
             "Content-Type": "application/json"
         }
         
-        async with httpx.AsyncClient() as client:
-            async with client.stream(
-                "POST",
-                f"{self.openai_base_url}/chat/completions",
-                json=data,
-                headers=headers,
-                timeout=60.0
-            ) as response:
-                
-                if response.status_code != 200:
-                    error_detail = await response.aread()
-                    logger.error(f"OpenAI streaming API error: {response.status_code} - {error_detail}")
-                    raise Exception(f"OpenAI API error: {response.status_code}")
-                
-                async for line in response.aiter_lines():
-                    if line.startswith("data: "):
-                        data = line[6:]  # Remove "data: " prefix
-                        if data.strip() == "[DONE]":
-                            break
-                        
-                        try:
-                            chunk_data = json.loads(data)
-                            if "choices" in chunk_data and len(chunk_data["choices"]) > 0:
-                                delta = chunk_data["choices"][0].get("delta", {})
-                                if "content" in delta:
-                                    yield {
-                                        "chunk": delta["content"],
-                                        "is_complete": False
-                                    }
-                        except json.JSONDecodeError:
-                            continue
+        with self._provider_call("openai", model) as call:
+            async with httpx.AsyncClient() as client:
+                async with client.stream(
+                    "POST",
+                    f"{self.openai_base_url}/chat/completions",
+                    json=data,
+                    headers=headers,
+                    timeout=60.0,
+                    extensions={"trace": call.trace}
+                ) as response:
+                    
+                    if response.status_code != 200:
+                        error_detail = await response.aread()
+                        logger.error(f"OpenAI streaming API error: {response.status_code} - {error_detail}")
+                        raise Exception(f"OpenAI API error: {response.status_code}")
+                    
+                    async for line in response.aiter_lines():
+                        if line.startswith("data: "):
+                            data = line[6:]  # Remove "data: " prefix
+                            if data.strip() == "[DONE]":
+                                break
+                            
+                            try:
+                                chunk_data = json.loads(data)
+                                if chunk_data.get("usage"):
+                                    call.output_tokens = chunk_data["usage"].get("completion_tokens")
+                                if "choices" in chunk_data and len(chunk_data["choices"]) > 0:
+                                    delta = chunk_data["choices"][0].get("delta", {})
+                                    if "content" in delta:
+                                        call.chunk()
+                                        yield {
+                                            "chunk": delta["content"],
+                                            "is_complete": False
+                                        }
+                            except json.JSONDecodeError:
+                                continue
     
     async def _stream_anthropic_response(
         self,
         message: str,
         model: str,
         context: Optional[Dict],
-        session_history: Optional[List[Dict]],
+        session_history: Optional[List[MessageRecord]],
         api_key: Optional[str],
         model_config: Dict[str, Any]
     ) -> AsyncGenerator[Dict[str, Any], None]:
@@ -331,6 +434,7 @@ class AIService:
         data = {
             "model": model,
             "messages": messages,
+            **self._anthropic_system(session_history),
             "max_tokens": model_config["max_tokens"],
             "temperature": model_config["temperature"],
             "stream": True
@@ -342,43 +446,49 @@ class AIService:
             "anthropic-version": "2023-06-01"
         }
         
-        async with httpx.AsyncClient() as client:
-            async with client.stream(
-                "POST",
-                f"{self.anthropic_base_url}/messages",
-                json=data,
-                headers=headers,
-                timeout=60.0
-            ) as response:
-                
-                if response.status_code != 200:
-                    error_detail = await response.aread()
-                    logger.error(f"Anthropic streaming API error: {response.status_code} - {error_detail}")
-                    raise Exception(f"Anthropic API error: {response.status_code}")
-                
-                async for line in response.aiter_lines():
-                    if line.startswith("data: "):
-                        data = line[6:]  # Remove "data: " prefix
-                        
-                        try:
-                            chunk_data = json.loads(data)
-                            if chunk_data.get("type") == "content_block_delta":
-                                delta = chunk_data.get("delta", {})
-                                if "text" in delta:
-                                    yield {
-                                        "chunk": delta["text"],
-                                        "is_complete": False
-                                    }
-                            elif chunk_data.get("type") == "message_stop":
-                                break
-                        except json.JSONDecodeError:
-                            continue
+        with self._provider_call("anthropic", model) as call:
+            async with httpx.AsyncClient() as client:
+                async with client.stream(
+                    "POST",
+                    f"{self.anthropic_base_url}/messages",
+                    json=data,
+                    headers=headers,
+                    timeout=60.0,
+                    extensions={"trace": call.trace}
+                ) as response:
+                    
+                    if response.status_code != 200:
+                        error_detail = await response.aread()
+                        logger.error(f"Anthropic streaming API error: {response.status_code} - {error_detail}")
+                        raise Exception(f"Anthropic API error: {response.status_code}")
+                    
+                    async for line in response.aiter_lines():
+                        if line.startswith("data: "):
+                            data = line[6:]  # Remove "data: " prefix
+                            
+                            try:
+                                chunk_data = json.loads(data)
+                                if chunk_data.get("type") == "content_block_delta":
+                                    delta = chunk_data.get("delta", {})
+                                    if "text" in delta:
+                                        call.chunk()
+                                        yield {
+                                            "chunk": delta["text"],
+                                            "is_complete": False
+                                        }
+                                elif chunk_data.get("type") == "message_delta":
+                                    # Cumulative count of generated tokens
+                                    call.output_tokens = chunk_data.get("usage", {}).get("output_tokens", call.output_tokens)
+                                elif chunk_data.get("type") == "message_stop":
+                                    break
+                            except json.JSONDecodeError:
+                                continue
     
     def _prepare_messages(
         self,
         message: str,
         context: Optional[Dict],
-        session_history: Optional[List[Dict]]
+        session_history: Optional[List[MessageRecord]]
     ) -> List[Dict[str, str]]:
         """Prepare messages for OpenAI API"""
         messages = []
@@ -390,13 +500,11 @@ class AIService:
                 "content": context["system_prompt"]
             })
         
-        # Add session history
+        # Add session history, summary first; payload fragments are cached per message
         if session_history:
-            for msg in session_history[-10:]:  # Limit to last 10 messages
-                messages.append({
-                    "role": msg.get("role", "user"),
-                    "content": msg.get("content", "")
-                })
+            summaries, recent = self._split_history(session_history)
+            messages.extend(record.payload() for record in summaries)
+            messages.extend(record.payload() for record in recent)
         
         # Add current message
         messages.append({
@@ -406,22 +514,37 @@ class AIService:
         
         return messages
     
+    @staticmethod
+    def _split_history(session_history: List[MessageRecord]) -> Tuple[List[MessageRecord], List[MessageRecord]]:
+        """Summary of older turns leading the history, and its last 10 other messages"""
+        summary_count = 0
+        while summary_count < len(session_history) and session_history[summary_count].role == "system":
+            summary_count += 1
+        return session_history[:summary_count], session_history[summary_count:][-10:]
+    
+    def _anthropic_system(self, session_history: Optional[List[MessageRecord]]) -> Dict[str, str]:
+        """Request field carrying the history summary; Anthropic takes no system messages"""
+        if not session_history:
+            return {}
+        summaries, _ = self._split_history(session_history)
+        if not summaries:
+            return {}
+        return {"system": "\n\n".join(record.content for record in summaries)}
+    
     def _prepare_anthropic_messages(
         self,
         message: str,
         context: Optional[Dict],
-        session_history: Optional[List[Dict]]
+        session_history: Optional[List[MessageRecord]]
     ) -> List[Dict[str, str]]:
         """Prepare messages for Anthropic API"""
         messages = []
         
-        # Add session history (Anthropic format)
+        # Add session history (Anthropic format); payload fragments are cached per message.
+        # Its summary goes in the system field instead, see _anthropic_system
         if session_history:
-            for msg in session_history[-10:]:  # Limit to last 10 messages
-                messages.append({
-                    "role": msg.get("role", "user"),
-                    "content": msg.get("content", "")
-                })
+            _, recent = self._split_history(session_history)
+            messages.extend(record.payload() for record in recent)
         
         # Add current message
         messages.append({
@@ -0,0 +1,376 @@
+"""
+Chat session storage backends
+"""
+
+import logging
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+from app.core.cache import LRUCache
+from app.core.config import settings
+from app.core.metrics import metrics, timed_methods
+from app.core.shared_state import SharedState, shared_state
+from app.models.chat import ChatSession
+from app.services.message_log import MessageLog, MessageRecord
+
+logger = logging.getLogger(__name__)
+
+INVALIDATION_NAMESPACE = "chat_session"
+
+STORE_SECONDS = metrics.histogram(
+    "chat_store_operation_seconds",
+    "Time spent in chat store operations",
+    ["backend", "operation"],
+    timing_name="store"
+)
+STORE_ERRORS = metrics.counter(
+    "chat_store_errors_total",
+    "Chat store operations that raised",
+    ["backend", "operation"]
+)
+
+# Stored sessions are metadata only; their messages are MessageRecords kept
+# next to them. recent() returns the most recent tier, which is what the AI
+# providers are sent, and messages() the whole history.
+
+@timed_methods(STORE_SECONDS, "memory", errors=STORE_ERRORS)
+class InMemoryChatStore:
+    """Sessions kept in process memory; state is not shared between workers.
+
+    Messages of each session are kept in a MessageLog, which packs older
+    messages into compressed segments.
+    """
+
+    def __init__(self, hot_limit: int, segment_size: int):
+        self.hot_limit = hot_limit
+        self.segment_size = segment_size
+        self.sessions: Dict[str, ChatSession] = {}
+        self.logs: Dict[str, MessageLog] = {}
+        self.workflow_sessions: Dict[str, List[str]] = {}
+
+    async def get(self, session_id: str) -> Optional[ChatSession]:
+        """Get session by ID"""
+        return self.sessions.get(session_id)
+
+    async def add(self, session: ChatSession):
+        """Store a new session"""
+        records = [MessageRecord.from_message(message) for message in session.messages]
+        session.messages = []
+        self.sessions[session.session_id] = session
+        self.logs[session.session_id] = MessageLog(records, self.hot_limit, self.segment_size)
+        self.workflow_sessions.setdefault(session.workflow_id, []).append(session.session_id)
+
+    async def append(self, session: ChatSession, record: MessageRecord) -> int:
+        """Append a message to a stored session; returns its message count"""
+        log = self.logs[session.session_id]
+        log.append(record)
+        session.last_activity = record.timestamp
+        return len(log)
+
+    async def recent(self, session: ChatSession) -> List[MessageRecord]:
+        """Most recent messages of a session, oldest first; not to be modified"""
+        log = self.logs.get(session.session_id)
+        return log.hot if log is not None else []
+
+    async def messages(self, session: ChatSession) -> List[MessageRecord]:
+        """All messages of a session, oldest first"""
+        log = self.logs.get(session.session_id)
+        return log.messages() if log is not None else []
+
+    async def count(self, session: ChatSession) -> int:
+        """Number of messages in a session"""
+        log = self.logs.get(session.session_id)
+        return len(log) if log is not None else 0
+
+    async def page(self, session: ChatSession, stop: Optional[int], limit: int) -> Tuple[int, List[MessageRecord]]:
+        """Message count and up to ``limit`` messages ending before position ``stop`` (None: the end)"""
+        log = self.logs.get(session.session_id)
+        if log is None:
+            return 0, []
+        count = len(log)
+        stop = count if stop is None else min(stop, count)
+        return count, log.slice(max(stop - limit, 0), stop)
+
+    async def drop_oldest(self, session: ChatSession, count: int) -> List[MessageRecord]:
+        """Remove and return the oldest messages of a session"""
+        return self.logs[session.session_id].drop_oldest(count)
+
+    async def save_metadata(self, session: ChatSession):
+        """Store a change to the session's metadata"""
+
+    async def touch(self, session: ChatSession, when: datetime):
+        """Record activity on a session"""
+        session.last_activity = when
+
+    async def list_for_workflow(self, workflow_id: str) -> List[ChatSession]:
+        """Sessions of a workflow, in no particular order"""
+        return [
+            self.sessions[session_id]
+            for session_id in self.workflow_sessions.get(workflow_id, ())
+            if session_id in self.sessions
+        ]
+
+    async def remove(self, session: ChatSession):
+        """Delete a session"""
+        self.sessions.pop(session.session_id, None)
+        self.logs.pop(session.session_id, None)
+        session_ids = self.workflow_sessions.get(session.workflow_id)
+        if session_ids is not None:
+            self.workflow_sessions[session.workflow_id] = [
+                sid for sid in session_ids if sid != session.session_id
+            ]
+            if not self.workflow_sessions[session.workflow_id]:
+                del self.workflow_sessions[session.workflow_id]
+
+    async def all_sessions(self) -> List[ChatSession]:
+        """Every stored session"""
+        return list(self.sessions.values())
+
+@timed_methods(STORE_SECONDS, "redis", errors=STORE_ERRORS)
+class RedisChatStore:
+    """Sessions kept in Redis and shared by all workers.
+
+    A session is a hash holding its metadata and last activity, plus a list
+    of messages, so appending a message is an RPUSH rather than a rewrite
+    of the session. Each workflow has a sorted set of its sessions by last
+    activity. Keys expire after chat_memory_ttl without activity. Only the
+    most recent messages are loaded with a session.
+
+    Sessions are cached per worker together with their recent messages.
+    Writes go out as one MULTI pipeline
+    that also publishes an invalidation, and other workers drop their copy
+    when it arrives. Loading several sessions is a single pipeline; sessions
+    invalidated while it was in flight are returned but not cached.
+    """
+
+    def __init__(self, cache_size: int, shared: SharedState, ttl: int, hot_limit: int):
+        self.cache = LRUCache(cache_size)
+        self.shared = shared
+        self.ttl = ttl
+        self.hot_limit = hot_limit
+        # Chat invalidations carry no version: each one is numbered, and
+        # the number of the latest is kept per session
+        self.invalidations = 0
+        self.invalidated = LRUCache(cache_size)
+        self.last_reset = 0
+
+        shared.subscribe(INVALIDATION_NAMESPACE, self._invalidate, reset=self._reset)
+
+    def _session_key(self, session_id: str) -> str:
+        return self.shared.key(INVALIDATION_NAMESPACE, session_id)
+
+    def _messages_key(self, session_id: str) -> str:
+        return self.shared.key("chat_messages", session_id)
+
+    def _workflow_key(self, workflow_id: str) -> str:
+        return self.shared.key("chat_workflow", workflow_id)
+
+    async def get(self, session_id: str) -> Optional[ChatSession]:
+        """Get session by ID, loading it from Redis on a cache miss"""
+        entries = await self._get_many([session_id])
+        entry = entries.get(session_id)
+        return entry[0] if entry is not None else None
+
+    async def _get_many(self, session_ids: List[str]) -> Dict[str, Tuple[ChatSession, List[MessageRecord]]]:
+        """Sessions and their recent messages, from the cache or one pipeline"""
+        await self.shared.refresh()
+
+        found: Dict[str, Tuple[ChatSession, List[MessageRecord]]] = {}
+        missing = []
+        for session_id in session_ids:
+            entry = self.cache.get(session_id)
+            if entry is not None:
+                found[session_id] = entry
+            else:
+                missing.append(session_id)
+        if not missing:
+            return found
+
+        started = self.invalidations
+        pipeline = self.shared.client.pipeline(transaction=False)
+        for session_id in missing:
+            pipeline.hmget(self._session_key(session_id), "meta", "last_activity")
+            pipeline.lrange(self._messages_key(session_id), -self.hot_limit, -1)
+        rows = await pipeline.execute()
+
+        for index, session_id in enumerate(missing):
+            (meta, last_activity), messages = rows[2 * index], rows[2 * index + 1]
+            if meta is None:
+                continue
+            session = ChatSession.model_validate_json(meta)
+            session.last_activity = datetime.fromisoformat(last_activity.decode())
+            entry = (session, [MessageRecord.from_json(message) for message in messages])
+            if started >= self.last_reset and self.invalidated.get(session_id, 0) <= started:
+                self.cache.set(session_id, entry)
+            found[session_id] = entry
+
+        return found
+
+    async def add(self, session: ChatSession):
+        """Store a new session"""
+        records = [MessageRecord.from_message(message) for message in session.messages]
+        session.messages = []
+
+        pipeline = self.shared.client.pipeline(transaction=True)
+        key = self._session_key(session.session_id)
+        pipeline.hset(key, mapping={
+            "meta": session.model_dump_json(exclude={"messages", "last_activity"}),
+            "last_activity": session.last_activity.isoformat()
+        })
+        pipeline.expire(key, self.ttl)
+        self._index(pipeline, session)
+        if records:
+            messages_key = self._messages_key(session.session_id)
+            pipeline.rpush(messages_key, *(record.to_json() for record in records))
+            pipeline.expire(messages_key, self.ttl)
+        pipeline.publish(self.shared.channel, self.shared.message(INVALIDATION_NAMESPACE, session.session_id))
+        await pipeline.execute()
+        self.cache.set(session.session_id, (session, records[-self.hot_limit:]))
+
+    async def append(self, session: ChatSession, record: MessageRecord) -> int:
+        """Append a message to a stored session; returns its message count"""
+        entry = self.cache.get(session.session_id)
+        if entry is not None:
+            records = entry[1]
+            records.append(record)
+            del records[:-self.hot_limit]
+        session.last_activity = record.timestamp
+
+        pipeline = self.shared.client.pipeline(transaction=True)
+        messages_key = self._messages_key(session.session_id)
+        pipeline.rpush(messages_key, record.to_json())
+        pipeline.expire(messages_key, self.ttl)
+        self._touch(pipeline, session)
+        count, *_ = await pipeline.execute()
+        return count
+
+    async def recent(self, session: ChatSession) -> List[MessageRecord]:
+        """Most recent messages of a session, oldest first; not to be modified"""
+        entry = (await self._get_many([session.session_id])).get(session.session_id)
+        return entry[1] if entry is not None else []
+
+    async def messages(self, session: ChatSession) -> List[MessageRecord]:
+        """All messages of a session, oldest first"""
+        messages = await self.shared.client.lrange(self._messages_key(session.session_id), 0, -1)
+        return [MessageRecord.from_json(message) for message in messages]
+
+    async def count(self, session: ChatSession) -> int:
+        """Number of messages in a session"""
+        return await self.shared.client.llen(self._messages_key(session.session_id))
+
+    async def page(self, session: ChatSession, stop: Optional[int], limit: int) -> Tuple[int, List[MessageRecord]]:
+        """Message count and up to ``limit`` messages ending before position ``stop`` (None: the end)"""
+        if limit <= 0 or stop is not None and stop <= 0:
+            return await self.count(session), []
+
+        pipeline = self.shared.client.pipeline(transaction=True)
+        messages_key = self._messages_key(session.session_id)
+        pipeline.llen(messages_key)
+        if stop is None:
+            pipeline.lrange(messages_key, -limit, -1)
+        else:
+            pipeline.lrange(messages_key, max(stop - limit, 0), stop - 1)
+        count, messages = await pipeline.execute()
+        return count, [MessageRecord.from_json(message) for message in messages]
+
+    async def drop_oldest(self, session: ChatSession, count: int) -> List[MessageRecord]:
+        """Remove and return the oldest messages of a session"""
+        pipeline = self.shared.client.pipeline(transaction=True)
+        messages_key = self._messages_key(session.session_id)
+        pipeline.lrange(messages_key, 0, count - 1)
+        pipeline.ltrim(messages_key, count, -1)
+        pipeline.llen(messages_key)
+        pipeline.publish(self.shared.channel, self.shared.message(INVALIDATION_NAMESPACE, session.session_id))
+        dropped, _, remaining, _ = await pipeline.execute()
+
+        entry = self.cache.get(session.session_id)
+        if entry is not None and remaining < len(entry[1]):
+            del entry[1][:len(entry[1]) - remaining]
+        return [MessageRecord.from_json(message) for message in dropped]
+
+    async def save_metadata(self, session: ChatSession):
+        """Store a change to the session's metadata"""
+        pipeline = self.shared.client.pipeline(transaction=True)
+        pipeline.hset(
+            self._session_key(session.session_id),
+            "meta",
+            session.model_dump_json(exclude={"messages", "last_activity"})
+        )
+        pipeline.publish(self.shared.channel, self.shared.message(INVALIDATION_NAMESPACE, session.session_id))
+        await pipeline.execute()
+
+    async def touch(self, session: ChatSession, when: datetime):
+        """Record activity on a session"""
+        session.last_activity = when
+
+        pipeline = self.shared.client.pipeline(transaction=True)
+        self._touch(pipeline, session)
+        await pipeline.execute()
+
+    def _touch(self, pipeline, session: ChatSession):
+        key = self._session_key(session.session_id)
+        pipeline.hset(key, "last_activity", session.last_activity.isoformat())
+        pipeline.expire(key, self.ttl)
+        self._index(pipeline, session)
+        pipeline.publish(self.shared.channel, self.shared.message(INVALIDATION_NAMESPACE, session.session_id))
+
+    def _index(self, pipeline, session: ChatSession):
+        workflow_key = self._workflow_key(session.workflow_id)
+        pipeline.zadd(workflow_key, {session.session_id: session.last_activity.timestamp()})
+        pipeline.expire(workflow_key, self.ttl)
+
+    async def list_for_workflow(self, workflow_id: str) -> List[ChatSession]:
+        """Sessions of a workflow, most recently active first"""
+        workflow_key = self._workflow_key(workflow_id)
+        session_ids = [
+            session_id.decode()
+            for session_id in await self.shared.client.zrevrange(workflow_key, 0, -1)
+        ]
+        entries = await self._get_many(session_ids)
+
+        expired = [session_id for session_id in session_ids if session_id not in entries]
+        if expired:
+            await self.shared.client.zrem(workflow_key, *expired)
+        return [entries[session_id][0] for session_id in session_ids if session_id in entries]
+
+    async def remove(self, session: ChatSession):
+        """Delete a session"""
+        pipeline = self.shared.client.pipeline(transaction=True)
+        pipeline.delete(self._session_key(session.session_id), self._messages_key(session.session_id))
+        pipeline.zrem(self._workflow_key(session.workflow_id), session.session_id)
+        pipeline.publish(self.shared.channel, self.shared.message(INVALIDATION_NAMESPACE, session.session_id))
+        await pipeline.execute()
+        self.cache.pop(session.session_id)
+
+    async def all_sessions(self) -> List[ChatSession]:
+        """Every stored session; walks the keyspace, so meant for maintenance only"""
+        prefix = self._session_key("")
+        session_ids = [
+            key.decode()[len(prefix):]
+            async for key in self.shared.client.scan_iter(match=f"{prefix}*", count=500)
+        ]
+        return [session for session, _ in (await self._get_many(session_ids)).values()]
+
+    def _invalidate(self, session_id: str, version: Optional[int]):
+        self.invalidations += 1
+        self.invalidated.set(session_id, self.invalidations)
+        self.cache.pop(session_id)
+
+    def _reset(self):
+        self.invalidations += 1
+        self.last_reset = self.invalidations
+        self.cache.clear()
+
+def create_chat_store():
+    """Create the chat store selected by settings"""
+
+    if settings.chat_storage == "memory":
+        return InMemoryChatStore(settings.chat_hot_messages, settings.chat_segment_size)
+    if settings.chat_storage != "redis":
+        raise ValueError(f"Unknown chat storage: {settings.chat_storage}")
+    logger.info("Using Redis chat storage")
+    return RedisChatStore(
+        settings.chat_cache_size,
+        shared_state,
+        settings.chat_memory_ttl,
+        settings.chat_hot_messages
+    )
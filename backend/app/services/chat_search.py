@@ -0,0 +1,653 @@
+"""
+Full-text search over chat messages
+"""
+
+import abc
+import asyncio
+import heapq
+import html
+import logging
+import math
+import re
+import time
+from array import array
+from bisect import bisect_left
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import text
+
+from app.core.config import settings
+from app.core.database import IS_SQLITE, engine, read_engine
+from app.models.chat import ChatSearchHit, ChatSession
+from app.services.message_log import ROLE_CODES, MessageRecord, from_epoch_ms
+
+logger = logging.getLogger(__name__)
+
+# Words in any script, like the unicode61 tokenizer of SQLite FTS5 and the
+# "simple" text search configuration of PostgreSQL
+TOKEN_PATTERN = re.compile(r"\w+")
+
+# Longer tokens are IDs or encoded blobs rather than words
+MAX_TOKEN_CHARS = 40
+
+# BM25 parameters
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# Snippet length around the first match
+SNIPPET_CHARS = 160
+
+# Match markers in snippets: the databases mark matches with these private
+# use characters, which are replaced once the text is HTML-escaped
+MATCH_START = "\ue000"
+MATCH_END = "\ue001"
+
+# The in-memory index is compacted once deleted messages outnumber live ones
+COMPACT_MIN_DELETED = 50000
+
+# How often a worker deletes the indexed messages of expired sessions
+PRUNE_INTERVAL_SECONDS = 600
+
+def tokenize(text: str) -> List[str]:
+    """Split text into lowercase words"""
+    return [
+        token for token in TOKEN_PATTERN.findall(text.lower())
+        if len(token) <= MAX_TOKEN_CHARS
+    ] if text else []
+
+def render_snippet(marked: str) -> str:
+    """HTML-escape a snippet and turn match markers into <mark> tags"""
+    return html.escape(marked).replace(MATCH_START, "<mark>").replace(MATCH_END, "</mark>")
+
+def make_snippet(content: str, terms: List[str]) -> str:
+    """Snippet of a message around its first match, with matches marked"""
+
+    wanted = set(terms)
+    matches = [
+        match for match in TOKEN_PATTERN.finditer(content)
+        if match.group().lower() in wanted
+    ]
+    if not matches:
+        return render_snippet(content[:SNIPPET_CHARS])
+
+    start = max(matches[0].start() - SNIPPET_CHARS // 4, 0)
+    end = min(start + SNIPPET_CHARS, len(content))
+    parts = ["…"] if start > 0 else []
+    position = start
+    for match in matches:
+        if match.end() > end:
+            break
+        parts += [content[position:match.start()], MATCH_START, match.group(), MATCH_END]
+        position = match.end()
+    parts.append(content[position:end])
+    if end < len(content):
+        parts.append("…")
+    return render_snippet("".join(parts))
+
+def _time_bounds(since: Optional[int], until: Optional[int]) -> Tuple[int, int]:
+    return (since if since is not None else -(2 ** 63), until if until is not None else 2 ** 63 - 1)
+
+class _Posting:
+    """Documents containing a term, ascending, and the term's frequency in each"""
+
+    __slots__ = ("docs", "frequencies")
+
+    def __init__(self):
+        self.docs = array("I")
+        self.frequencies = array("H")
+
+class InMemoryChatIndex:
+    """Inverted index over the messages of the in-memory chat store.
+
+    Messages are numbered in the order they are indexed. Postings and the
+    per-message columns (session, workflow, role, time, length) are
+    arrays, so millions of messages take tens of bytes each besides their
+    terms. Times are kept non-decreasing in that order, so a time range is
+    a range of message numbers found by bisection.
+
+    Queries match messages containing every term and rank them with BM25.
+    Candidates come from the rarest term's posting, or from the messages
+    of the workflow filtered on when there are fewer, newest first; at most
+    chat_search_max_candidates of them are examined, which bounds the cost
+    of very common terms. Deleted messages are flagged and dropped
+    from the arrays when the index is compacted. The text of a hit is
+    read back from the chat store for its snippet.
+    """
+
+    def __init__(self, store, max_candidates: int):
+        self.store = store
+        self.max_candidates = max_candidates
+        self.postings: Dict[str, _Posting] = {}
+
+        self.session_ids: List[str] = []
+        self.session_codes: Dict[str, int] = {}
+        self.session_docs: Dict[str, array] = {}
+        self.workflow_ids: List[str] = []
+        self.workflow_codes: Dict[str, int] = {}
+        self.workflow_docs: Dict[int, array] = {}
+
+        self.doc_sessions = array("I")
+        self.doc_workflows = array("I")
+        self.doc_roles = bytearray()
+        self.doc_times = array("q")
+        self.doc_lengths = array("I")
+        self.doc_positions = array("I")
+        self.alive = bytearray()
+        self.live = 0
+        self.total_length = 0
+
+    def __len__(self) -> int:
+        return self.live
+
+    async def add(self, session: ChatSession, record: MessageRecord, position: int):
+        """Index a message; ``position`` is its number within the session"""
+
+        doc = len(self.alive)
+        session_code = self._code(session.session_id, self.session_ids, self.session_codes)
+        workflow_code = self._code(session.workflow_id, self.workflow_ids, self.workflow_codes)
+
+        terms = Counter(tokenize(record.content))
+        for term, frequency in terms.items():
+            posting = self.postings.get(term)
+            if posting is None:
+                posting = self.postings[term] = _Posting()
+            posting.docs.append(doc)
+            posting.frequencies.append(min(frequency, 0xFFFF))
+        length = sum(terms.values())
+
+        last_time = self.doc_times[-1] if self.doc_times else record.timestamp_ms
+        self.doc_sessions.append(session_code)
+        self.doc_workflows.append(workflow_code)
+        self.doc_roles.append(ROLE_CODES[record.role])
+        self.doc_times.append(max(record.timestamp_ms, last_time))
+        self.doc_lengths.append(length)
+        self.doc_positions.append(position)
+        self.alive.append(1)
+        self.live += 1
+        self.total_length += length
+        self.session_docs.setdefault(session.session_id, array("I")).append(doc)
+        self.workflow_docs.setdefault(workflow_code, array("I")).append(doc)
+
+    async def trim(self, session_id: str, before: int):
+        """Drop messages of a session numbered below ``before``"""
+
+        docs = self.session_docs.get(session_id)
+        if not docs:
+            return
+        kept = 0
+        while kept < len(docs) and self.doc_positions[docs[kept]] < before:
+            self._delete(docs[kept])
+            kept += 1
+        del docs[:kept]
+        self._maybe_compact()
+
+    async def remove_session(self, session_id: str):
+        """Drop every message of a session"""
+
+        for doc in self.session_docs.pop(session_id, ()):
+            self._delete(doc)
+        self._maybe_compact()
+
+    async def search(
+        self,
+        query: str,
+        workflow_id: Optional[str] = None,
+        role: Optional[str] = None,
+        since: Optional[int] = None,
+        until: Optional[int] = None,
+        limit: int = 20
+    ) -> List[ChatSearchHit]:
+        """Best matches for all terms of a query, within the filters; times in epoch ms"""
+
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms:
+            return []
+        postings = [self.postings.get(term) for term in terms]
+        if any(posting is None for posting in postings):
+            return []
+        postings.sort(key=lambda posting: len(posting.docs))
+
+        workflow_code = self.workflow_codes.get(workflow_id) if workflow_id else None
+        if workflow_id and workflow_code is None:
+            return []
+        role_code = ROLE_CODES.get(role) if role else None
+        if role and role_code is None:
+            return []
+
+        # Time filters narrow the message numbers to a range
+        lowest, highest = _time_bounds(since, until)
+        first_doc = bisect_left(self.doc_times, lowest)
+        end_doc = bisect_left(self.doc_times, highest)
+
+        document_count = self.live or 1
+        average_length = self.total_length / document_count or 1.0
+        idfs = [
+            math.log(1 + (document_count - len(posting.docs) + 0.5) / (len(posting.docs) + 0.5))
+            for posting in postings
+        ]
+
+        # Walk the shortest list of messages that must contain every match,
+        # newest first: the rarest term's posting, or the workflow's messages
+        workflow_docs = self.workflow_docs.get(workflow_code) if workflow_code is not None else None
+        if workflow_docs is not None and len(workflow_docs) < len(postings[0].docs):
+            driver, driver_frequencies, driver_idf = workflow_docs, None, 0.0
+            checked, checked_idfs = postings, idfs
+        else:
+            driver, driver_frequencies, driver_idf = postings[0].docs, postings[0].frequencies, idfs[0]
+            checked, checked_idfs = postings[1:], idfs[1:]
+            workflow_docs = None
+        # Other postings are searched below the previous hit, as docs only decrease
+        bounds = [len(posting.docs) for posting in checked]
+
+        alive, doc_lengths = self.alive, self.doc_lengths
+        doc_workflows, doc_roles = self.doc_workflows, self.doc_roles
+        best: List[Tuple[float, int]] = []
+        index = bisect_left(driver, end_doc) - 1
+        stop = max(bisect_left(driver, first_doc), index + 1 - self.max_candidates)
+
+        while index >= stop:
+            doc = driver[index]
+            frequency = driver_frequencies[index] if driver_frequencies is not None else 0
+            index -= 1
+            if not alive[doc]:
+                continue
+            if workflow_code is not None and workflow_docs is None and doc_workflows[doc] != workflow_code:
+                continue
+            if role_code is not None and doc_roles[doc] != role_code:
+                continue
+
+            length_norm = BM25_K1 * (1 - BM25_B + BM25_B * doc_lengths[doc] / average_length)
+            score = driver_idf * frequency * (BM25_K1 + 1) / (frequency + length_norm)
+            for number, posting in enumerate(checked):
+                position = bisect_left(posting.docs, doc, 0, bounds[number])
+                bounds[number] = position + 1
+                if position == len(posting.docs) or posting.docs[position] != doc:
+                    break
+                other = posting.frequencies[position]
+                score += checked_idfs[number] * other * (BM25_K1 + 1) / (other + length_norm)
+            else:
+                if len(best) < limit:
+                    heapq.heappush(best, (score, doc))
+                elif score > best[0][0]:
+                    heapq.heapreplace(best, (score, doc))
+
+        hits = []
+        for score, doc in sorted(best, reverse=True):
+            hit = await self._hit(doc, score, terms)
+            if hit is not None:
+                hits.append(hit)
+        return hits
+
+    async def _hit(self, doc: int, score: float, terms: List[str]) -> Optional[ChatSearchHit]:
+        """Search hit for a message, reading its text from the chat store"""
+
+        session_id = self.session_ids[self.doc_sessions[doc]]
+        session = await self.store.get(session_id)
+        if session is None:
+            return None
+        trimmed = (session.metadata or {}).get("trimmed_messages", 0)
+        stop = self.doc_positions[doc] - trimmed + 1
+        if stop <= 0:
+            return None
+        _, records = await self.store.page(session, stop, 1)
+        if not records:
+            return None
+
+        record = records[0]
+        return ChatSearchHit(
+            session_id=session_id,
+            workflow_id=session.workflow_id,
+            message_id=record.message_id,
+            role=record.role,
+            timestamp=record.timestamp,
+            score=score,
+            snippet=make_snippet(record.content, terms)
+        )
+
+    @staticmethod
+    def _code(value: str, values: List[str], codes: Dict[str, int]) -> int:
+        code = codes.get(value)
+        if code is None:
+            code = codes[value] = len(values)
+            values.append(value)
+        return code
+
+    def _delete(self, doc: int):
+        if self.alive[doc]:
+            self.alive[doc] = 0
+            self.live -= 1
+            self.total_length -= self.doc_lengths[doc]
+
+    def _maybe_compact(self):
+        deleted = len(self.alive) - self.live
+        if deleted >= COMPACT_MIN_DELETED and deleted > self.live:
+            self._compact()
+
+    def _compact(self):
+        """Renumber live messages and drop deleted ones from every array"""
+
+        started = time.perf_counter()
+        kept = [doc for doc, alive in enumerate(self.alive) if alive]
+        renumbered = array("i", [-1]) * len(self.alive)
+        for new, doc in enumerate(kept):
+            renumbered[doc] = new
+
+        for term in list(self.postings):
+            posting = self.postings[term]
+            compacted = _Posting()
+            for doc, frequency in zip(posting.docs, posting.frequencies):
+                new = renumbered[doc]
+                if new >= 0:
+                    compacted.docs.append(new)
+                    compacted.frequencies.append(frequency)
+            if compacted.docs:
+                self.postings[term] = compacted
+            else:
+                del self.postings[term]
+
+        # Live messages all belong to sessions still in session_docs
+        self.session_ids = list(self.session_docs)
+        session_codes = {session_id: code for code, session_id in enumerate(self.session_ids)}
+        recoded = {self.session_codes[session_id]: code for session_id, code in session_codes.items()}
+        self.session_codes = session_codes
+        self.doc_sessions = array("I", (recoded[self.doc_sessions[doc]] for doc in kept))
+
+        for column in ("doc_workflows", "doc_times", "doc_lengths", "doc_positions"):
+            values = getattr(self, column)
+            setattr(self, column, array(values.typecode, (values[doc] for doc in kept)))
+        self.doc_roles = bytearray(self.doc_roles[doc] for doc in kept)
+        self.alive = bytearray(b"\x01") * len(kept)
+        for session_id, docs in self.session_docs.items():
+            self.session_docs[session_id] = array("I", (renumbered[doc] for doc in docs))
+        for code, docs in list(self.workflow_docs.items()):
+            live_docs = array("I", (renumbered[doc] for doc in docs if renumbered[doc] >= 0))
+            if live_docs:
+                self.workflow_docs[code] = live_docs
+            else:
+                del self.workflow_docs[code]
+
+        logger.info(
+            f"Compacted chat search index to {len(kept)} messages "
+            f"in {time.perf_counter() - started:.2f}s"
+        )
+
+class _SqlChatIndex(abc.ABC):
+    """Messages indexed in a database table, written and queried off the event loop.
+
+    The table outlives the sessions of the chat store. The last activity of
+    each indexed session is kept in chat_search_sessions; with a ``ttl``
+    (sessions expiring in Redis) the messages of sessions idle for longer
+    are deleted every PRUNE_INTERVAL_SECONDS, and hits in sessions the
+    store no longer has are dropped from results.
+    """
+
+    SCHEMA: Tuple[str, ...] = ()
+
+    def __init__(self, store, ttl: Optional[int] = None):
+        self.store = store
+        self.ttl = ttl
+        self.schema_ready = False
+        self.next_prune = 0.0
+
+    def _ensure_schema(self):
+        if not self.schema_ready:
+            with engine.begin() as connection:
+                for statement in self.SCHEMA:
+                    connection.execute(text(statement))
+            self.schema_ready = True
+
+    async def add(self, session: ChatSession, record: MessageRecord, position: int):
+        """Index a message; ``position`` is its number within the session"""
+        await asyncio.to_thread(self._add, session.session_id, session.workflow_id, record, position)
+        if self.ttl is not None and time.monotonic() >= self.next_prune:
+            self.next_prune = time.monotonic() + PRUNE_INTERVAL_SECONDS
+            await asyncio.to_thread(self._prune, int((time.time() - self.ttl) * 1000))
+
+    def _add(self, session_id: str, workflow_id: str, record: MessageRecord, position: int):
+        self._ensure_schema()
+        with engine.begin() as connection:
+            connection.execute(
+                text(
+                    "INSERT INTO chat_search_sessions (session_id, last_activity_ms) "
+                    "VALUES (:session_id, :last_activity_ms) "
+                    "ON CONFLICT (session_id) DO UPDATE SET last_activity_ms = excluded.last_activity_ms"
+                ),
+                {"session_id": session_id, "last_activity_ms": int(time.time() * 1000)}
+            )
+            connection.execute(
+                text(
+                    "INSERT INTO chat_search_messages "
+                    "(session_id, workflow_id, message_id, role, created_ms, seq, content) "
+                    "VALUES (:session_id, :workflow_id, :message_id, :role, :created_ms, :seq, :content)"
+                ),
+                {
+                    "session_id": session_id,
+                    "workflow_id": workflow_id,
+                    "message_id": record.message_id,
+                    "role": record.role,
+                    "created_ms": record.timestamp_ms,
+                    "seq": position,
+                    "content": record.content
+                }
+            )
+
+    async def trim(self, session_id: str, before: int):
+        """Drop messages of a session numbered below ``before``"""
+        await asyncio.to_thread(
+            self._delete,
+            "session_id = :session_id AND seq < :before",
+            {"session_id": session_id, "before": before}
+        )
+
+    async def remove_session(self, session_id: str):
+        """Drop every message of a session"""
+        await asyncio.to_thread(self._remove_sessions, [session_id])
+
+    def _delete(self, condition: str, parameters: Dict):
+        self._ensure_schema()
+        with engine.begin() as connection:
+            connection.execute(text(f"DELETE FROM chat_search_messages WHERE {condition}"), parameters)
+
+    def _remove_sessions(self, session_ids: List[str]):
+        self._ensure_schema()
+        with engine.begin() as connection:
+            for session_id in session_ids:
+                parameters = {"session_id": session_id}
+                connection.execute(text("DELETE FROM chat_search_messages WHERE session_id = :session_id"), parameters)
+                connection.execute(text("DELETE FROM chat_search_sessions WHERE session_id = :session_id"), parameters)
+
+    def _prune(self, cutoff_ms: int):
+        """Delete the messages of sessions without activity since ``cutoff_ms``"""
+        self._ensure_schema()
+        with engine.begin() as connection:
+            connection.execute(
+                text(
+                    "DELETE FROM chat_search_messages WHERE session_id IN ("
+                    "SELECT session_id FROM chat_search_sessions WHERE last_activity_ms < :cutoff)"
+                ),
+                {"cutoff": cutoff_ms}
+            )
+            removed = connection.execute(
+                text("DELETE FROM chat_search_sessions WHERE last_activity_ms < :cutoff"),
+                {"cutoff": cutoff_ms}
+            ).rowcount
+        if removed:
+            logger.info(f"Removed {removed} expired chat sessions from the search index")
+
+    async def search(
+        self,
+        query: str,
+        workflow_id: Optional[str] = None,
+        role: Optional[str] = None,
+        since: Optional[int] = None,
+        until: Optional[int] = None,
+        limit: int = 20
+    ) -> List[ChatSearchHit]:
+        """Best matches for all terms of a query, within the filters; times in epoch ms"""
+
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms:
+            return []
+
+        conditions = []
+        parameters = {"limit": limit}
+        if workflow_id:
+            conditions.append("m.workflow_id = :workflow_id")
+            parameters["workflow_id"] = workflow_id
+        if role:
+            conditions.append("m.role = :role")
+            parameters["role"] = role
+        if since is not None:
+            conditions.append("m.created_ms >= :since")
+            parameters["since"] = since
+        if until is not None:
+            conditions.append("m.created_ms < :until")
+            parameters["until"] = until
+
+        rows = await asyncio.to_thread(self._search, terms, conditions, parameters)
+
+        # Sessions may have expired from the store before they were pruned here
+        gone = [
+            session_id for session_id in dict.fromkeys(row[0] for row in rows)
+            if await self.store.get(session_id) is None
+        ]
+        if gone:
+            await asyncio.to_thread(self._remove_sessions, gone)
+        return [
+            ChatSearchHit(
+                session_id=session_id,
+                workflow_id=workflow_id,
+                message_id=message_id,
+                role=role,
+                timestamp=from_epoch_ms(created_ms),
+                score=score,
+                snippet=render_snippet(snippet)
+            )
+            for session_id, workflow_id, message_id, role, created_ms, snippet, score in rows
+            if session_id not in gone
+        ]
+
+    @abc.abstractmethod
+    def _search(self, terms: List[str], conditions: List[str], parameters: Dict) -> List[tuple]:
+        """Rows of (session_id, workflow_id, message_id, role, created_ms, snippet, score)"""
+
+class SqliteChatIndex(_SqlChatIndex):
+    """Messages indexed with SQLite FTS5 and ranked with its bm25().
+
+    The FTS table takes its text from chat_search_messages (external
+    content), and triggers keep it in step, so deleting a session is an
+    indexed delete on the messages table.
+    """
+
+    SCHEMA = (
+        "CREATE TABLE IF NOT EXISTS chat_search_messages ("
+        "id INTEGER PRIMARY KEY, session_id TEXT NOT NULL, workflow_id TEXT NOT NULL, "
+        "message_id TEXT, role TEXT NOT NULL, created_ms INTEGER NOT NULL, "
+        "seq INTEGER NOT NULL, content TEXT NOT NULL)",
+        "CREATE INDEX IF NOT EXISTS ix_chat_search_messages_session "
+        "ON chat_search_messages (session_id, seq)",
+        "CREATE TABLE IF NOT EXISTS chat_search_sessions ("
+        "session_id TEXT PRIMARY KEY, last_activity_ms INTEGER NOT NULL)",
+        "CREATE INDEX IF NOT EXISTS ix_chat_search_sessions_activity "
+        "ON chat_search_sessions (last_activity_ms)",
+        # Sessions indexed before their activity was recorded
+        "INSERT OR IGNORE INTO chat_search_sessions (session_id, last_activity_ms) "
+        "SELECT session_id, MAX(created_ms) FROM chat_search_messages "
+        "WHERE session_id NOT IN (SELECT session_id FROM chat_search_sessions) GROUP BY session_id",
+        "CREATE VIRTUAL TABLE IF NOT EXISTS chat_search_fts USING fts5("
+        "content, content='chat_search_messages', content_rowid='id', "
+        "tokenize='unicode61 remove_diacritics 2')",
+        "CREATE TRIGGER IF NOT EXISTS chat_search_messages_insert AFTER INSERT ON chat_search_messages "
+        "BEGIN INSERT INTO chat_search_fts (rowid, content) VALUES (new.id, new.content); END",
+        "CREATE TRIGGER IF NOT EXISTS chat_search_messages_delete AFTER DELETE ON chat_search_messages "
+        "BEGIN INSERT INTO chat_search_fts (chat_search_fts, rowid, content) "
+        "VALUES ('delete', old.id, old.content); END",
+    )
+
+    def _search(self, terms: List[str], conditions: List[str], parameters: Dict) -> List[tuple]:
+        self._ensure_schema()
+
+        # Each term quoted, so user input is never read as FTS5 query syntax
+        parameters["query"] = " ".join('"' + term.replace('"', '""') + '"' for term in terms)
+        parameters["start"], parameters["end"] = MATCH_START, MATCH_END
+        where = "".join(f" AND {condition}" for condition in conditions)
+
+        with read_engine.connect() as connection:
+            return connection.execute(
+                text(
+                    "SELECT m.session_id, m.workflow_id, m.message_id, m.role, m.created_ms, "
+                    "snippet(chat_search_fts, 0, :start, :end, '…', 24), -bm25(chat_search_fts) "
+                    "FROM chat_search_fts JOIN chat_search_messages AS m ON m.id = chat_search_fts.rowid "
+                    f"WHERE chat_search_fts MATCH :query{where} "
+                    "ORDER BY bm25(chat_search_fts) LIMIT :limit"
+                ),
+                parameters
+            ).all()
+
+class PostgresChatIndex(_SqlChatIndex):
+    """Messages indexed with a generated tsvector column and a GIN index.
+
+    Uses the "simple" configuration (no stemming or stop words), since chats
+    mix languages. Rows are ranked with ts_rank_cd and only the page of
+    results is passed through ts_headline.
+    """
+
+    SCHEMA = (
+        "CREATE TABLE IF NOT EXISTS chat_search_messages ("
+        "id BIGSERIAL PRIMARY KEY, session_id TEXT NOT NULL, workflow_id TEXT NOT NULL, "
+        "message_id TEXT, role TEXT NOT NULL, created_ms BIGINT NOT NULL, "
+        "seq INTEGER NOT NULL, content TEXT NOT NULL, "
+        "document TSVECTOR GENERATED ALWAYS AS (to_tsvector('simple', content)) STORED)",
+        "CREATE INDEX IF NOT EXISTS ix_chat_search_messages_document "
+        "ON chat_search_messages USING GIN (document)",
+        "CREATE INDEX IF NOT EXISTS ix_chat_search_messages_session "
+        "ON chat_search_messages (session_id, seq)",
+        "CREATE TABLE IF NOT EXISTS chat_search_sessions ("
+        "session_id TEXT PRIMARY KEY, last_activity_ms BIGINT NOT NULL)",
+        "CREATE INDEX IF NOT EXISTS ix_chat_search_sessions_activity "
+        "ON chat_search_sessions (last_activity_ms)",
+        # Sessions indexed before their activity was recorded
+        "INSERT INTO chat_search_sessions (session_id, last_activity_ms) "
+        "SELECT session_id, MAX(created_ms) FROM chat_search_messages "
+        "WHERE session_id NOT IN (SELECT session_id FROM chat_search_sessions) GROUP BY session_id "
+        "ON CONFLICT (session_id) DO NOTHING",
+    )
+
+    HEADLINE_OPTIONS = f"StartSel={MATCH_START}, StopSel={MATCH_END}, MaxWords=30, MinWords=10"
+
+    def _search(self, terms: List[str], conditions: List[str], parameters: Dict) -> List[tuple]:
+        self._ensure_schema()
+
+        parameters["query"] = " ".join(terms)
+        parameters["options"] = self.HEADLINE_OPTIONS
+        where = "".join(f" AND {condition}" for condition in conditions)
+
+        with read_engine.connect() as connection:
+            return connection.execute(
+                text(
+                    "SELECT m.session_id, m.workflow_id, m.message_id, m.role, m.created_ms, "
+                    "ts_headline('simple', m.content, m.query, :options), m.score FROM ("
+                    "SELECT m.*, query, ts_rank_cd(m.document, query) AS score "
+                    "FROM chat_search_messages AS m, plainto_tsquery('simple', :query) AS query "
+                    f"WHERE m.document @@ query{where} "
+                    "ORDER BY score DESC LIMIT :limit) AS m ORDER BY m.score DESC"
+                ),
+                parameters
+            ).all()
+
+def create_chat_index(store):
+    """Create the chat search index selected by settings, or None when search is off"""
+
+    backend = settings.chat_search
+    if backend == "auto":
+        backend = "memory" if settings.chat_storage == "memory" else "database"
+    if backend == "off":
+        return None
+    if backend == "memory":
+        return InMemoryChatIndex(store, settings.chat_search_max_candidates)
+    if backend != "database":
+        raise ValueError(f"Unknown chat search backend: {settings.chat_search}")
+    # Only Redis sessions expire; in-memory ones are removed explicitly
+    ttl = settings.chat_memory_ttl if settings.chat_storage == "redis" else None
+    return SqliteChatIndex(store, ttl) if IS_SQLITE else PostgresChatIndex(store, ttl)
@@ -2,22 +2,64 @@
 Chat Service for managing chat sessions and history
 """
 
+import base64
+import importlib
+import inspect
+import json
 import logging
 import uuid
 from datetime import datetime, timedelta
-from typing import List, Optional, Dict, Any
-from app.models.chat import ChatSession, Message, ChatHistory
+from typing import AsyncIterator, Awaitable, Callable, List, Optional, Dict, Any, Tuple, Union
+from app.models.chat import (
+    ChatSession, Message, ChatHistory, ChatMessagePage, ChatSessionPage, ChatSearchResults
+)
 from app.core.config import settings
+from app.services.chat_repository import create_chat_store
+from app.services.chat_search import create_chat_index
+from app.services.message_log import MessageRecord, to_epoch_ms
 
 logger = logging.getLogger(__name__)
 
+# Called with the previous summary (if any) and the messages trimmed from a
+# session; returns the new summary, or None to drop the messages unsummarized
+Summarizer = Callable[
+    [Optional[str], List[Message]],
+    Union[Optional[str], Awaitable[Optional[str]]]
+]
+
+def load_summarizer(path: Optional[str]) -> Optional[Summarizer]:
+    """Import a summarizer given as module:function"""
+    if not path:
+        return None
+    module_name, _, attribute = path.partition(":")
+    return getattr(importlib.import_module(module_name), attribute)
+
+def encode_session_cursor(session: ChatSession) -> str:
+    """Opaque cursor for the sessions after this one in last activity order"""
+    position = json.dumps([session.last_activity.isoformat(), session.session_id])
+    return base64.urlsafe_b64encode(position.encode()).decode().rstrip("=")
+
+def decode_session_cursor(cursor: str) -> Tuple[datetime, str]:
+    """Last activity and session ID in a cursor; raises ValueError if malformed"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        last_activity, session_id = json.loads(base64.urlsafe_b64decode(padded))
+        return datetime.fromisoformat(last_activity), session_id
+    except (TypeError, ValueError) as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+
+def _activity_order(session: ChatSession) -> Tuple[datetime, str]:
+    return session.last_activity, session.session_id
+
 class ChatService:
     """Service for managing chat sessions and history"""
     
-    def __init__(self):
-        # In-memory storage (replace with database in production)
-        self.sessions: Dict[str, ChatSession] = {}
-        self.workflow_sessions: Dict[str, List[str]] = {}
+    def __init__(self, summarizer: Optional[Summarizer] = None):
+        # Sessions are kept in the configured store; only Redis shares
+        # them between workers
+        self.store = create_chat_store()
+        self.search_index = create_chat_index(self.store)
+        self.summarizer = summarizer or load_summarizer(settings.chat_summarizer)
         
     async def get_or_create_session(
         self, 
@@ -26,11 +68,12 @@ class ChatService:
     ) -> ChatSession:
         """Get existing session or create new one"""
         
-        if session_id and session_id in self.sessions:
-            session = self.sessions[session_id]
-            # Update last activity
-            session.last_activity = datetime.utcnow()
-            return session
+        if session_id:
+            session = await self.store.get(session_id)
+            if session is not None:
+                # Update last activity
+                await self.store.touch(session, datetime.utcnow())
+                return session
         
         # Create new session
         new_session_id = str(uuid.uuid4())
@@ -43,12 +86,7 @@ class ChatService:
         )
         
         # Store session
-        self.sessions[new_session_id] = session
-        
-        # Add to workflow sessions
-        if workflow_id not in self.workflow_sessions:
-            self.workflow_sessions[workflow_id] = []
-        self.workflow_sessions[workflow_id].append(new_session_id)
+        await self.store.add(session)
         
         logger.info(f"Created new chat session {new_session_id} for workflow {workflow_id}")
         return session
@@ -57,60 +95,187 @@ class ChatService:
         self, 
         session_id: str, 
         role: str, 
-        content: str
-    ) -> Message:
-        """Add message to chat session"""
+        content: str,
+        max_history: Optional[int] = None
+    ) -> MessageRecord:
+        """Add message to chat session, trimming it to the history limit"""
         
-        if session_id not in self.sessions:
+        session = await self.store.get(session_id)
+        if session is None:
             raise ValueError(f"Session {session_id} not found")
         
-        session = self.sessions[session_id]
-        message = Message(
-            role=role,
-            content=content,
-            timestamp=datetime.utcnow(),
-            message_id=str(uuid.uuid4())
-        )
+        # Messages come from the API or the AI provider, so they are not
+        # validated again on their way into the store
+        message = MessageRecord.new(role, content)
+        
+        count = await self.store.append(session, message)
         
-        session.messages.append(message)
-        session.last_activity = datetime.utcnow()
+        # Search index positions count trimmed messages, like page cursors
+        trimmed = (session.metadata or {}).get("trimmed_messages", 0)
+        await self._index(session, message, trimmed + count - 1)
+        
+        limit = settings.max_chat_history
+        if max_history is not None:
+            limit = min(limit, max_history)
+        if count > limit:
+            await self._trim(session, count, limit)
         
         logger.debug(f"Added {role} message to session {session_id}")
         return message
     
-    async def get_session(self, session_id: str) -> Optional[ChatSession]:
-        """Get chat session by ID"""
-        return self.sessions.get(session_id)
+    async def get_recent_messages(self, session: ChatSession) -> List[MessageRecord]:
+        """Snapshot of the most recent messages of a session, for the AI providers.
+        
+        When older turns were summarized, the summary leads as a system message.
+        """
+        records = list(await self.store.recent(session))
+        summary = self._summary_message(session)
+        if summary is not None:
+            records.insert(0, MessageRecord.from_message(summary))
+        return records
     
-    async def get_latest_session(self, workflow_id: str) -> Optional[ChatSession]:
-        """Get the most recent chat session for a workflow"""
+    async def _trim(self, session: ChatSession, count: int, limit: int):
+        """Drop the oldest messages beyond the limit, folding them into the summary"""
+        
+        # Trim a little further than needed, so the summarizer runs once per
+        # batch of messages instead of on every message
+        excess = count - limit + min(settings.chat_segment_size, limit // 2)
+        dropped = await self.store.drop_oldest(session, excess)
+        if not dropped:
+            return
+        
+        # Message positions given out as page cursors count trimmed messages too
+        metadata = session.metadata or {}
+        updated = {**metadata, "trimmed_messages": metadata.get("trimmed_messages", 0) + len(dropped)}
+        
+        if self.summarizer is not None:
+            try:
+                summary = self.summarizer(metadata.get("summary"), [record.to_message() for record in dropped])
+                if inspect.isawaitable(summary):
+                    summary = await summary
+            except Exception as e:
+                logger.error(f"Error summarizing chat session {session.session_id}: {e}", exc_info=True)
+                summary = None
+            if summary:
+                updated.update({
+                    "summary": summary,
+                    "summarized_messages": metadata.get("summarized_messages", 0) + len(dropped),
+                    "summarized_until": dropped[-1].timestamp.isoformat()
+                })
+        
+        session.metadata = updated
+        await self.store.save_metadata(session)
+        
+        if self.search_index is not None:
+            try:
+                await self.search_index.trim(session.session_id, updated["trimmed_messages"])
+            except Exception as e:
+                logger.error(f"Error trimming chat search index: {e}", exc_info=True)
+    
+    async def _index(self, session: ChatSession, message: MessageRecord, position: int):
+        """Add a message to the search index; a failure there does not fail the chat"""
         
-        if workflow_id not in self.workflow_sessions:
+        if self.search_index is None:
+            return
+        try:
+            await self.search_index.add(session, message, position)
+        except Exception as e:
+            logger.error(f"Error indexing chat message: {e}", exc_info=True)
+    
+    async def _unindex(self, session: ChatSession):
+        if self.search_index is None:
+            return
+        try:
+            await self.search_index.remove_session(session.session_id)
+        except Exception as e:
+            logger.error(f"Error removing chat session from search index: {e}", exc_info=True)
+    
+    async def search_messages(
+        self,
+        query: str,
+        workflow_id: Optional[str] = None,
+        role: Optional[str] = None,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+        limit: int = 20
+    ) -> ChatSearchResults:
+        """Messages matching every word of a query, best first, with snippets"""
+        
+        if self.search_index is None:
+            raise RuntimeError("Chat search is disabled")
+        hits = await self.search_index.search(
+            query,
+            workflow_id=workflow_id,
+            role=role,
+            since=to_epoch_ms(since) if since is not None else None,
+            until=to_epoch_ms(until) if until is not None else None,
+            limit=limit
+        )
+        return ChatSearchResults(query=query, hits=hits)
+    
+    def _summary_message(self, session: ChatSession) -> Optional[Message]:
+        metadata = session.metadata or {}
+        if not metadata.get("summary"):
             return None
+        return Message.model_construct(
+            role="system",
+            content=metadata["summary"],
+            timestamp=datetime.fromisoformat(metadata["summarized_until"]),
+            message_id=f"summary-{session.session_id}"
+        )
+    
+    async def _with_history(self, session: ChatSession) -> ChatSession:
+        """Copy of a stored session carrying its whole history, summary first"""
+        
+        messages = [record.to_message() for record in await self.store.messages(session)]
+        summary = self._summary_message(session)
+        if summary is not None:
+            messages.insert(0, summary)
+        return session.model_copy(update={"messages": messages})
+    
+    async def _with_latest(self, session: ChatSession, limit: int) -> ChatSession:
+        """Copy of a stored session carrying only its latest messages"""
         
-        session_ids = self.workflow_sessions[workflow_id]
-        if not session_ids:
+        _, records = await self.store.page(session, None, limit)
+        return session.model_copy(update={"messages": [record.to_message() for record in records]})
+    
+    async def get_session(self, session_id: str) -> Optional[ChatSession]:
+        """Get chat session by ID"""
+        session = await self.store.get(session_id)
+        return await self._with_history(session) if session is not None else None
+    
+    async def _latest_stored_session(self, workflow_id: str) -> Optional[ChatSession]:
+        sessions = await self.store.list_for_workflow(workflow_id)
+        if not sessions:
             return None
         
         # Get the most recent session
-        latest_session_id = max(
-            session_ids, 
-            key=lambda sid: self.sessions[sid].last_activity
-        )
+        return max(sessions, key=lambda s: s.last_activity)
+    
+    async def get_latest_session(self, workflow_id: str) -> Optional[ChatSession]:
+        """Get the most recent chat session for a workflow"""
         
-        return self.sessions[latest_session_id]
+        session = await self._latest_stored_session(workflow_id)
+        return await self._with_history(session) if session is not None else None
+    
+    async def get_latest_session_stamp(self, workflow_id: str) -> Optional[Tuple[str, datetime, int]]:
+        """Cheap stamp of the latest session of a workflow; changes with every message"""
+        
+        session = await self._latest_stored_session(workflow_id)
+        if session is None:
+            return None
+        return session.session_id, session.last_activity, await self.store.count(session)
     
     async def get_workflow_history(self, workflow_id: str) -> ChatHistory:
         """Get chat history for a specific workflow"""
         
-        if workflow_id not in self.workflow_sessions:
+        sessions = await self.store.list_for_workflow(workflow_id)
+        if not sessions:
             return ChatHistory(workflow_id=workflow_id)
         
-        session_ids = self.workflow_sessions[workflow_id]
-        sessions = [self.sessions[sid] for sid in session_ids if sid in self.sessions]
-        
         # Sort by last activity
         sessions.sort(key=lambda s: s.last_activity, reverse=True)
+        sessions = [await self._with_history(session) for session in sessions]
         
         # Calculate total messages
         total_messages = sum(len(s.messages) for s in sessions)
@@ -121,46 +286,104 @@ class ChatService:
             total_messages=total_messages
         )
     
+    async def _sorted_sessions(self, workflow_id: str) -> List[ChatSession]:
+        sessions = await self.store.list_for_workflow(workflow_id)
+        sessions.sort(key=_activity_order, reverse=True)
+        return sessions
+    
+    async def get_session_page(
+        self,
+        workflow_id: str,
+        limit: int,
+        cursor: Optional[str] = None,
+        message_limit: int = 0
+    ) -> ChatSessionPage:
+        """Sessions of a workflow by last activity, ``limit`` at a time, with their latest messages"""
+        
+        sessions = await self._sorted_sessions(workflow_id)
+        if cursor:
+            after = decode_session_cursor(cursor)
+            sessions = [session for session in sessions if _activity_order(session) < after]
+        
+        page = sessions[:limit]
+        next_cursor = encode_session_cursor(page[-1]) if len(sessions) > limit else None
+        return ChatSessionPage(
+            workflow_id=workflow_id,
+            sessions=[await self._with_latest(session, message_limit) for session in page],
+            next_cursor=next_cursor
+        )
+    
+    async def get_message_page(
+        self,
+        session_id: str,
+        limit: int,
+        before: Optional[int] = None
+    ) -> Optional[ChatMessagePage]:
+        """Up to ``limit`` messages of a session before message number ``before``, or the latest.
+        
+        Messages are numbered from the start of the session, counting those
+        trimmed since, so numbers stay valid while the session grows.
+        """
+        
+        session = await self.store.get(session_id)
+        if session is None:
+            return None
+        
+        trimmed = (session.metadata or {}).get("trimmed_messages", 0)
+        stop = None if before is None else max(before - trimmed, 0)
+        count, records = await self.store.page(session, stop, limit)
+        
+        messages = [record.to_message() for record in records]
+        start = (count if stop is None else min(stop, count)) - len(records)
+        next_before = trimmed + start if start > 0 else None
+        if start <= 0:
+            summary = self._summary_message(session)
+            if summary is not None:
+                messages.insert(0, summary)
+        
+        return ChatMessagePage(
+            session_id=session_id,
+            messages=messages,
+            total_messages=count,
+            next_before=next_before
+        )
+    
+    async def iter_workflow_history(self, workflow_id: str) -> AsyncIterator[ChatSession]:
+        """Sessions of a workflow with their whole history, loaded one at a time"""
+        
+        for session in await self._sorted_sessions(workflow_id):
+            yield await self._with_history(session)
+    
     async def update_session_activity(self, session_id: str):
         """Update session last activity timestamp"""
         
-        if session_id in self.sessions:
-            self.sessions[session_id].last_activity = datetime.utcnow()
+        session = await self.store.get(session_id)
+        if session is not None:
+            await self.store.touch(session, datetime.utcnow())
     
     async def delete_session(self, session_id: str):
         """Delete a chat session"""
         
-        if session_id not in self.sessions:
+        session = await self.store.get(session_id)
+        if session is None:
             return
         
-        session = self.sessions[session_id]
-        workflow_id = session.workflow_id
-        
-        # Remove from workflow sessions
-        if workflow_id in self.workflow_sessions:
-            self.workflow_sessions[workflow_id] = [
-                sid for sid in self.workflow_sessions[workflow_id] 
-                if sid != session_id
-            ]
-        
-        # Remove session
-        del self.sessions[session_id]
+        # Remove session and its place in the workflow's sessions
+        await self.store.remove(session)
+        await self._unindex(session)
         
         logger.info(f"Deleted chat session {session_id}")
     
     async def clear_workflow_history(self, workflow_id: str):
         """Clear all chat history for a workflow"""
         
-        if workflow_id not in self.workflow_sessions:
+        sessions = await self.store.list_for_workflow(workflow_id)
+        if not sessions:
             return
         
-        session_ids = self.workflow_sessions[workflow_id].copy()
-        
-        for session_id in session_ids:
-            await self.delete_session(session_id)
-        
-        # Remove workflow entry
-        del self.workflow_sessions[workflow_id]
+        for session in sessions:
+            await self.store.remove(session)
+            await self._unindex(session)
         
         logger.info(f"Cleared all chat history for workflow {workflow_id}")
     
@@ -170,12 +393,13 @@ class ChatService:
         cutoff_time = datetime.utcnow() - timedelta(hours=max_age_hours)
         sessions_to_delete = []
         
-        for session_id, session in self.sessions.items():
+        for session in await self.store.all_sessions():
             if session.last_activity < cutoff_time:
-                sessions_to_delete.append(session_id)
+                sessions_to_delete.append(session)
         
-        for session_id in sessions_to_delete:
-            await self.delete_session(session_id)
+        for session in sessions_to_delete:
+            await self.store.remove(session)
+            await self._unindex(session)
         
         if sessions_to_delete:
             logger.info(f"Cleaned up {len(sessions_to_delete)} old chat sessions")
@@ -183,16 +407,19 @@ class ChatService:
     async def get_session_stats(self) -> Dict[str, Any]:
         """Get chat service statistics"""
         
-        total_sessions = len(self.sessions)
-        total_workflows = len(self.workflow_sessions)
-        total_messages = sum(len(s.messages) for s in self.sessions.values())
+        sessions = await self.store.all_sessions()
+        total_sessions = len(sessions)
+        total_workflows = len({s.workflow_id for s in sessions})
+        total_messages = 0
+        for session in sessions:
+            total_messages += await self.store.count(session)
         
         return {
             "total_sessions": total_sessions,
             "total_workflows": total_workflows,
             "total_messages": total_messages,
             "active_sessions": len([
-                s for s in self.sessions.values() 
+                s for s in sessions 
                 if s.last_activity > datetime.utcnow() - timedelta(hours=1)
             ])
         }
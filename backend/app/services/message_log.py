@@ -0,0 +1,334 @@
+"""
+Compact chat message records and their tiered in-memory storage
+"""
+
+import json
+import logging
+import sys
+import time
+import uuid
+import zlib
+from array import array
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from app.models.chat import Message
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - depends on the installation
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+ZSTD_LEVEL = 3
+
+# Message text collected per worker before a dictionary is trained on it
+DICTIONARY_SAMPLE_BYTES = 256 * 1024
+DICTIONARY_SIZE = 16 * 1024
+
+# Until a dictionary has been trained, segments are compressed against
+# text that assistant replies about n8n workflows keep repeating
+SEED_DICTIONARY = (
+    '```json\n{\n  "name": "", "nodes": [\n    {\n      "parameters": {},\n'
+    '      "id": "", "name": "", "type": "n8n-nodes-base.", "typeVersion": 1,\n'
+    '      "position": [0, 0]\n    }\n  ],\n  "connections": {\n    "": {\n'
+    '      "main": [[{"node": "", "type": "main", "index": 0}]]\n    }\n  },\n'
+    '  "active": false, "settings": {}, "tags": []\n}\n```\n'
+    "n8n-nodes-base.httpRequest n8n-nodes-base.webhook n8n-nodes-base.set "
+    "n8n-nodes-base.if n8n-nodes-base.code n8n-nodes-base.scheduleTrigger "
+    "n8n-nodes-base.manualTrigger n8n-nodes-base.slack n8n-nodes-base.gmail "
+    "Here is the workflow. This workflow will trigger when the node "
+    "Create a workflow that sends a message to Slack when "
+).encode()
+
+ROLES = ("user", "assistant", "system")
+ROLE_CODES = {role: code for code, role in enumerate(ROLES)}
+
+EPOCH = datetime(1970, 1, 1)
+
+def to_epoch_ms(timestamp: datetime) -> int:
+    """Milliseconds since the epoch of a datetime; naive ones are taken as UTC"""
+    if timestamp.tzinfo is not None:
+        timestamp = timestamp.astimezone(timezone.utc).replace(tzinfo=None)
+    return (timestamp - EPOCH) // timedelta(milliseconds=1)
+
+def from_epoch_ms(ms: int) -> datetime:
+    """Naive UTC datetime of milliseconds since the epoch"""
+    return EPOCH + timedelta(milliseconds=ms)
+
+class MessageRecord:
+    """A chat message as ChatService and AIService handle it internally.
+
+    Much lighter than the Pydantic Message: no validation, interned role
+    strings and an integer timestamp. The provider payload fragment
+    ({"role", "content"}) is built once per message and then reused for
+    every request that includes the message in its history; it is shared,
+    so callers must not modify it. Conversion to Message happens only when
+    a message leaves through the API.
+    """
+
+    __slots__ = ("role", "content", "timestamp_ms", "message_id", "_payload")
+
+    def __init__(self, role: str, content: str, timestamp_ms: int, message_id: Optional[str]):
+        self.role = sys.intern(role)
+        self.content = content
+        self.timestamp_ms = timestamp_ms
+        self.message_id = message_id
+        self._payload: Optional[Dict[str, str]] = None
+
+    @classmethod
+    def new(cls, role: str, content: str) -> "MessageRecord":
+        """Record for a message created now"""
+        return cls(role, content, time.time_ns() // 1_000_000, str(uuid.uuid4()))
+
+    @classmethod
+    def from_message(cls, message: Message) -> "MessageRecord":
+        return cls(message.role, message.content, to_epoch_ms(message.timestamp), message.message_id)
+
+    @classmethod
+    def from_json(cls, data: Any) -> "MessageRecord":
+        """Record from the JSON of a Message"""
+        document = json.loads(data)
+        return cls(
+            document["role"],
+            document["content"],
+            to_epoch_ms(datetime.fromisoformat(document["timestamp"])),
+            document.get("message_id")
+        )
+
+    @property
+    def timestamp(self) -> datetime:
+        return from_epoch_ms(self.timestamp_ms)
+
+    def payload(self) -> Dict[str, str]:
+        """Provider payload fragment of the message, cached"""
+        payload = self._payload
+        if payload is None:
+            payload = self._payload = {"role": self.role, "content": self.content}
+        return payload
+
+    def to_message(self) -> Message:
+        """Pydantic Message for API responses; validated on creation, so not again"""
+        return Message.model_construct(
+            role=self.role,
+            content=self.content,
+            timestamp=self.timestamp,
+            message_id=self.message_id
+        )
+
+    def to_json(self) -> str:
+        """Same JSON as the Message it stands for"""
+        return json.dumps({
+            "role": self.role,
+            "content": self.content,
+            "timestamp": self.timestamp.isoformat(),
+            "message_id": self.message_id
+        }, ensure_ascii=False)
+
+class _Dictionary:
+    """A compression dictionary with its compressor and decompressor"""
+
+    __slots__ = ("compress", "decompress")
+
+    def __init__(self, data: bytes, trained: bool = False):
+        if zstandard is not None:
+            dict_type = zstandard.DICT_TYPE_AUTO if trained else zstandard.DICT_TYPE_RAWCONTENT
+            dictionary = zstandard.ZstdCompressionDict(data, dict_type=dict_type)
+            compressor = zstandard.ZstdCompressor(level=ZSTD_LEVEL, dict_data=dictionary)
+            # The output buffer is allocated at the worst-case size; segments
+            # are long-lived, so they keep an exact-size copy instead
+            self.compress = lambda payload: bytes(memoryview(compressor.compress(payload)))
+            self.decompress = zstandard.ZstdDecompressor(dict_data=dictionary).decompress
+        else:
+            # zlib takes a preset dictionary as well, just a less effective one
+            def compress(payload: bytes) -> bytes:
+                compressor = zlib.compressobj(6, zdict=data[-32768:])
+                return compressor.compress(payload) + compressor.flush()
+
+            def decompress(payload: bytes) -> bytes:
+                decompressor = zlib.decompressobj(zdict=data[-32768:])
+                return decompressor.decompress(payload) + decompressor.flush()
+
+            self.compress = compress
+            self.decompress = decompress
+
+class SegmentCodec:
+    """Compresses message segments against a dictionary shared by all sessions.
+
+    Short chat messages compress poorly on their own; a dictionary holding
+    the phrases and JSON that keep recurring fixes that. The codec starts
+    from a seed dictionary and, once enough text has passed through it,
+    trains a zstd dictionary on that text. Segments keep a reference to the
+    dictionary they were written with.
+    """
+
+    def __init__(self):
+        self.dictionary = _Dictionary(SEED_DICTIONARY)
+        self.samples: Optional[List[bytes]] = [] if zstandard is not None else None
+        self.sample_bytes = 0
+
+    def compress(self, payload: bytes, samples: Iterable[bytes]) -> Tuple[_Dictionary, bytes]:
+        """Compress a segment; returns the dictionary needed to decompress it"""
+        dictionary = self.dictionary
+        data = dictionary.compress(payload)
+        if self.samples is not None:
+            self._collect(samples)
+        return dictionary, data
+
+    def _collect(self, samples: Iterable[bytes]):
+        for sample in samples:
+            self.samples.append(sample)
+            self.sample_bytes += len(sample)
+        if self.sample_bytes < DICTIONARY_SAMPLE_BYTES:
+            return
+
+        samples, self.samples = self.samples, None
+        try:
+            trained = zstandard.train_dictionary(DICTIONARY_SIZE, samples)
+        except Exception as e:
+            logger.warning(f"Could not train chat compression dictionary: {e}")
+            return
+        self.dictionary = _Dictionary(trained.as_bytes(), trained=True)
+        logger.info(f"Trained chat compression dictionary on {len(samples)} messages")
+
+segment_codec = SegmentCodec()
+
+class MessageSegment:
+    """Consecutive messages packed into arrays and one compressed block"""
+
+    __slots__ = ("roles", "timestamps", "ids", "offsets", "data", "dictionary")
+
+    def __init__(self, messages: List[MessageRecord], codec: SegmentCodec):
+        contents = [message.content.encode() for message in messages]
+
+        self.roles = bytes(ROLE_CODES[message.role] for message in messages)
+        self.timestamps = array("q", (message.timestamp_ms for message in messages))
+        self.ids = self._pack_ids(messages)
+
+        text = contents
+        if self.ids is None:
+            # Non-UUID IDs go into the compressed block after the contents
+            text = contents + [(message.message_id or "").encode() for message in messages]
+        offsets = array("I")
+        end = 0
+        for part in text:
+            end += len(part)
+            offsets.append(end)
+        self.offsets = offsets
+
+        self.dictionary, self.data = codec.compress(b"".join(text), contents)
+
+    @staticmethod
+    def _pack_ids(messages: List[MessageRecord]) -> Optional[bytes]:
+        packed = bytearray()
+        for message in messages:
+            try:
+                message_id = uuid.UUID(message.message_id)
+            except (TypeError, ValueError):
+                return None
+            if str(message_id) != message.message_id:
+                return None
+            packed += message_id.bytes
+        return bytes(packed)
+
+    def __len__(self) -> int:
+        return len(self.roles)
+
+    def messages(self) -> List[MessageRecord]:
+        """Unpack the segment into records"""
+        text = self.dictionary.decompress(self.data)
+        count = len(self.roles)
+
+        parts = []
+        start = 0
+        for end in self.offsets:
+            parts.append(text[start:end].decode())
+            start = end
+
+        if self.ids is not None:
+            ids = [str(uuid.UUID(bytes=self.ids[i * 16:(i + 1) * 16])) for i in range(count)]
+        else:
+            ids = [message_id or None for message_id in parts[count:]]
+
+        return [
+            MessageRecord(ROLES[self.roles[i]], parts[i], self.timestamps[i], ids[i])
+            for i in range(count)
+        ]
+
+class MessageLog:
+    """Messages of one session, recent ones as objects and older ones packed.
+
+    The most recent messages stay in ``hot`` as records, since they
+    are what the AI providers and the UI read. When ``hot`` grows past
+    ``hot_limit`` plus a segment, its oldest ``segment_size`` messages are
+    packed into a MessageSegment.
+    """
+
+    __slots__ = ("hot", "segments", "hot_limit", "segment_size", "codec")
+
+    def __init__(
+        self,
+        hot: List[MessageRecord],
+        hot_limit: int,
+        segment_size: int,
+        codec: SegmentCodec = segment_codec
+    ):
+        self.hot = hot
+        self.segments: List[MessageSegment] = []
+        self.hot_limit = hot_limit
+        self.segment_size = segment_size
+        self.codec = codec
+        self._compact()
+
+    def __len__(self) -> int:
+        return sum(len(segment) for segment in self.segments) + len(self.hot)
+
+    def append(self, message: MessageRecord):
+        self.hot.append(message)
+        self._compact()
+
+    def _compact(self):
+        while len(self.hot) >= self.hot_limit + self.segment_size:
+            packed = self.hot[:self.segment_size]
+            del self.hot[:self.segment_size]
+            self.segments.append(MessageSegment(packed, self.codec))
+
+    def messages(self) -> List[MessageRecord]:
+        """All messages, oldest first"""
+        messages: List[MessageRecord] = []
+        for segment in self.segments:
+            messages.extend(segment.messages())
+        messages.extend(self.hot)
+        return messages
+
+    def slice(self, start: int, stop: int) -> List[MessageRecord]:
+        """Messages at positions start to stop, unpacking only the segments they span"""
+        messages: List[MessageRecord] = []
+        position = 0
+        for segment in self.segments:
+            end = position + len(segment)
+            if end > start and position < stop:
+                messages.extend(segment.messages()[max(start - position, 0):stop - position])
+            position = end
+            if position >= stop:
+                return messages
+        messages.extend(self.hot[max(start - position, 0):max(stop - position, 0)])
+        return messages
+
+    def drop_oldest(self, count: int) -> List[MessageRecord]:
+        """Remove and return the oldest messages"""
+        dropped: List[MessageRecord] = []
+        while count > 0 and self.segments:
+            segment = self.segments[0]
+            if len(segment) > count:
+                messages = segment.messages()
+                dropped.extend(messages[:count])
+                self.segments[0] = MessageSegment(messages[count:], self.codec)
+                return dropped
+            dropped.extend(self.segments.pop(0).messages())
+            count -= len(segment)
+
+        dropped.extend(self.hot[:count])
+        del self.hot[:count]
+        return dropped
@@ -8,9 +8,27 @@ from typing import Dict, Any, Optional, List
 from datetime import datetime
 from app.models.workflow import Workflow, WorkflowExecution
 from app.core.config import settings
+from app.core.metrics import metrics, timed
 
 logger = logging.getLogger(__name__)
 
+# Only calls that make one n8n API request are timed; apply_workflow and
+# get_workflow_stats are made of these
+N8N_SECONDS = metrics.histogram(
+    "n8n_request_seconds",
+    "Time spent in n8n API requests",
+    ["operation"],
+    timing_name="n8n"
+)
+N8N_ERRORS = metrics.counter(
+    "n8n_request_errors_total",
+    "n8n API requests that raised",
+    ["operation"]
+)
+
+def _timed(operation: str):
+    return timed(N8N_SECONDS.labels(operation), N8N_ERRORS.labels(operation))
+
 class N8nService:
     """Service for n8n API integration"""
     
@@ -19,6 +37,7 @@ class N8nService:
         self.default_url = None
         self.default_api_key = None
     
+    @_timed("test_connection")
     async def test_connection(
         self, 
         url: str, 
@@ -69,6 +88,7 @@ class N8nService:
                 "details": {"error": f"Unexpected error: {str(e)}"}
             }
     
+    @_timed("get_workflow")
     async def get_workflow(
         self, 
         workflow_id: str, 
@@ -103,6 +123,7 @@ class N8nService:
             logger.error(f"Error getting workflow {workflow_id}: {e}")
             raise
     
+    @_timed("create_workflow")
     async def create_workflow(
         self, 
         workflow: Workflow,
@@ -144,6 +165,7 @@ class N8nService:
             logger.error(f"Error creating workflow: {e}")
             raise
     
+    @_timed("update_workflow")
     async def update_workflow(
         self, 
         workflow_id: str,
@@ -212,6 +234,7 @@ class N8nService:
             logger.error(f"Error applying workflow: {e}")
             raise
     
+    @_timed("execute_workflow")
     async def execute_workflow(
         self, 
         workflow_id: str,
@@ -250,6 +273,7 @@ class N8nService:
             logger.error(f"Error executing workflow {workflow_id}: {e}")
             raise
     
+    @_timed("get_workflow_executions")
     async def get_workflow_executions(
         self, 
         workflow_id: str,
@@ -0,0 +1,260 @@
+"""
+Per-user settings storage with a per-worker read cache
+"""
+
+import asyncio
+import json
+import logging
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Callable, Dict, Optional
+from sqlalchemy import select, update
+from sqlalchemy.exc import IntegrityError
+from app.core.cache import LRUCache, InvalidationLog, invalidation_log
+from app.core.config import settings
+from app.core.database import Base, SessionLocal, engine
+from app.core.shared_state import SharedState, shared_state
+from app.models.settings import UserSettings, N8nInstance, UserSettingsRecord
+
+logger = logging.getLogger(__name__)
+
+INVALIDATION_NAMESPACE = "user_settings"
+
+@dataclass
+class SettingsProfile:
+    """Settings and n8n instances of one user, stamped with a version.
+
+    Version 0 means the profile has never been stored. Cached profiles are
+    shared between requests and must be copied before modification.
+    """
+    user_id: str
+    user_settings: UserSettings
+    n8n_instances: Dict[str, N8nInstance] = field(default_factory=dict)
+    version: int = 0
+
+    def copy(self) -> "SettingsProfile":
+        """Deep copy for modification"""
+        return SettingsProfile(
+            user_id=self.user_id,
+            user_settings=self.user_settings.model_copy(deep=True),
+            n8n_instances={
+                instance_id: instance.model_copy(deep=True)
+                for instance_id, instance in self.n8n_instances.items()
+            },
+            version=self.version
+        )
+
+    def to_json(self) -> str:
+        return json.dumps({
+            "user_settings": self.user_settings.model_dump(mode="json"),
+            "n8n_instances": {
+                instance_id: instance.model_dump(mode="json")
+                for instance_id, instance in self.n8n_instances.items()
+            }
+        })
+
+    @classmethod
+    def from_json(cls, user_id: str, data: str, version: int) -> "SettingsProfile":
+        document = json.loads(data)
+        return cls(
+            user_id=user_id,
+            user_settings=UserSettings.model_validate(document["user_settings"]),
+            n8n_instances={
+                instance_id: N8nInstance.model_validate(instance)
+                for instance_id, instance in document.get("n8n_instances", {}).items()
+            },
+            version=version
+        )
+
+class StaleSettingsError(Exception):
+    """Raised when a user's settings changed in storage since they were read"""
+
+ProfileFactory = Callable[[str], SettingsProfile]
+
+class InMemorySettingsStore:
+    """Settings kept in process memory; state is not shared between workers"""
+
+    def __init__(self):
+        self.profiles: Dict[str, SettingsProfile] = {}
+
+    async def get(self, user_id: str, default: ProfileFactory) -> SettingsProfile:
+        """Get a user's settings, creating the defaults on first access"""
+        profile = self.profiles.get(user_id)
+        if profile is None:
+            profile = self.profiles[user_id] = default(user_id)
+        return profile
+
+    async def save(self, profile: SettingsProfile, previous: SettingsProfile):
+        """Store a profile as the successor of the previous one"""
+        if self.profiles.get(profile.user_id) is not previous:
+            raise StaleSettingsError(profile.user_id)
+        self.profiles[profile.user_id] = profile
+
+class SqlSettingsStore:
+    """Settings persisted through SQLAlchemy and shared by all workers.
+
+    Profiles are cached per worker, so reads are a dictionary lookup. Writes
+    only succeed against the version that was read, and other workers drop
+    their copy when the invalidation log reports the change.
+    """
+
+    def __init__(
+        self,
+        cache_size: int,
+        invalidations: InvalidationLog,
+        session_factory=SessionLocal
+    ):
+        self.cache = LRUCache(cache_size)
+        self.invalidations = invalidations
+        self.session_factory = session_factory
+        self.schema_ready = False
+
+        invalidations.subscribe(INVALIDATION_NAMESPACE, self._invalidate, reset=self.cache.clear)
+
+    async def get(self, user_id: str, default: ProfileFactory) -> SettingsProfile:
+        """Get a user's settings, loading them from the database on a cache miss"""
+
+        await self.invalidations.refresh()
+
+        profile = self.cache.get(user_id)
+        if profile is None:
+            profile = await asyncio.to_thread(self._load, user_id)
+            if profile is None:
+                # Users without stored settings share nothing until their first write
+                profile = default(user_id)
+            self.cache.set(user_id, profile)
+        return profile
+
+    async def save(self, profile: SettingsProfile, previous: SettingsProfile):
+        """Store a profile as the successor of the previous one"""
+
+        try:
+            await asyncio.to_thread(self._write, profile, previous.version)
+        except StaleSettingsError:
+            self.cache.pop(profile.user_id)
+            raise
+        self.cache.set(profile.user_id, profile)
+
+    def _invalidate(self, user_id: str, version: Optional[int]):
+        self.cache.pop(user_id)
+
+    def _ensure_schema(self):
+        if not self.schema_ready:
+            self.invalidations.ensure_schema()
+            Base.metadata.create_all(bind=engine, tables=[UserSettingsRecord.__table__])
+            self.schema_ready = True
+
+    def _load(self, user_id: str) -> Optional[SettingsProfile]:
+        self._ensure_schema()
+
+        with self.session_factory() as session:
+            row = session.execute(
+                select(UserSettingsRecord.data, UserSettingsRecord.version)
+                .where(UserSettingsRecord.user_id == user_id)
+            ).first()
+
+        if row is None:
+            return None
+        return SettingsProfile.from_json(user_id, row.data, row.version)
+
+    def _write(self, profile: SettingsProfile, previous_version: int):
+        self._ensure_schema()
+
+        with self.session_factory() as session:
+            if previous_version == 0:
+                session.add(UserSettingsRecord(
+                    user_id=profile.user_id,
+                    version=profile.version,
+                    data=profile.to_json(),
+                    updated_at=datetime.utcnow()
+                ))
+                try:
+                    session.flush()
+                except IntegrityError:
+                    session.rollback()
+                    raise StaleSettingsError(profile.user_id)
+            else:
+                result = session.execute(
+                    update(UserSettingsRecord)
+                    .where(UserSettingsRecord.user_id == profile.user_id)
+                    .where(UserSettingsRecord.version == previous_version)
+                    .values(
+                        version=profile.version,
+                        data=profile.to_json(),
+                        updated_at=datetime.utcnow()
+                    )
+                )
+                if result.rowcount != 1:
+                    session.rollback()
+                    raise StaleSettingsError(profile.user_id)
+
+            self.invalidations.publish(
+                session, INVALIDATION_NAMESPACE, profile.user_id, profile.version
+            )
+            session.commit()
+
+class RedisSettingsStore:
+    """Settings kept in Redis and shared by all workers.
+
+    Profiles are cached per worker as with SqlSettingsStore; writes are
+    conditional on the version that was read, and other workers drop their
+    copy when the change is announced over Redis pub/sub. A profile read
+    while a newer version was announced is not cached.
+    """
+
+    def __init__(self, cache_size: int, shared: SharedState):
+        self.cache = LRUCache(cache_size)
+        self.announced = LRUCache(cache_size)
+        self.shared = shared
+
+        shared.subscribe(INVALIDATION_NAMESPACE, self._invalidate, reset=self.cache.clear)
+
+    async def get(self, user_id: str, default: ProfileFactory) -> SettingsProfile:
+        """Get a user's settings, loading them from Redis on a cache miss"""
+
+        await self.shared.refresh()
+
+        profile = self.cache.get(user_id)
+        if profile is None:
+            entry = await self.shared.get(INVALIDATION_NAMESPACE, user_id)
+            if entry is None:
+                profile = default(user_id)
+            else:
+                version, data = entry
+                profile = SettingsProfile.from_json(user_id, data, version)
+            if profile.version >= self.announced.get(user_id, 0):
+                self.cache.set(user_id, profile)
+        return profile
+
+    async def save(self, profile: SettingsProfile, previous: SettingsProfile):
+        """Store a profile as the successor of the previous one"""
+
+        written, _ = await self.shared.compare_and_set(
+            INVALIDATION_NAMESPACE,
+            profile.user_id,
+            profile.version,
+            profile.to_json().encode(),
+            expected=previous.version
+        )
+        if not written:
+            self.cache.pop(profile.user_id)
+            raise StaleSettingsError(profile.user_id)
+        self.cache.set(profile.user_id, profile)
+
+    def _invalidate(self, user_id: str, version: Optional[int]):
+        if version is not None and version > self.announced.get(user_id, 0):
+            self.announced.set(user_id, version)
+        self.cache.pop(user_id)
+
+def create_settings_store():
+    """Create the settings store selected by settings"""
+
+    if settings.settings_storage == "memory":
+        logger.info("Using in-memory settings storage")
+        return InMemorySettingsStore()
+    if settings.settings_storage == "redis":
+        logger.info("Using Redis settings storage")
+        return RedisSettingsStore(settings.settings_cache_size, shared_state)
+    if settings.settings_storage != "database":
+        raise ValueError(f"Unknown settings storage: {settings.settings_storage}")
+    return SqlSettingsStore(settings.settings_cache_size, invalidation_log)
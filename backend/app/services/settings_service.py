@@ -5,102 +5,124 @@ Settings Service for managing user configuration
 import logging
 import uuid
 from datetime import datetime
-from typing import List, Optional, Dict, Any
+from functools import lru_cache
+from typing import Any, Callable, Dict, List, Optional, TypeVar
 from app.models.settings import (
     UserSettings, SettingsUpdate, N8nInstance, 
     N8nInstanceCreate, N8nInstanceUpdate
 )
 from app.core.config import settings
+from app.services.settings_repository import (
+    SettingsProfile, StaleSettingsError, create_settings_store
+)
 
 logger = logging.getLogger(__name__)
 
+# Settings owner for requests without an authenticated user
+DEFAULT_USER_ID = "default_user"
+
+T = TypeVar("T")
+
 class SettingsService:
     """Service for managing user settings"""
     
     def __init__(self):
-        # In-memory storage (replace with database in production)
-        # API keys are now passed from frontend, not loaded from .env
-        self.user_settings = UserSettings(
-            user_id="default_user",
-            openai_api_key=None,  # Will be set from frontend
-            anthropic_api_key=None,  # Will be set from frontend
-            active_provider=settings.default_ai_provider,
-            auto_apply_workflows=False,
-            save_chat_history=True,
-            max_history=25,
-            theme="auto",
-            enable_notifications=True,
-            notification_sound=False,
-            created_at=datetime.utcnow(),
-            updated_at=datetime.utcnow()
+        # Per-user settings shared through the configured store
+        # API keys are passed from frontend, not loaded from .env
+        self.store = create_settings_store()
+    
+    @staticmethod
+    def _default_profile(user_id: str) -> SettingsProfile:
+        """Build the default settings of a user"""
+        
+        now = datetime.utcnow()
+        return SettingsProfile(
+            user_id=user_id,
+            user_settings=UserSettings(
+                user_id=user_id,
+                active_provider=settings.default_ai_provider,
+                auto_apply_workflows=False,
+                save_chat_history=True,
+                max_history=25,
+                theme="auto",
+                enable_notifications=True,
+                notification_sound=False,
+                created_at=now,
+                updated_at=now
+            )
         )
-        
-        self.n8n_instances: Dict[str, N8nInstance] = {}
-        
-        # Initialize with default n8n instance if configured
-        # API keys are now passed from frontend, not loaded from .env
-        # if settings.n8n_default_url and settings.n8n_default_api_key:
-        #     default_instance = N8nInstance(
-        #         instance_id="default",
-        #         name="Default n8n Instance",
-        #         url=settings.n8n_default_url,
-        #         api_key=settings.n8n_default_api_key,
-        #         is_default=True,
-        #         is_active=True,
-        #         created_at=datetime.utcnow()
-        #     )
-        #     self.n8n_instances["default"] = default_instance
-        #     self.user_settings.default_n8n_instance = "default"
     
-    async def get_user_settings(self) -> UserSettings:
+    async def _get_profile(self, user_id: str) -> SettingsProfile:
+        return await self.store.get(user_id, self._default_profile)
+    
+    async def _modify(
+        self, 
+        user_id: str, 
+        change: Callable[[SettingsProfile], T]
+    ) -> T:
+        """Apply a change to a copy of a user's settings and store it as the next version
+        
+        The change is re-applied to fresh settings if another worker wrote first.
+        """
+        
+        while True:
+            current = await self._get_profile(user_id)
+            profile = current.copy()
+            result = change(profile)
+            profile.version = current.version + 1
+            try:
+                await self.store.save(profile, current)
+                return result
+            except StaleSettingsError:
+                logger.debug(f"Settings of {user_id} changed concurrently, retrying")
+    
+    async def get_settings_version(self, user_id: str = DEFAULT_USER_ID) -> int:
+        """Version of a user's settings; changes with every write"""
+        return (await self._get_profile(user_id)).version
+    
+    async def get_user_settings(self, user_id: str = DEFAULT_USER_ID) -> UserSettings:
         """Get current user settings"""
-        return self.user_settings
+        return (await self._get_profile(user_id)).user_settings
     
-    async def update_settings(self, settings_update: SettingsUpdate) -> UserSettings:
+    async def update_settings(
+        self, 
+        settings_update: SettingsUpdate, 
+        user_id: str = DEFAULT_USER_ID
+    ) -> UserSettings:
         """Update user settings"""
         
         # Update only provided fields
-        if settings_update.openai_api_key is not None:
-            self.user_settings.openai_api_key = settings_update.openai_api_key
-        
-        if settings_update.anthropic_api_key is not None:
-            self.user_settings.anthropic_api_key = settings_update.anthropic_api_key
+        updates = settings_update.model_dump(exclude_none=True)
         
-        if settings_update.active_provider is not None:
-            self.user_settings.active_provider = settings_update.active_provider
+        def change(profile: SettingsProfile) -> UserSettings:
+            profile.user_settings = profile.user_settings.model_copy(update={
+                **updates,
+                "updated_at": datetime.utcnow()
+            })
+            return profile.user_settings
         
-        if settings_update.auto_apply_workflows is not None:
-            self.user_settings.auto_apply_workflows = settings_update.auto_apply_workflows
-        
-        if settings_update.save_chat_history is not None:
-            self.user_settings.save_chat_history = settings_update.save_chat_history
-        
-        if settings_update.max_history is not None:
-            self.user_settings.max_history = settings_update.max_history
-        
-        if settings_update.theme is not None:
-            self.user_settings.theme = settings_update.theme
-        
-        if settings_update.enable_notifications is not None:
-            self.user_settings.enable_notifications = settings_update.enable_notifications
-        
-        if settings_update.notification_sound is not None:
-            self.user_settings.notification_sound = settings_update.notification_sound
-        
-        self.user_settings.updated_at = datetime.utcnow()
+        updated_settings = await self._modify(user_id, change)
         
         logger.info("User settings updated")
-        return self.user_settings
+        return updated_settings
     
-    async def get_n8n_instances(self) -> List[N8nInstance]:
+    async def get_n8n_instances(self, user_id: str = DEFAULT_USER_ID) -> List[N8nInstance]:
         """Get all configured n8n instances"""
-        return list(self.n8n_instances.values())
+        return list((await self._get_profile(user_id)).n8n_instances.values())
     
-    async def get_n8n_instance(self, instance_id: str) -> Optional[N8nInstance]:
+    async def get_n8n_instance(
+        self, 
+        instance_id: str, 
+        user_id: str = DEFAULT_USER_ID
+    ) -> Optional[N8nInstance]:
         """Get specific n8n instance"""
-        return self.n8n_instances.get(instance_id)
+        return (await self._get_profile(user_id)).n8n_instances.get(instance_id)
     
-    async def create_n8n_instance(self, instance: N8nInstanceCreate) -> N8nInstance:
+    async def create_n8n_instance(
+        self, 
+        instance: N8nInstanceCreate, 
+        user_id: str = DEFAULT_USER_ID
+    ) -> N8nInstance:
         """Create new n8n instance configuration"""
         
         # Generate instance ID
@@ -117,13 +139,17 @@ class SettingsService:
             created_at=datetime.utcnow()
         )
         
-        # If this is set as default, unset other defaults
-        if instance.is_default:
-            await self._unset_other_defaults(instance_id)
-            self.user_settings.default_n8n_instance = instance_id
+        def change(profile: SettingsProfile) -> N8nInstance:
+            # If this is set as default, unset other defaults
+            if instance.is_default:
+                self._unset_other_defaults(profile, instance_id)
+                profile.user_settings.default_n8n_instance = instance_id
+            
+            # Store instance
+            profile.n8n_instances[instance_id] = new_instance
+            return new_instance
         
-        # Store instance
-        self.n8n_instances[instance_id] = new_instance
+        await self._modify(user_id, change)
         
         logger.info(f"Created n8n instance {instance_id}: {instance.name}")
         return new_instance
@@ -131,173 +157,173 @@ class SettingsService:
     async def update_n8n_instance(
         self, 
         instance_id: str, 
-        instance_update: N8nInstanceUpdate
+        instance_update: N8nInstanceUpdate,
+        user_id: str = DEFAULT_USER_ID
     ) -> N8nInstance:
         """Update n8n instance configuration"""
         
-        if instance_id not in self.n8n_instances:
-            raise ValueError(f"n8n instance {instance_id} not found")
-        
-        instance = self.n8n_instances[instance_id]
-        
-        # Update fields
-        if instance_update.name is not None:
-            instance.name = instance_update.name
-        
-        if instance_update.url is not None:
-            instance.url = instance_update.url
-        
-        if instance_update.api_key is not None:
-            instance.api_key = instance_update.api_key
-        
-        if instance_update.is_default is not None:
-            if instance_update.is_default:
-                await self._unset_other_defaults(instance_id)
-                self.user_settings.default_n8n_instance = instance_id
-            instance.is_default = instance_update.is_default
+        def change(profile: SettingsProfile) -> N8nInstance:
+            if instance_id not in profile.n8n_instances:
+                raise ValueError(f"n8n instance {instance_id} not found")
+            
+            instance = profile.n8n_instances[instance_id]
+            
+            # Update fields
+            if instance_update.name is not None:
+                instance.name = instance_update.name
+            
+            if instance_update.url is not None:
+                instance.url = instance_update.url
+            
+            if instance_update.api_key is not None:
+                instance.api_key = instance_update.api_key
+            
+            if instance_update.is_default is not None:
+                if instance_update.is_default:
+                    self._unset_other_defaults(profile, instance_id)
+                    profile.user_settings.default_n8n_instance = instance_id
+                instance.is_default = instance_update.is_default
+            
+            if instance_update.is_active is not None:
+                instance.is_active = instance_update.is_active
+            
+            return instance
         
-        if instance_update.is_active is not None:
-            instance.is_active = instance_update.is_active
+        instance = await self._modify(user_id, change)
         
         logger.info(f"Updated n8n instance {instance_id}")
         return instance
     
-    async def delete_n8n_instance(self, instance_id: str):
+    async def delete_n8n_instance(self, instance_id: str, user_id: str = DEFAULT_USER_ID):
         """Delete n8n instance configuration"""
         
-        if instance_id not in self.n8n_instances:
+        if instance_id not in (await self._get_profile(user_id)).n8n_instances:
             return
         
-        instance = self.n8n_instances[instance_id]
-        
-        # If this was the default instance, clear the default
-        if instance.is_default:
-            self.user_settings.default_n8n_instance = None
+        def change(profile: SettingsProfile):
+            instance = profile.n8n_instances.pop(instance_id, None)
+            
+            # If this was the default instance, clear the default
+            if instance is not None and instance.is_default:
+                profile.user_settings.default_n8n_instance = None
         
-        # Remove instance
-        del self.n8n_instances[instance_id]
+        await self._modify(user_id, change)
         
         logger.info(f"Deleted n8n instance {instance_id}")
     
-    async def set_default_n8n_instance(self, instance_id: str):
+    async def set_default_n8n_instance(self, instance_id: str, user_id: str = DEFAULT_USER_ID):
         """Set n8n instance as default"""
         
-        if instance_id not in self.n8n_instances:
-            raise ValueError(f"n8n instance {instance_id} not found")
-        
-        # Unset other defaults
-        await self._unset_other_defaults(instance_id)
+        def change(profile: SettingsProfile):
+            if instance_id not in profile.n8n_instances:
+                raise ValueError(f"n8n instance {instance_id} not found")
+            
+            # Unset other defaults
+            self._unset_other_defaults(profile, instance_id)
+            
+            # Set new default
+            profile.n8n_instances[instance_id].is_default = True
+            profile.user_settings.default_n8n_instance = instance_id
         
-        # Set new default
-        self.n8n_instances[instance_id].is_default = True
-        self.user_settings.default_n8n_instance = instance_id
+        await self._modify(user_id, change)
         
         logger.info(f"Set n8n instance {instance_id} as default")
     
-    async def get_ai_providers_status(self) -> Dict[str, Any]:
+    async def get_ai_providers_status(self, user_id: str = DEFAULT_USER_ID) -> Dict[str, Any]:
         """Get available AI providers and their status"""
         
+        user_settings = (await self._get_profile(user_id)).user_settings
+        
+        # Provider keys are stored in backend config
         openai_status = {
             "provider": "openai",
-            "configured": bool(self.user_settings.openai_api_key),
-            "active": self.user_settings.active_provider == "openai"
+            "configured": bool(settings.openai_api_key),
+            "active": user_settings.active_provider == "openai"
         }
         
         anthropic_status = {
             "provider": "anthropic",
-            "configured": bool(self.user_settings.anthropic_api_key),
-            "active": self.user_settings.active_provider == "anthropic"
+            "configured": bool(settings.anthropic_api_key),
+            "active": user_settings.active_provider == "anthropic"
         }
         
         return {
             "providers": [openai_status, anthropic_status],
-            "active_provider": self.user_settings.active_provider,
+            "active_provider": user_settings.active_provider,
             "default_provider": settings.default_ai_provider
         }
     
-    async def reset_to_defaults(self):
+    async def reset_to_defaults(self, user_id: str = DEFAULT_USER_ID):
         """Reset settings to default values"""
         
-        # Reset user settings
-        self.user_settings = UserSettings(
-            user_id="default_user",
-            openai_api_key=settings.openai_api_key,
-            anthropic_api_key=settings.anthropic_api_key,
-            active_provider=settings.default_ai_provider,
-            auto_apply_workflows=False,
-            save_chat_history=True,
-            max_history=25,
-            theme="auto",
-            enable_notifications=True,
-            notification_sound=False,
-            created_at=datetime.utcnow(),
-            updated_at=datetime.utcnow()
-        )
+        def change(profile: SettingsProfile):
+            defaults = self._default_profile(user_id)
+            profile.user_settings = defaults.user_settings
+            profile.n8n_instances = defaults.n8n_instances
         
-        # Reset n8n instances
-        self.n8n_instances.clear()
-        
-        # Re-add default instance if configured
-        if settings.n8n_default_url and settings.n8n_default_api_key:
-            default_instance = N8nInstance(
-                instance_id="default",
-                name="Default n8n Instance",
-                url=settings.n8n_default_url,
-                api_key=settings.n8n_default_api_key,
-                is_default=True,
-                is_active=True,
-                created_at=datetime.utcnow()
-            )
-            self.n8n_instances["default"] = default_instance
-            self.user_settings.default_n8n_instance = "default"
+        await self._modify(user_id, change)
         
         logger.info("Settings reset to defaults")
     
-    async def export_settings(self) -> Dict[str, Any]:
+    async def export_settings(self, user_id: str = DEFAULT_USER_ID) -> Dict[str, Any]:
         """Export user settings"""
         
+        profile = await self._get_profile(user_id)
         return {
-            "user_settings": self.user_settings.dict(),
+            "user_settings": profile.user_settings.model_dump(),
             "n8n_instances": {
-                instance_id: instance.dict() 
-                for instance_id, instance in self.n8n_instances.items()
+                instance_id: instance.model_dump() 
+                for instance_id, instance in profile.n8n_instances.items()
             },
             "exported_at": datetime.utcnow().isoformat()
         }
     
-    async def import_settings(self, settings_data: dict):
+    async def import_settings(self, settings_data: dict, user_id: str = DEFAULT_USER_ID):
         """Import user settings"""
         
-        try:
+        def change(profile: SettingsProfile):
             # Import user settings
             if "user_settings" in settings_data:
-                user_settings_data = settings_data["user_settings"]
-                for field, value in user_settings_data.items():
-                    if hasattr(self.user_settings, field):
-                        setattr(self.user_settings, field, value)
+                user_settings_data = {
+                    field: value
+                    for field, value in settings_data["user_settings"].items()
+                    if field in UserSettings.model_fields and field != "user_id"
+                }
+                profile.user_settings = UserSettings.model_validate({
+                    **profile.user_settings.model_dump(),
+                    **user_settings_data
+                })
             
             # Import n8n instances
             if "n8n_instances" in settings_data:
-                self.n8n_instances.clear()
+                profile.n8n_instances.clear()
                 for instance_id, instance_data in settings_data["n8n_instances"].items():
                     instance = N8nInstance(**instance_data)
-                    self.n8n_instances[instance_id] = instance
+                    profile.n8n_instances[instance_id] = instance
                     
                     # Set default instance
                     if instance.is_default:
-                        self.user_settings.default_n8n_instance = instance_id
-            
-            self.user_settings.updated_at = datetime.utcnow()
+                        profile.user_settings.default_n8n_instance = instance_id
             
+            profile.user_settings.updated_at = datetime.utcnow()
+        
+        try:
+            await self._modify(user_id, change)
             logger.info("Settings imported successfully")
             
         except Exception as e:
             logger.error(f"Error importing settings: {e}")
             raise ValueError(f"Failed to import settings: {str(e)}")
     
-    async def _unset_other_defaults(self, exclude_instance_id: str):
+    @staticmethod
+    def _unset_other_defaults(profile: SettingsProfile, exclude_instance_id: str):
         """Unset default flag from other n8n instances"""
         
-        for instance_id, instance in self.n8n_instances.items():
+        for instance_id, instance in profile.n8n_instances.items():
             if instance_id != exclude_instance_id:
                 instance.is_default = False
+
+@lru_cache()
+def get_settings_service() -> SettingsService:
+    """Process-wide SettingsService, injected into endpoints as a dependency"""
+    return SettingsService()
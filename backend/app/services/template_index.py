@@ -0,0 +1,262 @@
+"""
+Inverted index and ranked search over workflow templates
+"""
+
+import base64
+import heapq
+import json
+import math
+import re
+from bisect import bisect_right, insort
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+from app.models.workflow import WorkflowTemplate
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+# BM25 parameters
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# Name tokens count more than description tokens
+NAME_WEIGHT = 2
+
+FACET_FIELDS = ("category", "tags", "node_types")
+
+def tokenize(text: str) -> List[str]:
+    """Split text into lowercase alphanumeric terms"""
+    return TOKEN_PATTERN.findall(text.lower()) if text else []
+
+def encode_cursor(key: Tuple) -> str:
+    """Encode a sort key as an opaque pagination cursor"""
+    return base64.urlsafe_b64encode(json.dumps(list(key)).encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> Tuple:
+    """Decode a pagination cursor back into a sort key; raises ValueError if malformed"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        key = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (ValueError, TypeError):
+        raise ValueError(f"Invalid cursor: {cursor}")
+    # Sort keys are numbers followed by a template ID
+    if (
+        not isinstance(key, list)
+        or len(key) not in (2, 3)
+        or not isinstance(key[-1], str)
+        or not all(isinstance(value, (int, float)) and not isinstance(value, bool) for value in key[:-1])
+    ):
+        raise ValueError(f"Invalid cursor: {cursor}")
+    return tuple(key)
+
+class TemplateIndex:
+    """Incrementally maintained inverted indexes over templates.
+
+    Filters are answered from posting sets, free-text queries are ranked with
+    BM25 over name and description, and the default listing order is kept
+    sorted so pages are found by bisection instead of a full sort.
+    """
+
+    def __init__(self):
+        self.templates: Dict[str, WorkflowTemplate] = {}
+        self.facets: Dict[str, Dict[str, Set[str]]] = {field: {} for field in FACET_FIELDS}
+        self.doc_facets: Dict[str, Dict[str, Tuple[str, ...]]] = {}
+        self.postings: Dict[str, Dict[str, int]] = {}
+        self.doc_lengths: Dict[str, int] = {}
+        self.total_length = 0
+        self.sort_keys: Dict[str, Tuple] = {}
+        self.order: List[Tuple] = []
+
+    def __len__(self) -> int:
+        return len(self.templates)
+
+    def add(self, template: WorkflowTemplate):
+        """Index a template, replacing any previous entry with the same ID"""
+
+        template_id = template.template_id
+        if template_id in self.templates:
+            self.remove(template_id)
+
+        self.templates[template_id] = template
+
+        values = {
+            "category": (template.category,),
+            "tags": tuple(dict.fromkeys(template.tags)),
+            "node_types": tuple(dict.fromkeys(node.type for node in template.workflow.nodes))
+        }
+        self.doc_facets[template_id] = values
+        for field, field_values in values.items():
+            for value in field_values:
+                self.facets[field].setdefault(value, set()).add(template_id)
+
+        terms = Counter(tokenize(template.description))
+        for term in tokenize(template.name):
+            terms[term] += NAME_WEIGHT
+        for term, frequency in terms.items():
+            self.postings.setdefault(term, {})[template_id] = frequency
+        length = sum(terms.values())
+        self.doc_lengths[template_id] = length
+        self.total_length += length
+
+        key = self._sort_key(template)
+        self.sort_keys[template_id] = key
+        insort(self.order, key)
+
+    def remove(self, template_id: str):
+        """Remove a template from all indexes"""
+
+        if template_id not in self.templates:
+            return
+        template = self.templates.pop(template_id)
+
+        for field, field_values in self.doc_facets.pop(template_id).items():
+            for value in field_values:
+                posting = self.facets[field].get(value)
+                if posting is not None:
+                    posting.discard(template_id)
+                    if not posting:
+                        del self.facets[field][value]
+
+        terms = set(tokenize(template.name)) | set(tokenize(template.description))
+        for term in terms:
+            posting = self.postings.get(term)
+            if posting is not None:
+                posting.pop(template_id, None)
+                if not posting:
+                    del self.postings[term]
+        self.total_length -= self.doc_lengths.pop(template_id)
+
+        self._remove_sort_key(template_id)
+
+    def touch(self, template: WorkflowTemplate):
+        """Reposition a template after its usage count changed"""
+
+        if template.template_id not in self.templates:
+            return
+        self._remove_sort_key(template.template_id)
+        key = self._sort_key(template)
+        self.sort_keys[template.template_id] = key
+        insort(self.order, key)
+
+    def search(
+        self,
+        query: Optional[str] = None,
+        category: Optional[str] = None,
+        tags: Optional[List[str]] = None,
+        node_types: Optional[List[str]] = None,
+        limit: int = 50,
+        cursor: Optional[str] = None,
+        offset: int = 0,
+        include_facets: bool = True
+    ) -> Dict:
+        """Filter, rank and paginate templates.
+
+        Results are ordered by BM25 score when a query is given and by usage
+        count and creation date otherwise. The returned cursor continues
+        after the last item of the page.
+        """
+
+        filters = []
+        if category and category != "all":
+            filters.append(self.facets["category"].get(category, set()))
+        for tag in tags or []:
+            filters.append(self.facets["tags"].get(tag, set()))
+        for node_type in node_types or []:
+            filters.append(self.facets["node_types"].get(node_type, set()))
+        candidates = self._intersect(filters) if filters else None
+
+        terms = tokenize(query) if query else []
+        after = decode_cursor(cursor) if cursor else None
+        if after is not None and len(after) != (2 if terms else 3):
+            raise ValueError(f"Cursor does not belong to this query: {cursor}")
+
+        if terms:
+            scores = self._score(terms, candidates)
+            matches = scores.keys()
+            keyed = ((-score, template_id) for template_id, score in scores.items())
+        elif candidates is not None:
+            matches = candidates
+            keyed = (self.sort_keys[template_id] for template_id in candidates)
+        else:
+            matches = self.templates.keys()
+            keyed = None
+
+        # Fetch one extra key to know whether another page follows
+        if keyed is None:
+            # Unfiltered listing: the order list is already sorted
+            start = bisect_right(self.order, after) if after else offset
+            page_keys = self.order[start:start + limit + 1]
+        elif after:
+            page_keys = heapq.nsmallest(limit + 1, (key for key in keyed if key > after))
+        else:
+            page_keys = heapq.nsmallest(offset + limit + 1, keyed)[offset:]
+
+        next_cursor = encode_cursor(page_keys[limit - 1]) if len(page_keys) > limit > 0 else None
+        page_keys = page_keys[:limit]
+        unfiltered = candidates is None and not terms
+
+        return {
+            "items": [self.templates[key[-1]] for key in page_keys],
+            "total": len(matches),
+            "facets": self._facet_counts(matches, unfiltered) if include_facets else {},
+            "next_cursor": next_cursor
+        }
+
+    def _score(self, terms: List[str], candidates: Optional[Set[str]]) -> Dict[str, float]:
+        """Compute BM25 scores for documents containing any query term"""
+
+        document_count = len(self.templates)
+        average_length = self.total_length / document_count if document_count else 0.0
+        scores: Dict[str, float] = {}
+
+        for term in set(terms):
+            posting = self.postings.get(term)
+            if not posting:
+                continue
+            idf = math.log(1 + (document_count - len(posting) + 0.5) / (len(posting) + 0.5))
+            for template_id, frequency in posting.items():
+                if candidates is not None and template_id not in candidates:
+                    continue
+                length_norm = 1 - BM25_B + BM25_B * self.doc_lengths[template_id] / (average_length or 1)
+                score = idf * frequency * (BM25_K1 + 1) / (frequency + BM25_K1 * length_norm)
+                scores[template_id] = scores.get(template_id, 0.0) + score
+
+        return scores
+
+    def _facet_counts(self, matches: Iterable[str], unfiltered: bool) -> Dict[str, Dict[str, int]]:
+        """Count facet values over the matching templates"""
+
+        if unfiltered:
+            return {
+                field: {value: len(ids) for value, ids in values.items()}
+                for field, values in self.facets.items()
+            }
+
+        counts = {field: Counter() for field in FACET_FIELDS}
+        for template_id in matches:
+            for field, field_values in self.doc_facets[template_id].items():
+                counts[field].update(field_values)
+        return {field: dict(counter) for field, counter in counts.items()}
+
+    def _remove_sort_key(self, template_id: str):
+        key = self.sort_keys.pop(template_id, None)
+        if key is None:
+            return
+        position = bisect_right(self.order, key) - 1
+        if position >= 0 and self.order[position] == key:
+            del self.order[position]
+
+    @staticmethod
+    def _intersect(sets: List[Set[str]]) -> Set[str]:
+        """Intersect posting sets, starting from the smallest"""
+        ordered = sorted(sets, key=len)
+        result = set(ordered[0])
+        for posting in ordered[1:]:
+            result &= posting
+            if not result:
+                break
+        return result
+
+    @staticmethod
+    def _sort_key(template: WorkflowTemplate) -> Tuple:
+        """Default listing order: most used, then newest, then by ID"""
+        return (-template.usage_count, -template.created_at.timestamp(), template.template_id)
@@ -0,0 +1,72 @@
+"""
+Frozen, pre-validated template snapshots for copy-on-write instantiation
+"""
+
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Dict, List
+from pydantic import ConfigDict
+from app.core.frozen import FrozenDict, FrozenList, deep_freeze
+from app.models.workflow import Workflow, WorkflowNode, WorkflowTemplate
+
+class FrozenWorkflowNode(WorkflowNode):
+    """Workflow node shared between a template and the workflows created from it"""
+    model_config = ConfigDict(frozen=True)
+
+@dataclass(frozen=True)
+class TemplateSnapshot:
+    """Immutable copy of a template workflow, built once per template"""
+    template_id: str
+    nodes: FrozenList
+    connections: FrozenDict
+    settings: FrozenDict
+    staticData: FrozenDict
+    tags: FrozenList
+    warnings: List[str]
+
+    @classmethod
+    def build(cls, template: WorkflowTemplate, validation: Dict[str, Any]) -> "TemplateSnapshot":
+        """Freeze a validated template workflow"""
+        if not validation["valid"]:
+            raise ValueError(
+                f"Template {template.template_id} is invalid: {'; '.join(validation['errors'])}"
+            )
+
+        workflow = template.workflow
+        nodes = FrozenList(
+            FrozenWorkflowNode.model_construct(
+                _fields_set=node.model_fields_set,
+                **{field: deep_freeze(getattr(node, field)) for field in WorkflowNode.model_fields}
+            )
+            for node in workflow.nodes
+        )
+        return cls(
+            template_id=template.template_id,
+            nodes=nodes,
+            connections=deep_freeze(workflow.connections),
+            settings=deep_freeze(workflow.settings),
+            staticData=deep_freeze(workflow.staticData),
+            tags=deep_freeze(workflow.tags or []),
+            warnings=list(validation["warnings"])
+        )
+
+    def instantiate(self, name: str, version: int = 1) -> Workflow:
+        """Create a workflow sharing this snapshot's frozen payloads.
+
+        Runs in constant time regardless of template size. Frozen payloads are
+        only replaced, never modified, so patches copy the parts they change
+        and the template stays intact. ``version`` is the revision the new
+        workflow is stored as; it must be above that of any workflow it replaces.
+        """
+        now = datetime.utcnow()
+        return Workflow.model_construct(
+            name=name,
+            nodes=self.nodes,
+            connections=self.connections,
+            settings=self.settings,
+            staticData=self.staticData,
+            tags=self.tags,
+            version=version,
+            createdAt=now,
+            updatedAt=now
+        )
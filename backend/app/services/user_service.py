@@ -1,28 +1,70 @@
-from sqlalchemy.orm import Session
+from sqlalchemy import select, tuple_
 from sqlalchemy.exc import IntegrityError
-from passlib.context import CryptContext
+from sqlalchemy.ext.asyncio import AsyncSession
+import base64
+import binascii
 from datetime import datetime, timedelta, timezone
-from typing import Optional
+from typing import Dict, Iterable, List, Optional, Tuple
 from jose import JWTError, jwt
 from fastapi import HTTPException, status
+from starlette.concurrency import run_in_threadpool
 
 from ..models.user import User, UserCreate, UserUpdate, UserResponse, UserLogin
 from ..core.config import settings
+from ..core.cache import invalidation_log
+from ..core.hashing import HashingOverloadedError, password_hasher
+from ..core.token_cache import INVALIDATION_NAMESPACE as TOKEN_NAMESPACE, UserSnapshot, token_cache
 
-# Password hashing
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+def _hashing_unavailable() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="Too many authentication requests, please retry shortly",
+        headers={"Retry-After": "1"}
+    )
+
+# Columns handlers need; hashed_password is only loaded where it is checked
+USER_COLUMNS = (User.id, User.email, User.created_at, User.updated_at)
+
+def encode_user_cursor(created_at: datetime, user_id: int) -> str:
+    """Opaque cursor pointing after a user in (created_at, id) order"""
+    return base64.urlsafe_b64encode(f"{created_at.isoformat()}|{user_id}".encode()).decode()
+
+def decode_user_cursor(cursor: str) -> Tuple[datetime, int]:
+    """Parse a cursor made by encode_user_cursor"""
+    try:
+        created_at, user_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return datetime.fromisoformat(created_at), int(user_id)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid cursor"
+        )
+
+def _snapshot(row) -> UserSnapshot:
+    return UserSnapshot(
+        id=row.id,
+        email=row.email,
+        created_at=row.created_at,
+        updated_at=row.updated_at
+    )
 
 class UserService:
-    def __init__(self, db: Session):
+    def __init__(self, db: AsyncSession):
         self.db = db
     
-    def get_password_hash(self, password: str) -> str:
-        """Hash a password using bcrypt"""
-        return pwd_context.hash(password)
+    async def get_password_hash(self, password: str) -> str:
+        """Hash a password using bcrypt on the hashing pool"""
+        try:
+            return await password_hasher.hash(password)
+        except HashingOverloadedError:
+            raise _hashing_unavailable()
     
-    def verify_password(self, plain_password: str, hashed_password: str) -> bool:
-        """Verify a password against its hash"""
-        return pwd_context.verify(plain_password, hashed_password)
+    async def verify_password(self, plain_password: str, hashed_password: str) -> bool:
+        """Verify a password against its hash on the hashing pool"""
+        try:
+            return await password_hasher.verify(plain_password, hashed_password)
+        except HashingOverloadedError:
+            raise _hashing_unavailable()
     
     def create_access_token(self, data: dict, expires_delta: Optional[timedelta] = None):
         """Create JWT access token"""
@@ -44,18 +86,58 @@ class UserService:
         except JWTError:
             return None
     
-    def get_user_by_email(self, email: str) -> Optional[User]:
+    async def get_user_by_email(self, email: str) -> Optional[User]:
         """Get user by email"""
-        return self.db.query(User).filter(User.email == email).first()
+        result = await self.db.execute(select(User).where(User.email == email))
+        return result.scalar_one_or_none()
     
-    def get_user_by_id(self, user_id: int) -> Optional[User]:
+    async def get_user_by_id(self, user_id: int) -> Optional[User]:
         """Get user by ID"""
-        return self.db.query(User).filter(User.id == user_id).first()
+        result = await self.db.execute(select(User).where(User.id == user_id))
+        return result.scalar_one_or_none()
+    
+    async def get_user_snapshot(self, user_id: int) -> Optional[UserSnapshot]:
+        """Get the public fields of a user by ID"""
+        result = await self.db.execute(select(*USER_COLUMNS).where(User.id == user_id))
+        row = result.first()
+        return _snapshot(row) if row is not None else None
+    
+    async def get_user_id_by_email(self, email: str) -> Optional[int]:
+        """Get the ID of the user with an email, if any"""
+        result = await self.db.execute(select(User.id).where(User.email == email))
+        return result.scalar_one_or_none()
     
-    def create_user(self, user_data: UserCreate) -> User:
+    async def get_users_by_ids(self, user_ids: Iterable[int]) -> Dict[int, UserSnapshot]:
+        """Get the public fields of many users with one query; unknown IDs are left out"""
+        user_ids = set(user_ids)
+        if not user_ids:
+            return {}
+        result = await self.db.execute(select(*USER_COLUMNS).where(User.id.in_(user_ids)))
+        return {row.id: _snapshot(row) for row in result}
+    
+    async def list_users(
+        self, limit: int, cursor: Optional[str] = None
+    ) -> Tuple[List[UserSnapshot], Optional[str]]:
+        """List users oldest first, one page at a time.
+        
+        Pages continue from the cursor of the previous page using the
+        (created_at, id) index, so deep pages cost the same as the first.
+        """
+        query = select(*USER_COLUMNS).order_by(User.created_at, User.id).limit(limit + 1)
+        if cursor:
+            query = query.where(tuple_(User.created_at, User.id) > decode_user_cursor(cursor))
+        
+        users = [_snapshot(row) for row in await self.db.execute(query)]
+        next_cursor = None
+        if len(users) > limit:
+            users = users[:limit]
+            next_cursor = encode_user_cursor(users[-1].created_at, users[-1].id)
+        return users, next_cursor
+    
+    async def create_user(self, user_data: UserCreate) -> User:
         """Create a new user"""
         # Check if user already exists
-        if self.get_user_by_email(user_data.email):
+        if await self.get_user_id_by_email(user_data.email) is not None:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="Email already registered"
@@ -69,7 +151,7 @@ class UserService:
             )
         
         # Create new user
-        hashed_password = self.get_password_hash(user_data.password)
+        hashed_password = await self.get_password_hash(user_data.password)
         db_user = User(
             email=user_data.email,
             hashed_password=hashed_password
@@ -77,28 +159,46 @@ class UserService:
         
         try:
             self.db.add(db_user)
-            self.db.commit()
-            self.db.refresh(db_user)
+            await self.db.commit()
+            await self.db.refresh(db_user)
             return db_user
         except IntegrityError:
-            self.db.rollback()
+            await self.db.rollback()
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="Error creating user"
             )
     
-    def authenticate_user(self, email: str, password: str) -> Optional[User]:
+    async def authenticate_user(self, email: str, password: str) -> Optional[User]:
         """Authenticate user with email and password"""
-        user = self.get_user_by_email(email)
+        user = await self.get_user_by_email(email)
         if not user:
             return None
-        if not self.verify_password(password, user.hashed_password):
+        
+        try:
+            valid, new_hash = await password_hasher.verify_and_update(password, user.hashed_password)
+        except HashingOverloadedError:
+            raise _hashing_unavailable()
+        if not valid:
             return None
+        
+        # Transparently upgrade hashes made with a lower bcrypt cost
+        if new_hash:
+            user.hashed_password = new_hash
+            await self._commit_rehash(user)
         return user
     
-    def login_user(self, user_data: UserLogin) -> dict:
+    async def _commit_rehash(self, user: User):
+        try:
+            await self.db.commit()
+            await self.db.refresh(user)
+        except Exception:
+            # The old hash still works; try again on the next login
+            await self.db.rollback()
+    
+    async def login_user(self, user_data: UserLogin) -> dict:
         """Login user and return access token"""
-        user = self.authenticate_user(user_data.email, user_data.password)
+        user = await self.authenticate_user(user_data.email, user_data.password)
         if not user:
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
@@ -118,9 +218,10 @@ class UserService:
             "user": UserResponse.model_validate(user)
         }
     
-    def update_user(self, user_id: int, user_data: UserUpdate) -> User:
+    async def update_user(self, user_id: int, user_data: UserUpdate) -> User:
         """Update user profile"""
-        user = self.get_user_by_id(user_id)
+        await self._ensure_invalidation_schema()
+        user = await self.get_user_by_id(user_id)
         if not user:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
@@ -129,8 +230,8 @@ class UserService:
         
         # Check if new email already exists
         if user_data.email and user_data.email != user.email:
-            existing_user = self.get_user_by_email(user_data.email)
-            if existing_user and existing_user.id != user_id:
+            existing_user_id = await self.get_user_id_by_email(user_data.email)
+            if existing_user_id is not None and existing_user_id != user_id:
                 raise HTTPException(
                     status_code=status.HTTP_400_BAD_REQUEST,
                     detail="Email already registered"
@@ -143,26 +244,29 @@ class UserService:
         user.updated_at = datetime.now(timezone.utc)
         
         try:
-            self.db.commit()
-            self.db.refresh(user)
+            await self._publish_user_change(user_id)
+            await self.db.commit()
+            await self.db.refresh(user)
+            token_cache.invalidate_user(user_id)
             return user
         except IntegrityError:
-            self.db.rollback()
+            await self.db.rollback()
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="Error updating user"
             )
     
-    def change_password(self, user_id: int, current_password: str, new_password: str) -> bool:
+    async def change_password(self, user_id: int, current_password: str, new_password: str) -> bool:
         """Change user password"""
-        user = self.get_user_by_id(user_id)
+        await self._ensure_invalidation_schema()
+        user = await self.get_user_by_id(user_id)
         if not user:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail="User not found"
             )
         
-        if not self.verify_password(current_password, user.hashed_password):
+        if not await self.verify_password(current_password, user.hashed_password):
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="Current password is incorrect"
@@ -175,15 +279,26 @@ class UserService:
                 detail="New password must be at least 8 characters long"
             )
         
-        user.hashed_password = self.get_password_hash(new_password)
+        user.hashed_password = await self.get_password_hash(new_password)
         user.updated_at = datetime.now(timezone.utc)
         
         try:
-            self.db.commit()
+            await self._publish_user_change(user_id)
+            await self.db.commit()
+            token_cache.invalidate_user(user_id)
             return True
         except Exception:
-            self.db.rollback()
+            await self.db.rollback()
             raise HTTPException(
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                 detail="Error changing password"
             )
+    
+    async def _ensure_invalidation_schema(self):
+        """Create the invalidation table once, before the session starts a transaction"""
+        if not invalidation_log.schema_ready:
+            await run_in_threadpool(invalidation_log.ensure_schema)
+    
+    async def _publish_user_change(self, user_id: int):
+        """Tell other workers to drop cached tokens of a user once this session commits"""
+        await invalidation_log.publish_async(self.db, TOKEN_NAMESPACE, str(user_id))
@@ -0,0 +1,383 @@
+"""
+Canvas geometry for workflows: bounding boxes and automatic layered layout
+"""
+
+import logging
+from collections import OrderedDict, deque
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+from app.models.workflow import Workflow
+
+try:
+    import numpy as np
+except ImportError:  # optional, only used to speed up large layouts
+    np = None
+
+logger = logging.getLogger(__name__)
+
+# Canvas size derived from the bounding box
+MIN_CANVAS_WIDTH = 800
+MIN_CANVAS_HEIGHT = 600
+CANVAS_PADDING_X = 400
+CANVAS_PADDING_Y = 300
+
+# Layered layout geometry
+LAYOUT_ORIGIN = (100, 100)
+LAYER_SPACING = 250
+NODE_SPACING = 150
+CROSSING_SWEEPS = 4
+
+# Nodes closer than this overlap on the n8n canvas
+COLLISION_WIDTH = 100
+COLLISION_HEIGHT = 80
+
+# Graph size from which barycenter sweeps run vectorized
+NUMPY_MIN_NODES = 500
+LAYOUT_CACHE_SIZE = 256
+
+Position = Tuple[int, int]
+
+def node_position(node: Any) -> Optional[Position]:
+    """Get a node position as an (x, y) tuple, or None if it is missing"""
+    position = node.get("position") if isinstance(node, dict) else getattr(node, "position", None)
+    if not position or len(position) != 2:
+        return None
+    return position[0], position[1]
+
+@dataclass(frozen=True)
+class BoundingBox:
+    """Axis-aligned bounding box of node positions"""
+    min_x: int
+    min_y: int
+    max_x: int
+    max_y: int
+
+    @classmethod
+    def of(cls, positions: Iterable[Optional[Position]]) -> Optional["BoundingBox"]:
+        """Compute the box of all positions in a single pass"""
+        min_x = min_y = max_x = max_y = None
+        for position in positions:
+            if position is None:
+                continue
+            x, y = position
+            if min_x is None:
+                min_x = max_x = x
+                min_y = max_y = y
+                continue
+            if x < min_x:
+                min_x = x
+            elif x > max_x:
+                max_x = x
+            if y < min_y:
+                min_y = y
+            elif y > max_y:
+                max_y = y
+        if min_x is None:
+            return None
+        return cls(min_x, min_y, max_x, max_y)
+
+    def expanded(self, positions: Iterable[Optional[Position]]) -> "BoundingBox":
+        """Return the box grown to include additional positions"""
+        extra = BoundingBox.of(positions)
+        if extra is None:
+            return self
+        return BoundingBox(
+            min(self.min_x, extra.min_x), min(self.min_y, extra.min_y),
+            max(self.max_x, extra.max_x), max(self.max_y, extra.max_y)
+        )
+
+    def on_edge(self, position: Optional[Position]) -> bool:
+        """Check whether a position lies on the box boundary"""
+        if position is None:
+            return False
+        x, y = position
+        return x in (self.min_x, self.max_x) or y in (self.min_y, self.max_y)
+
+def canvas_size(box: Optional[BoundingBox]) -> Dict[str, int]:
+    """Canvas size needed to show a bounding box with padding"""
+    if box is None:
+        return {"width": MIN_CANVAS_WIDTH, "height": MIN_CANVAS_HEIGHT}
+    return {
+        "width": max(MIN_CANVAS_WIDTH, box.max_x - box.min_x + CANVAS_PADDING_X),
+        "height": max(MIN_CANVAS_HEIGHT, box.max_y - box.min_y + CANVAS_PADDING_Y)
+    }
+
+def has_overlaps(positions: Sequence[Optional[Position]]) -> bool:
+    """Check for missing positions or nodes drawn on top of each other"""
+    grid: Dict[Position, List[Position]] = {}
+    for position in positions:
+        if position is None:
+            return True
+        x, y = position
+        cell = (int(x // COLLISION_WIDTH), int(y // COLLISION_HEIGHT))
+        for dx in (-1, 0, 1):
+            for dy in (-1, 0, 1):
+                for other_x, other_y in grid.get((cell[0] + dx, cell[1] + dy), ()):
+                    if abs(other_x - x) < COLLISION_WIDTH and abs(other_y - y) < COLLISION_HEIGHT:
+                        return True
+        grid.setdefault(cell, []).append(position)
+    return False
+
+def connection_edges(nodes: Sequence[Any], connections: Dict[str, Any]) -> List[Tuple[int, int]]:
+    """Resolve connections to (source, target) node index pairs.
+
+    Connection sources and targets may refer to nodes by name or by ID.
+    """
+    index: Dict[str, int] = {}
+    for position, node in enumerate(nodes):
+        index.setdefault(node.name, position)
+        index.setdefault(node.id, position)
+
+    edges = set()
+    for source, targets in connections.items():
+        source_index = index.get(source)
+        if source_index is None or not isinstance(targets, list):
+            continue
+        for target in targets:
+            if not isinstance(target, dict):
+                continue
+            target_index = index.get(target.get("node") or target.get("target"))
+            if target_index is not None and target_index != source_index:
+                edges.add((source_index, target_index))
+    return sorted(edges)
+
+def _remove_cycles(count: int, edges: List[Tuple[int, int]]) -> List[Tuple[int, int]]:
+    """Reverse DFS back edges so the graph becomes acyclic"""
+    adjacency: List[List[int]] = [[] for _ in range(count)]
+    for source, target in edges:
+        adjacency[source].append(target)
+
+    state = [0] * count  # 0 = unvisited, 1 = on stack, 2 = done
+    back_edges = set()
+    for root in range(count):
+        if state[root]:
+            continue
+        state[root] = 1
+        stack = [(root, iter(adjacency[root]))]
+        while stack:
+            node, children = stack[-1]
+            for child in children:
+                if state[child] == 1:
+                    back_edges.add((node, child))
+                elif state[child] == 0:
+                    state[child] = 1
+                    stack.append((child, iter(adjacency[child])))
+                    break
+            else:
+                state[node] = 2
+                stack.pop()
+
+    return [
+        (target, source) if (source, target) in back_edges else (source, target)
+        for source, target in edges
+    ]
+
+def _assign_layers(count: int, edges: List[Tuple[int, int]]) -> List[int]:
+    """Longest-path layering of an acyclic graph"""
+    successors: List[List[int]] = [[] for _ in range(count)]
+    indegree = [0] * count
+    for source, target in edges:
+        successors[source].append(target)
+        indegree[target] += 1
+
+    layer = [0] * count
+    queue = deque(node for node in range(count) if indegree[node] == 0)
+    while queue:
+        node = queue.popleft()
+        for child in successors[node]:
+            layer[child] = max(layer[child], layer[node] + 1)
+            indegree[child] -= 1
+            if indegree[child] == 0:
+                queue.append(child)
+    return layer
+
+def _order_python(
+    layers: List[List[int]],
+    edges: List[Tuple[int, int]],
+    order: List[int]
+) -> List[int]:
+    """Barycenter crossing reduction with alternating sweeps"""
+    predecessors: Dict[int, List[int]] = {}
+    successors: Dict[int, List[int]] = {}
+    for source, target in edges:
+        predecessors.setdefault(target, []).append(source)
+        successors.setdefault(source, []).append(target)
+
+    for sweep in range(CROSSING_SWEEPS):
+        downward = sweep % 2 == 0
+        neighbours = predecessors if downward else successors
+        sequence = layers[1:] if downward else layers[-2::-1]
+        for layer in sequence:
+            def barycenter(node):
+                linked = neighbours.get(node)
+                if not linked:
+                    return order[node]
+                return sum(order[other] for other in linked) / len(linked)
+            layer.sort(key=barycenter)
+            for position, node in enumerate(layer):
+                order[node] = position
+    return order
+
+def _group_edges(edge_array, edge_layers, layer_count: int) -> List[Any]:
+    """Split an edge array into per-layer groups with one sort"""
+    ordering = np.argsort(edge_layers, kind="stable")
+    bounds = np.searchsorted(edge_layers[ordering], np.arange(layer_count + 1))
+    return [edge_array[ordering[bounds[index]:bounds[index + 1]]] for index in range(layer_count)]
+
+def _order_numpy(
+    layers: List[List[int]],
+    edges: List[Tuple[int, int]],
+    order: List[int]
+) -> List[int]:
+    """Vectorized barycenter crossing reduction for large graphs"""
+    positions = np.asarray(order, dtype=np.float64)
+    layer_nodes = [np.asarray(layer, dtype=np.int64) for layer in layers]
+    local = np.zeros(len(order), dtype=np.int64)
+    for nodes in layer_nodes:
+        local[nodes] = np.arange(len(nodes))
+
+    edge_array = np.asarray(edges, dtype=np.int64).reshape(-1, 2)
+    node_layer = np.empty(len(order), dtype=np.int64)
+    for index, nodes in enumerate(layer_nodes):
+        node_layer[nodes] = index
+
+    # Edges grouped by the layer of the node being reordered, per direction
+    by_target = _group_edges(edge_array, node_layer[edge_array[:, 1]], len(layers))
+    by_source = _group_edges(edge_array, node_layer[edge_array[:, 0]], len(layers))
+
+    for sweep in range(CROSSING_SWEEPS):
+        downward = sweep % 2 == 0
+        sequence = range(1, len(layers)) if downward else range(len(layers) - 2, -1, -1)
+        for index in sequence:
+            nodes = layer_nodes[index]
+            group = by_target[index] if downward else by_source[index]
+            moving, fixed = (group[:, 1], group[:, 0]) if downward else (group[:, 0], group[:, 1])
+            slots = local[moving]
+            totals = np.bincount(slots, weights=positions[fixed], minlength=len(nodes))
+            counts = np.bincount(slots, minlength=len(nodes))
+            barycenters = np.where(counts > 0, totals / np.maximum(counts, 1), positions[nodes])
+            nodes = nodes[np.argsort(barycenters, kind="stable")]
+            layer_nodes[index] = nodes
+            positions[nodes] = np.arange(len(nodes))
+            local[nodes] = np.arange(len(nodes))
+
+    for index, nodes in enumerate(layer_nodes):
+        layers[index] = nodes.tolist()
+    return positions.astype(np.int64).tolist()
+
+def layered_layout(nodes: Sequence[Any], connections: Dict[str, Any]) -> List[Position]:
+    """Sugiyama-style layout: layers follow the connection flow left to right.
+
+    Cycles are broken by reversing DFS back edges, nodes are layered by
+    longest path, and barycenter sweeps reduce crossings within layers.
+    """
+    count = len(nodes)
+    if count == 0:
+        return []
+
+    edges = _remove_cycles(count, connection_edges(nodes, connections))
+    layer_of = _assign_layers(count, edges)
+
+    layers: List[List[int]] = [[] for _ in range(max(layer_of) + 1)]
+    for node, layer in enumerate(layer_of):
+        layers[layer].append(node)
+    order = [0] * count
+    for layer in layers:
+        for position, node in enumerate(layer):
+            order[node] = position
+
+    if np is not None and count >= NUMPY_MIN_NODES and edges:
+        order = _order_numpy(layers, edges, order)
+    else:
+        order = _order_python(layers, edges, order)
+
+    widest = max(len(layer) for layer in layers)
+    origin_x, origin_y = LAYOUT_ORIGIN
+    return [
+        (
+            origin_x + layer_of[node] * LAYER_SPACING,
+            int(origin_y + (order[node] + (widest - len(layers[layer_of[node]])) / 2) * NODE_SPACING)
+        )
+        for node in range(count)
+    ]
+
+@dataclass(frozen=True)
+class CanvasLayout:
+    """Computed node positions for one workflow version"""
+    positions: List[Position]
+    bounding_box: Optional[BoundingBox]
+
+class WorkflowCanvas:
+    """Per-workflow canvas state keyed by workflow version.
+
+    Bounding boxes are updated incrementally from the nodes a revision
+    replaced, and layouts are cached per (workflow, version).
+    """
+
+    def __init__(self, layout_cache_size: int = LAYOUT_CACHE_SIZE):
+        self.boxes: Dict[str, Tuple[int, Optional[BoundingBox]]] = {}
+        self.overlaps: Dict[str, Tuple[int, bool]] = {}
+        self.layouts: "OrderedDict[Tuple[str, int], CanvasLayout]" = OrderedDict()
+        self.layout_cache_size = layout_cache_size
+
+    def bounding_box(self, workflow_id: str, workflow: Workflow) -> Optional[BoundingBox]:
+        """Get the bounding box of a workflow's stored positions"""
+        cached = self.boxes.get(workflow_id)
+        if cached is not None and cached[0] == workflow.version:
+            return cached[1]
+        box = BoundingBox.of(node_position(node) for node in workflow.nodes)
+        self.boxes[workflow_id] = (workflow.version, box)
+        return box
+
+    def on_revision(self, workflow_id: str, previous: Workflow, current: Workflow):
+        """Carry the bounding box over to a new revision using only the changed nodes"""
+        cached = self.boxes.get(workflow_id)
+        if cached is None or cached[0] != previous.version:
+            self.boxes.pop(workflow_id, None)
+            return
+
+        box = cached[1]
+        if current.nodes is not previous.nodes:
+            remaining = {id(node) for node in current.nodes}
+            existing = {id(node) for node in previous.nodes}
+            removed = [node_position(node) for node in previous.nodes if id(node) not in remaining]
+            added = [node_position(node) for node in current.nodes if id(node) not in existing]
+            if box is None or any(box.on_edge(position) for position in removed):
+                # A boundary node moved or left; the box can shrink, so recompute it
+                box = BoundingBox.of(node_position(node) for node in current.nodes)
+            else:
+                box = box.expanded(added)
+        self.boxes[workflow_id] = (current.version, box)
+
+    def needs_layout(self, workflow_id: str, workflow: Workflow) -> bool:
+        """Check whether stored positions are missing or overlapping"""
+        cached = self.overlaps.get(workflow_id)
+        if cached is not None and cached[0] == workflow.version:
+            return cached[1]
+        overlapping = has_overlaps([node_position(node) for node in workflow.nodes])
+        self.overlaps[workflow_id] = (workflow.version, overlapping)
+        return overlapping
+
+    def layout(self, workflow_id: str, workflow: Workflow) -> CanvasLayout:
+        """Get the layered layout of a workflow version, computing it once"""
+        key = (workflow_id, workflow.version)
+        cached = self.layouts.get(key)
+        if cached is not None:
+            self.layouts.move_to_end(key)
+            return cached
+
+        positions = layered_layout(workflow.nodes, workflow.connections)
+        layout = CanvasLayout(positions=positions, bounding_box=BoundingBox.of(positions))
+        self.layouts[key] = layout
+        if len(self.layouts) > self.layout_cache_size:
+            self.layouts.popitem(last=False)
+
+        logger.debug(f"Computed layout for workflow {workflow_id} version {workflow.version}")
+        return layout
+
+    def forget(self, workflow_id: str):
+        """Drop cached state of a workflow"""
+        self.boxes.pop(workflow_id, None)
+        self.overlaps.pop(workflow_id, None)
+        for key in [key for key in self.layouts if key[0] == workflow_id]:
+            del self.layouts[key]
@@ -0,0 +1,192 @@
+"""
+Incremental extraction of workflow JSON from streamed AI output
+"""
+
+import json
+import logging
+import re
+from typing import Any, Dict, List
+
+logger = logging.getLogger(__name__)
+
+# Fence info strings whose body is scanned for JSON; bare fences included
+JSON_FENCE_LANGUAGES = {"", "json", "jsonc", "n8n"}
+
+# Objects larger than this are abandoned instead of buffered further
+MAX_OBJECT_CHARS = 4 * 1024 * 1024
+
+# Next character that matters outside or inside a JSON string
+_STRUCTURAL = re.compile(r'[{}\[\]"`]')
+_STRING_SPECIAL = re.compile(r'["\\]')
+
+def is_workflow_object(value: Any) -> bool:
+    """Whether a parsed value looks like an n8n workflow"""
+    return (
+        isinstance(value, dict)
+        and isinstance(value.get("nodes"), list)
+        and len(value["nodes"]) > 0
+    )
+
+class WorkflowJsonExtractor:
+    """Resumable scanner that finds workflow objects in fenced JSON blocks.
+
+    Chunks are fed as they arrive from the AI provider. The scanner keeps
+    its position in the markdown (outside a fence, reading the fence info
+    string, inside a fence) and, inside a JSON fence, the nesting depth and
+    string/escape state of the object being read. Each character is looked
+    at once; an object is parsed only when its closing brace arrives.
+    """
+
+    def __init__(self, max_object_chars: int = MAX_OBJECT_CHARS):
+        self.max_object_chars = max_object_chars
+        self._in_fence = False
+        self._json_fence = False
+        self._info: List[str] = []
+        self._reading_info = False
+        self._backticks = 0
+        self._parts: List[str] = []
+        self._size = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._skipping = False
+
+    def feed(self, text: str) -> List[Dict[str, Any]]:
+        """Consume a chunk and return the workflow objects it completed"""
+        found: List[Dict[str, Any]] = []
+        pos, end = 0, len(text)
+
+        while pos < end:
+            if self._depth:
+                pos = self._scan_object(text, pos, found)
+            elif self._reading_info:
+                pos = self._scan_info(text, pos)
+            else:
+                pos = self._scan_markdown(text, pos)
+
+        return found
+
+    def _scan_markdown(self, text: str, pos: int) -> int:
+        """Outside an object: look for fence markers and, in a JSON fence, an opening brace"""
+        char = text[pos]
+
+        if char == "`":
+            self._backticks += 1
+            if self._backticks == 3:
+                self._backticks = 0
+                if self._in_fence:
+                    self._in_fence = False
+                else:
+                    self._reading_info = True
+                    self._info = []
+            return pos + 1
+
+        self._backticks = 0
+        if self._in_fence and self._json_fence:
+            if char == "{":
+                self._start_object()
+            return pos + 1
+
+        # Prose and non-JSON fences only matter up to the next fence marker
+        next_tick = text.find("`", pos)
+        return len(text) if next_tick == -1 else next_tick
+
+    def _scan_info(self, text: str, pos: int) -> int:
+        """Read the fence info string up to the end of its line"""
+        newline = text.find("\n", pos)
+        if newline == -1:
+            self._info.append(text[pos:])
+            return len(text)
+
+        self._info.append(text[pos:newline])
+        language = "".join(self._info).strip().lower()
+        self._reading_info = False
+        self._in_fence = True
+        self._json_fence = language in JSON_FENCE_LANGUAGES
+        return newline + 1
+
+    def _start_object(self):
+        self._parts = ["{"]
+        self._size = 1
+        self._depth = 1
+        self._in_string = False
+        self._escape = False
+        self._skipping = False
+
+    def _scan_object(self, text: str, pos: int, found: List[Dict[str, Any]]) -> int:
+        """Advance through an object, tracking depth until it closes"""
+        start = pos
+        end = len(text)
+
+        while pos < end:
+            if self._escape:
+                self._escape = False
+                pos += 1
+                continue
+
+            if self._in_string:
+                match = _STRING_SPECIAL.search(text, pos)
+                if match is None:
+                    pos = end
+                    break
+                pos = match.end()
+                if match.group() == "\\":
+                    self._escape = True
+                else:
+                    self._in_string = False
+                continue
+
+            match = _STRUCTURAL.search(text, pos)
+            if match is None:
+                pos = end
+                break
+            char = match.group()
+            pos = match.end()
+
+            if char == '"':
+                self._in_string = True
+            elif char in "{[":
+                self._depth += 1
+            elif char in "}]":
+                self._depth -= 1
+                if self._depth == 0:
+                    self._buffer(text[start:pos])
+                    self._finish_object(found)
+                    return pos
+            else:
+                # A fence marker inside an unfinished object: the model
+                # closed the block early, so the object is dropped
+                self._depth = 0
+                self._parts = []
+                self._size = 0
+                self._backticks = 0
+                return pos - 1
+
+        self._buffer(text[start:pos])
+        return pos
+
+    def _buffer(self, piece: str):
+        if self._skipping:
+            return
+        self._size += len(piece)
+        if self._size > self.max_object_chars:
+            logger.warning("Abandoning streamed JSON object over %d characters", self.max_object_chars)
+            self._skipping = True
+            self._parts = []
+            return
+        self._parts.append(piece)
+
+    def _finish_object(self, found: List[Dict[str, Any]]):
+        parts, skipping = self._parts, self._skipping
+        self._parts = []
+        self._size = 0
+        self._skipping = False
+        if skipping:
+            return
+
+        try:
+            value = json.loads("".join(parts))
+        except ValueError:
+            return
+        if is_workflow_object(value):
+            found.append(value)
@@ -0,0 +1,62 @@
+"""
+Bounded undo/redo history of workflow revisions
+"""
+
+from collections import deque
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Deque, Dict, List, Optional
+
+@dataclass
+class WorkflowRevision:
+    """A single committed change, stored as forward and inverse patches"""
+    version: int
+    operations: List[Dict[str, Any]]
+    inverse: List[Dict[str, Any]]
+    created_at: datetime = field(default_factory=datetime.utcnow)
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "version": self.version,
+            "operation_count": len(self.operations),
+            "paths": [op["path"] for op in self.operations],
+            "created_at": self.created_at
+        }
+
+class WorkflowHistory:
+    """Undo and redo stacks for one workflow.
+
+    Revisions only hold the patches and the values they displaced, so the
+    memory used per revision is proportional to the change itself. The
+    stacks only apply to the workflow version they were built on, kept in
+    ``version``; a write that bypassed this history makes them unusable.
+    """
+
+    def __init__(self, limit: int):
+        self.undo_stack: Deque[WorkflowRevision] = deque(maxlen=limit)
+        self.redo_stack: Deque[WorkflowRevision] = deque(maxlen=limit)
+        self.version: Optional[int] = None
+
+    def record(self, revision: WorkflowRevision):
+        """Record a new change; any redo branch is discarded"""
+        self.undo_stack.append(revision)
+        self.redo_stack.clear()
+        self.version = revision.version
+
+    def pop_undo(self) -> Optional[WorkflowRevision]:
+        return self.undo_stack.pop() if self.undo_stack else None
+
+    def pop_redo(self) -> Optional[WorkflowRevision]:
+        return self.redo_stack.pop() if self.redo_stack else None
+
+    def push_undo(self, revision: WorkflowRevision):
+        self.undo_stack.append(revision)
+
+    def push_redo(self, revision: WorkflowRevision):
+        self.redo_stack.append(revision)
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "undo": [revision.summary() for revision in reversed(self.undo_stack)],
+            "redo": [revision.summary() for revision in reversed(self.redo_stack)]
+        }
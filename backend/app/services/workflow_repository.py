@@ -0,0 +1,296 @@
+"""
+Workflow storage backends with a per-worker read-through cache
+"""
+
+import asyncio
+import logging
+import zlib
+from typing import Dict, Optional
+from sqlalchemy import select, update, delete
+from app.core.cache import LRUCache, InvalidationLog, invalidation_log
+from app.core.config import settings
+from app.core.database import Base, SessionLocal, engine
+from app.core.shared_state import SharedState, shared_state
+from app.models.workflow import Workflow, WorkflowRecord, WorkflowTagRecord
+
+logger = logging.getLogger(__name__)
+
+INVALIDATION_NAMESPACE = "workflow"
+
+# zlib level 6 is the usual size/speed balance for JSON documents
+COMPRESSION_LEVEL = 6
+
+class StaleWorkflowError(Exception):
+    """Raised when a workflow changed in storage since it was read"""
+
+    def __init__(self, workflow_id: str, current_version: Optional[int]):
+        super().__init__(f"Workflow {workflow_id} was modified concurrently")
+        self.current_version = current_version
+
+def encode_workflow(workflow: Workflow) -> bytes:
+    """Serialize a workflow to compressed JSON"""
+    return zlib.compress(workflow.model_dump_json().encode(), COMPRESSION_LEVEL)
+
+def decode_workflow(data: bytes) -> Workflow:
+    """Deserialize a workflow from compressed JSON"""
+    return Workflow.model_validate_json(zlib.decompress(data))
+
+class InMemoryWorkflowStore:
+    """Workflows kept in process memory; state is not shared between workers"""
+
+    def __init__(self):
+        self.workflows: Dict[str, Workflow] = {}
+
+    async def get(self, workflow_id: str) -> Optional[Workflow]:
+        """Get workflow by ID"""
+        return self.workflows.get(workflow_id)
+
+    async def save(
+        self,
+        workflow_id: str,
+        workflow: Workflow,
+        previous: Optional[Workflow] = None
+    ):
+        """Store a workflow, replacing the previous revision if given"""
+
+        current = self.workflows.get(workflow_id)
+        if previous is not None and current is not previous:
+            raise StaleWorkflowError(workflow_id, current.version if current else None)
+        self.workflows[workflow_id] = workflow
+
+class SqlWorkflowStore:
+    """Workflows persisted through SQLAlchemy and shared by all workers.
+
+    Decoded workflows are cached per worker under (id, version) and served
+    from memory. Writes are conditional on the version that was read, so a
+    worker with a stale entry gets StaleWorkflowError instead of overwriting
+    a newer revision. Other workers drop their entries when the invalidation
+    log reports the change.
+    """
+
+    def __init__(
+        self,
+        cache_size: int,
+        invalidations: InvalidationLog,
+        session_factory=SessionLocal
+    ):
+        self.cache = LRUCache(cache_size)
+        self.versions: Dict[str, int] = {}
+        self.invalidations = invalidations
+        self.session_factory = session_factory
+        self.schema_ready = False
+
+        invalidations.subscribe(INVALIDATION_NAMESPACE, self._invalidate, reset=self._reset)
+
+    async def get(self, workflow_id: str) -> Optional[Workflow]:
+        """Get workflow by ID, loading it from the database on a cache miss"""
+
+        await self.invalidations.refresh()
+
+        version = self.versions.get(workflow_id)
+        if version is not None:
+            workflow = self.cache.get((workflow_id, version))
+            if workflow is not None:
+                return workflow
+
+        workflow = await asyncio.to_thread(self._load, workflow_id)
+        if workflow is not None:
+            self._remember(workflow_id, workflow)
+        return workflow
+
+    async def save(
+        self,
+        workflow_id: str,
+        workflow: Workflow,
+        previous: Optional[Workflow] = None
+    ):
+        """Store a workflow, replacing the previous revision if given"""
+
+        try:
+            await asyncio.to_thread(self._write, workflow_id, workflow, previous)
+        except StaleWorkflowError:
+            self._invalidate(workflow_id, None)
+            raise
+        self._remember(workflow_id, workflow)
+
+    def _remember(self, workflow_id: str, workflow: Workflow):
+        """Cache a workflow as the latest known version"""
+
+        known = self.versions.get(workflow_id)
+        if known is not None and known != workflow.version:
+            self.cache.pop((workflow_id, known))
+        self.versions[workflow_id] = workflow.version
+        self.cache.set((workflow_id, workflow.version), workflow)
+
+    def _invalidate(self, workflow_id: str, version: Optional[int]):
+        """Forget the cached copy of a workflow changed elsewhere"""
+
+        known = self.versions.pop(workflow_id, None)
+        if known is not None:
+            self.cache.pop((workflow_id, known))
+
+    def _reset(self):
+        self.versions.clear()
+        self.cache.clear()
+
+    def _ensure_schema(self):
+        if not self.schema_ready:
+            self.invalidations.ensure_schema()
+            Base.metadata.create_all(
+                bind=engine,
+                tables=[WorkflowRecord.__table__, WorkflowTagRecord.__table__]
+            )
+            self.schema_ready = True
+
+    def _load(self, workflow_id: str) -> Optional[Workflow]:
+        self._ensure_schema()
+
+        with self.session_factory() as session:
+            data = session.execute(
+                select(WorkflowRecord.data).where(WorkflowRecord.id == workflow_id)
+            ).scalar_one_or_none()
+
+        return decode_workflow(data) if data is not None else None
+
+    def _write(self, workflow_id: str, workflow: Workflow, previous: Optional[Workflow]):
+        self._ensure_schema()
+
+        values = {
+            "name": workflow.name,
+            "active": workflow.active,
+            "version": workflow.version,
+            "created_at": workflow.createdAt,
+            "updated_at": workflow.updatedAt,
+            "data": encode_workflow(workflow)
+        }
+
+        with self.session_factory() as session:
+            if previous is not None:
+                # Only replace the revision this worker read
+                result = session.execute(
+                    update(WorkflowRecord)
+                    .where(WorkflowRecord.id == workflow_id)
+                    .where(WorkflowRecord.version == previous.version)
+                    .values(**values)
+                )
+                if result.rowcount != 1:
+                    session.rollback()
+                    current_version = session.execute(
+                        select(WorkflowRecord.version).where(WorkflowRecord.id == workflow_id)
+                    ).scalar_one_or_none()
+                    raise StaleWorkflowError(workflow_id, current_version)
+                tags_changed = (workflow.tags or []) != (previous.tags or [])
+            else:
+                record = session.get(WorkflowRecord, workflow_id)
+                if record is None:
+                    session.add(WorkflowRecord(id=workflow_id, **values))
+                else:
+                    for column, value in values.items():
+                        setattr(record, column, value)
+                session.flush()
+                tags_changed = True
+
+            if tags_changed:
+                session.execute(
+                    delete(WorkflowTagRecord).where(WorkflowTagRecord.workflow_id == workflow_id)
+                )
+                session.add_all(
+                    WorkflowTagRecord(workflow_id=workflow_id, tag=tag)
+                    for tag in dict.fromkeys(workflow.tags or [])
+                )
+
+            self.invalidations.publish(session, INVALIDATION_NAMESPACE, workflow_id, workflow.version)
+            session.commit()
+
+class RedisWorkflowStore:
+    """Workflows kept in Redis and shared by all workers.
+
+    Works like SqlWorkflowStore: decoded workflows are cached per worker
+    under (id, version), and writes only replace the version that was read.
+    Other workers learn about changes through Redis pub/sub instead of
+    polling, so their cached copies are dropped within milliseconds. The
+    highest version announced for each workflow is kept, so a read that was
+    in flight when a newer version was announced is not cached.
+    """
+
+    def __init__(self, cache_size: int, shared: SharedState):
+        self.cache = LRUCache(cache_size)
+        self.versions: Dict[str, int] = {}
+        self.announced = LRUCache(cache_size)
+        self.shared = shared
+
+        shared.subscribe(INVALIDATION_NAMESPACE, self._invalidate, reset=self._reset)
+
+    async def get(self, workflow_id: str) -> Optional[Workflow]:
+        """Get workflow by ID, loading it from Redis on a cache miss"""
+
+        await self.shared.refresh()
+
+        version = self.versions.get(workflow_id)
+        if version is not None:
+            workflow = self.cache.get((workflow_id, version))
+            if workflow is not None:
+                return workflow
+
+        entry = await self.shared.get(INVALIDATION_NAMESPACE, workflow_id)
+        if entry is None:
+            return None
+        workflow = decode_workflow(entry[1])
+        if workflow.version >= self.announced.get(workflow_id, 0):
+            self._remember(workflow_id, workflow)
+        return workflow
+
+    async def save(
+        self,
+        workflow_id: str,
+        workflow: Workflow,
+        previous: Optional[Workflow] = None
+    ):
+        """Store a workflow, replacing the previous revision if given"""
+
+        written, current_version = await self.shared.compare_and_set(
+            INVALIDATION_NAMESPACE,
+            workflow_id,
+            workflow.version,
+            encode_workflow(workflow),
+            expected=previous.version if previous is not None else None
+        )
+        if not written:
+            self._invalidate(workflow_id, None)
+            raise StaleWorkflowError(workflow_id, current_version)
+        self._remember(workflow_id, workflow)
+
+    def _remember(self, workflow_id: str, workflow: Workflow):
+        """Cache a workflow as the latest known version"""
+
+        known = self.versions.get(workflow_id)
+        if known is not None and known != workflow.version:
+            self.cache.pop((workflow_id, known))
+        self.versions[workflow_id] = workflow.version
+        self.cache.set((workflow_id, workflow.version), workflow)
+
+    def _invalidate(self, workflow_id: str, version: Optional[int]):
+        """Forget the cached copy of a workflow changed elsewhere"""
+
+        if version is not None and version > self.announced.get(workflow_id, 0):
+            self.announced.set(workflow_id, version)
+        known = self.versions.pop(workflow_id, None)
+        if known is not None:
+            self.cache.pop((workflow_id, known))
+
+    def _reset(self):
+        self.versions.clear()
+        self.cache.clear()
+
+def create_workflow_store():
+    """Create the workflow store selected by settings"""
+
+    if settings.workflow_storage == "memory":
+        logger.info("Using in-memory workflow storage")
+        return InMemoryWorkflowStore()
+    if settings.workflow_storage == "redis":
+        logger.info("Using Redis workflow storage")
+        return RedisWorkflowStore(settings.workflow_cache_size, shared_state)
+    if settings.workflow_storage != "database":
+        raise ValueError(f"Unknown workflow storage: {settings.workflow_storage}")
+    return SqlWorkflowStore(settings.workflow_cache_size, invalidation_log)
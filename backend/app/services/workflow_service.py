@@ -5,22 +5,104 @@ Workflow Service for managing n8n workflows and templates
 import logging
 import uuid
 from datetime import datetime
-from typing import List, Optional, Dict, Any
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from pydantic import BaseModel
 from app.models.workflow import (
-    Workflow, WorkflowUpdate, WorkflowTemplate, 
-    WorkflowStats, WorkflowExecution
+    Workflow, WorkflowNode, WorkflowUpdate, WorkflowTemplate, 
+    WorkflowStats, WorkflowExecution, TemplateSearchResult
 )
+from app.core.config import settings
+from app.core.json_patch import JsonPatchError, apply_patch, make_patch, parse_pointer
+from app.services.workflow_history import WorkflowHistory, WorkflowRevision
+from app.services.template_index import TemplateIndex
+from app.services.template_snapshot import TemplateSnapshot
+from app.services.workflow_canvas import WorkflowCanvas, canvas_size
+from app.services.workflow_repository import StaleWorkflowError, create_workflow_store
 
 logger = logging.getLogger(__name__)
 
+# Fields maintained by the service that patches may not touch
+SERVER_MANAGED_FIELDS = {"id", "version", "createdAt", "updatedAt"}
+
+class WorkflowNotFoundError(ValueError):
+    """Raised when a workflow does not exist"""
+
+class WorkflowVersionConflict(ValueError):
+    """Raised when an expected workflow version does not match the current one"""
+    
+    def __init__(self, workflow_id: str, expected_version: int, current_version: int):
+        super().__init__(
+            f"Workflow {workflow_id} is at version {current_version}, "
+            f"expected {expected_version}"
+        )
+        self.current_version = current_version
+
+class WorkflowHistoryError(ValueError):
+    """Raised when there is nothing to undo or redo"""
+
+def validate_workflow_data(workflow_data: Dict[str, Any]) -> Dict[str, Any]:
+    """Validate workflow configuration; needs no service state"""
+    
+    errors = []
+    warnings = []
+    
+    # Check required fields
+    if "nodes" not in workflow_data:
+        errors.append("Missing required field: nodes")
+    if "connections" not in workflow_data:
+        errors.append("Missing required field: connections")
+    
+    # Validate nodes if present
+    if "nodes" in workflow_data and isinstance(workflow_data["nodes"], list):
+        for i, node in enumerate(workflow_data["nodes"]):
+            if not isinstance(node, dict):
+                errors.append(f"Node {i}: Invalid node format")
+                continue
+            
+            if "id" not in node:
+                errors.append(f"Node {i}: Missing required field: id")
+            if "name" not in node:
+                errors.append(f"Node {i}: Missing required field: name")
+            if "type" not in node:
+                errors.append(f"Node {i}: Missing required field: type")
+            if "position" not in node:
+                errors.append(f"Node {i}: Missing required field: position")
+            
+            # Check position format
+            if "position" in node and isinstance(node["position"], list):
+                if len(node["position"]) != 2:
+                    errors.append(f"Node {i}: Position must have exactly 2 coordinates")
+    
+    # Validate connections if present
+    if "connections" in workflow_data and isinstance(workflow_data["connections"], dict):
+        for source_id, targets in workflow_data["connections"].items():
+            if not isinstance(targets, list):
+                errors.append(f"Invalid connection format for source {source_id}")
+                continue
+            
+            for target in targets:
+                if not isinstance(target, dict):
+                    errors.append(f"Invalid target format in connection from {source_id}")
+    
+    return {
+        "valid": len(errors) == 0,
+        "errors": errors,
+        "warnings": warnings
+    }
+
 class WorkflowService:
     """Service for managing workflows and templates"""
     
     def __init__(self):
-        # In-memory storage (replace with database in production)
-        self.workflows: Dict[str, Workflow] = {}
+        # Workflows are shared through the configured store; templates,
+        # executions and undo history stay per worker
+        self.store = create_workflow_store()
         self.templates: Dict[str, WorkflowTemplate] = {}
         self.executions: Dict[str, List[WorkflowExecution]] = {}
+        self.histories: Dict[str, WorkflowHistory] = {}
+        self.template_index = TemplateIndex()
+        self.template_snapshots: Dict[str, TemplateSnapshot] = {}
+        self.canvas = WorkflowCanvas()
         
         # Initialize with some sample templates
         self._initialize_sample_templates()
@@ -112,70 +194,173 @@ class WorkflowService:
             created_at=datetime.utcnow()
         )
         
-        self.templates[email_slack_template.template_id] = email_slack_template
-        self.templates[db_sync_template.template_id] = db_sync_template
+        self._register_template(email_slack_template)
+        self._register_template(db_sync_template)
+    
+    def _register_template(self, template: WorkflowTemplate):
+        """Store a template and add it to the search index"""
+        self.templates[template.template_id] = template
+        self.template_index.add(template)
+        self.template_snapshots.pop(template.template_id, None)
+    
+    def _get_template_snapshot(self, template: WorkflowTemplate) -> TemplateSnapshot:
+        """Get the frozen, validated snapshot of a template, building it on first use"""
+        snapshot = self.template_snapshots.get(template.template_id)
+        if snapshot is None:
+            validation = validate_workflow_data(template.workflow.model_dump())
+            snapshot = TemplateSnapshot.build(template, validation)
+            self.template_snapshots[template.template_id] = snapshot
+        return snapshot
     
     async def get_workflow(self, workflow_id: str) -> Optional[Workflow]:
         """Get workflow by ID"""
-        return self.workflows.get(workflow_id)
+        return await self.store.get(workflow_id)
     
     async def update_workflow(
         self, 
         workflow_id: str, 
-        workflow_update: WorkflowUpdate
+        workflow_update: WorkflowUpdate,
+        expected_version: Optional[int] = None
     ) -> Workflow:
         """Update workflow"""
         
-        if workflow_id not in self.workflows:
-            raise ValueError(f"Workflow {workflow_id} not found")
-        
-        workflow = self.workflows[workflow_id]
-        
-        # Apply updates
-        if workflow_update.name is not None:
-            workflow.name = workflow_update.name
-        if workflow_update.nodes is not None:
-            workflow.nodes = workflow_update.nodes
-        if workflow_update.connections is not None:
-            workflow.connections = workflow_update.connections
-        if workflow_update.settings is not None:
-            workflow.settings = workflow_update.settings
-        if workflow_update.staticData is not None:
-            workflow.staticData = workflow_update.staticData
-        if workflow_update.tags is not None:
-            workflow.tags = workflow_update.tags
-        if workflow_update.active is not None:
-            workflow.active = workflow_update.active
-        
-        workflow.updatedAt = datetime.utcnow()
+        updates = {
+            field: getattr(workflow_update, field)
+            for field in WorkflowUpdate.model_fields
+            if getattr(workflow_update, field) is not None
+        }
+        updated_workflow = await self._replace_fields(
+            workflow_id, lambda workflow: updates, expected_version
+        )
         
         logger.info(f"Updated workflow {workflow_id}")
-        return workflow
+        return updated_workflow
     
-    async def update_workflow_metadata(
-        self, 
-        workflow_id: str, 
-        metadata: Dict[str, Any]
-    ):
-        """Update workflow metadata"""
+    async def patch_workflow(
+        self,
+        workflow_id: str,
+        operations: List[Dict[str, Any]],
+        expected_version: Optional[int] = None
+    ) -> Workflow:
+        """Apply a JSON Patch to a workflow as a new revision"""
+        
+        self._check_patch_paths(operations)
+        
+        while True:
+            workflow = await self._get_existing(workflow_id)
+            self._check_version(workflow_id, workflow, expected_version)
+            
+            patched, inverse = apply_patch(workflow, operations)
+            try:
+                updated_workflow = await self._store_revision(workflow_id, workflow, patched)
+                break
+            except WorkflowVersionConflict:
+                # Another worker wrote first; without an expected version, retry on fresh data
+                if expected_version is not None:
+                    raise
+        
+        if updated_workflow is not workflow:
+            self._get_history(workflow_id).record(WorkflowRevision(
+                version=updated_workflow.version,
+                operations=operations,
+                inverse=inverse
+            ))
+            logger.debug(
+                f"Patched workflow {workflow_id} to version {updated_workflow.version} "
+                f"({len(operations)} operations)"
+            )
         
-        if workflow_id not in self.workflows:
-            return
+        return updated_workflow
+    
+    async def undo_workflow(
+        self,
+        workflow_id: str,
+        expected_version: Optional[int] = None
+    ) -> Workflow:
+        """Revert the most recent workflow revision"""
+        
+        workflow = await self._get_existing(workflow_id)
+        self._check_version(workflow_id, workflow, expected_version)
+        
+        history = self._get_current_history(workflow_id, workflow)
+        revision = history.pop_undo()
+        if revision is None:
+            raise WorkflowHistoryError(f"Nothing to undo for workflow {workflow_id}")
         
-        workflow = self.workflows[workflow_id]
+        try:
+            restored, _ = apply_patch(workflow, revision.inverse)
+            updated_workflow = await self._store_revision(workflow_id, workflow, restored)
+        except (JsonPatchError, WorkflowVersionConflict):
+            history.push_undo(revision)
+            raise
+        
+        history.push_redo(revision)
+        history.version = updated_workflow.version
+        
+        logger.info(f"Undid revision {revision.version} of workflow {workflow_id}")
+        return updated_workflow
+    
+    async def redo_workflow(
+        self,
+        workflow_id: str,
+        expected_version: Optional[int] = None
+    ) -> Workflow:
+        """Re-apply the most recently undone workflow revision"""
+        
+        workflow = await self._get_existing(workflow_id)
+        self._check_version(workflow_id, workflow, expected_version)
+        
+        history = self._get_current_history(workflow_id, workflow)
+        revision = history.pop_redo()
+        if revision is None:
+            raise WorkflowHistoryError(f"Nothing to redo for workflow {workflow_id}")
+        
+        try:
+            patched, inverse = apply_patch(workflow, revision.operations)
+            updated_workflow = await self._store_revision(workflow_id, workflow, patched)
+        except (JsonPatchError, WorkflowVersionConflict):
+            history.push_redo(revision)
+            raise
+        
+        history.push_undo(WorkflowRevision(
+            version=updated_workflow.version,
+            operations=revision.operations,
+            inverse=inverse
+        ))
+        history.version = updated_workflow.version
+        
+        logger.info(f"Redid revision {revision.version} of workflow {workflow_id}")
+        return updated_workflow
+    
+    async def get_workflow_history(self, workflow_id: str) -> Dict[str, Any]:
+        """Get the undo/redo history of a workflow"""
         
-        if not hasattr(workflow, 'metadata'):
-            workflow.metadata = {}
+        workflow = await self._get_existing(workflow_id)
+        history = self.histories.get(workflow_id)
+        if history is not None and history.version == workflow.version:
+            summary = history.summary()
+        else:
+            summary = {"undo": [], "redo": []}
         
-        workflow.metadata.update(metadata)
-        workflow.updatedAt = datetime.utcnow()
+        return {
+            "workflow_id": workflow_id,
+            "version": workflow.version,
+            **summary
+        }
+    
+    async def get_workflow_stats_stamp(self, workflow_id: str) -> Tuple[Optional[int], int]:
+        """Cheap stamp that changes whenever the workflow stats do"""
         
-        logger.debug(f"Updated metadata for workflow {workflow_id}")
+        workflow = await self.store.get(workflow_id)
+        return (
+            workflow.version if workflow else None,
+            len(self.executions.get(workflow_id, []))
+        )
     
     async def get_workflow_stats(self, workflow_id: str) -> WorkflowStats:
         """Get workflow statistics"""
         
-        workflow = self.workflows.get(workflow_id)
+        workflow = await self.store.get(workflow_id)
         if not workflow:
             return WorkflowStats(
                 workflow_id=workflow_id,
@@ -234,7 +419,7 @@ class WorkflowService:
             template.template_id = str(uuid.uuid4())
         
         template.created_at = datetime.utcnow()
-        self.templates[template.template_id] = template
+        self._register_template(template)
         
         logger.info(f"Created template {template.template_id}")
         return template
@@ -247,16 +432,35 @@ class WorkflowService:
     ) -> List[WorkflowTemplate]:
         """Get workflow templates"""
         
-        templates = list(self.templates.values())
-        
-        # Filter by category if specified
-        if category and category != "all":
-            templates = [t for t in templates if t.category == category]
-        
-        # Sort by usage count and creation date
-        templates.sort(key=lambda t: (t.usage_count, t.created_at), reverse=True)
-        
-        return templates[offset:offset + limit]
+        # Ordered by usage count and creation date
+        result = self.template_index.search(
+            category=category,
+            limit=limit,
+            offset=offset,
+            include_facets=False
+        )
+        return result["items"]
+    
+    async def search_templates(
+        self,
+        query: Optional[str] = None,
+        category: Optional[str] = None,
+        tags: Optional[List[str]] = None,
+        node_types: Optional[List[str]] = None,
+        limit: int = 50,
+        cursor: Optional[str] = None
+    ) -> TemplateSearchResult:
+        """Search workflow templates with ranking, facets and cursor pagination"""
+        
+        result = self.template_index.search(
+            query=query,
+            category=category,
+            tags=tags,
+            node_types=node_types,
+            limit=limit,
+            cursor=cursor
+        )
+        return TemplateSearchResult(**result)
     
     async def get_template(self, template_id: str) -> Optional[WorkflowTemplate]:
         """Get specific workflow template"""
@@ -269,23 +473,32 @@ class WorkflowService:
         if not template:
             raise ValueError(f"Template {template_id} not found")
         
+        snapshot = self._get_template_snapshot(template)
+        
         # Increment usage count
         template.usage_count += 1
-        
-        # Create new workflow from template
-        new_workflow = Workflow(
-            name=f"{template.name} (Copy)",
-            nodes=template.workflow.nodes.copy(),
-            connections=template.workflow.connections.copy(),
-            settings=template.workflow.settings.copy(),
-            staticData=template.workflow.staticData.copy(),
-            tags=template.workflow.tags.copy() if template.workflow.tags else [],
-            createdAt=datetime.utcnow(),
-            updatedAt=datetime.utcnow()
-        )
-        
-        # Store new workflow
-        self.workflows[workflow_id] = new_workflow
+        self.template_index.touch(template)
+        
+        while True:
+            # Replace an existing workflow as its next version, so versions
+            # only go up and other workers drop their cached copies
+            current = await self.store.get(workflow_id)
+            
+            # Create new workflow sharing the template's frozen payloads
+            new_workflow = snapshot.instantiate(
+                name=f"{template.name} (Copy)",
+                version=current.version + 1 if current is not None else 1
+            )
+            
+            # Store new workflow
+            try:
+                await self.store.save(workflow_id, new_workflow, previous=current)
+                break
+            except StaleWorkflowError:
+                # Another worker wrote first; replace that version instead
+                continue
+        self.histories.pop(workflow_id, None)
+        self.canvas.forget(workflow_id)
         
         logger.info(f"Used template {template_id} to create workflow {workflow_id}")
         
@@ -302,12 +515,14 @@ class WorkflowService:
             return
         
         del self.templates[template_id]
+        self.template_index.remove(template_id)
+        self.template_snapshots.pop(template_id, None)
         logger.info(f"Deleted template {template_id}")
     
     async def get_workflow_info(self, workflow_id: str) -> Optional[Dict[str, Any]]:
         """Get detailed workflow information"""
         
-        workflow = self.workflows.get(workflow_id)
+        workflow = await self.store.get(workflow_id)
         if not workflow:
             return None
         
@@ -319,99 +534,94 @@ class WorkflowService:
             "recent_executions": await self.get_workflow_executions(workflow_id, 5)
         }
     
-    async def get_workflow_canvas(self, workflow_id: str) -> Optional[Dict[str, Any]]:
-        """Get workflow canvas data for visualization"""
+    async def get_workflow_canvas(
+        self, 
+        workflow_id: str, 
+        layout: str = "auto"
+    ) -> Optional[Dict[str, Any]]:
+        """Get workflow canvas data for visualization
+        
+        layout is "stored" to keep node positions, "layered" to always lay the
+        graph out, or "auto" to lay it out only when positions overlap.
+        """
+        
+        if layout not in ("auto", "stored", "layered"):
+            raise ValueError(f"Unknown canvas layout: {layout}")
         
-        workflow = self.workflows.get(workflow_id)
+        workflow = await self.store.get(workflow_id)
         if not workflow:
             return None
         
+        use_layout = layout == "layered" or (
+            layout == "auto" and self.canvas.needs_layout(workflow_id, workflow)
+        )
+        
+        if not use_layout:
+            return {
+                "nodes": workflow.nodes,
+                "connections": workflow.connections,
+                "canvas_size": canvas_size(self.canvas.bounding_box(workflow_id, workflow)),
+                "layout": "stored",
+                "version": workflow.version
+            }
+        
+        computed = self.canvas.layout(workflow_id, workflow)
         return {
-            "nodes": workflow.nodes,
+            "nodes": [
+                node.model_copy(update={"position": list(position)})
+                for node, position in zip(workflow.nodes, computed.positions)
+            ],
             "connections": workflow.connections,
-            "canvas_size": self._calculate_canvas_size(workflow.nodes)
+            "canvas_size": canvas_size(computed.bounding_box),
+            "layout": "layered",
+            "version": workflow.version
         }
     
-    async def apply_changes(self, workflow_id: str, changes: Dict[str, Any]) -> Dict[str, Any]:
+    async def apply_changes(
+        self,
+        workflow_id: str,
+        changes: Dict[str, Any],
+        expected_version: Optional[int] = None
+    ) -> Dict[str, Any]:
         """Apply changes to workflow"""
         
-        if workflow_id not in self.workflows:
-            raise ValueError(f"Workflow {workflow_id} not found")
-        
-        workflow = self.workflows[workflow_id]
-        
-        # Apply changes
-        if "nodes" in changes:
-            workflow.nodes = changes["nodes"]
-        if "connections" in changes:
-            workflow.connections = changes["connections"]
-        if "settings" in changes:
-            workflow.settings.update(changes["settings"])
-        
-        workflow.updatedAt = datetime.utcnow()
+        if "patch" in changes:
+            await self._get_existing(workflow_id)
+            workflow = await self.patch_workflow(workflow_id, changes["patch"], expected_version)
+        else:
+            nodes = None
+            if "nodes" in changes:
+                nodes = [WorkflowNode.model_validate(node) for node in changes["nodes"]]
+            
+            def updates_for(current: Workflow) -> Dict[str, Any]:
+                updates = {}
+                if nodes is not None:
+                    updates["nodes"] = nodes
+                if "connections" in changes:
+                    updates["connections"] = changes["connections"]
+                if "settings" in changes:
+                    updates["settings"] = {**current.settings, **changes["settings"]}
+                return updates
+            
+            workflow = await self._replace_fields(workflow_id, updates_for, expected_version)
         
         logger.info(f"Applied changes to workflow {workflow_id}")
         
         return {
             "workflow_id": workflow_id,
             "changes_applied": list(changes.keys()),
+            "version": workflow.version,
             "workflow": workflow
         }
     
     async def validate_workflow(self, workflow_data: Dict[str, Any]) -> Dict[str, Any]:
         """Validate workflow configuration"""
-        
-        errors = []
-        warnings = []
-        
-        # Check required fields
-        if "nodes" not in workflow_data:
-            errors.append("Missing required field: nodes")
-        if "connections" not in workflow_data:
-            errors.append("Missing required field: connections")
-        
-        # Validate nodes if present
-        if "nodes" in workflow_data and isinstance(workflow_data["nodes"], list):
-            for i, node in enumerate(workflow_data["nodes"]):
-                if not isinstance(node, dict):
-                    errors.append(f"Node {i}: Invalid node format")
-                    continue
-                
-                if "id" not in node:
-                    errors.append(f"Node {i}: Missing required field: id")
-                if "name" not in node:
-                    errors.append(f"Node {i}: Missing required field: name")
-                if "type" not in node:
-                    errors.append(f"Node {i}: Missing required field: type")
-                if "position" not in node:
-                    errors.append(f"Node {i}: Missing required field: position")
-                
-                # Check position format
-                if "position" in node and isinstance(node["position"], list):
-                    if len(node["position"]) != 2:
-                        errors.append(f"Node {i}: Position must have exactly 2 coordinates")
-        
-        # Validate connections if present
-        if "connections" in workflow_data and isinstance(workflow_data["connections"], dict):
-            for source_id, targets in workflow_data["connections"].items():
-                if not isinstance(targets, list):
-                    errors.append(f"Invalid connection format for source {source_id}")
-                    continue
-                
-                for target in targets:
-                    if not isinstance(target, dict):
-                        errors.append(f"Invalid target format in connection from {source_id}")
-        
-        return {
-            "valid": len(errors) == 0,
-            "errors": errors,
-            "warnings": warnings
-        }
+        return validate_workflow_data(workflow_data)
     
     async def get_workflow_preview(self, workflow_id: str) -> Optional[Dict[str, Any]]:
         """Get workflow preview for sidepanel display"""
         
-        workflow = self.workflows.get(workflow_id)
+        workflow = await self.store.get(workflow_id)
         if not workflow:
             return None
         
@@ -429,18 +639,133 @@ class WorkflowService:
         
         return preview
     
-    def _calculate_canvas_size(self, nodes: List[Dict[str, Any]]) -> Dict[str, int]:
-        """Calculate canvas size based on node positions"""
+    async def _replace_fields(
+        self,
+        workflow_id: str,
+        updates_for: Callable[[Workflow], Dict[str, Any]],
+        expected_version: Optional[int]
+    ) -> Workflow:
+        """Set workflow fields as a new revision holding only the modified parts"""
+        
+        while True:
+            workflow = await self._get_existing(workflow_id)
+            self._check_version(workflow_id, workflow, expected_version)
+            
+            # Diff against the requested state so the revision only records what changed
+            updated = workflow.model_copy(update=updates_for(workflow))
+            operations = make_patch(workflow, updated)
+            try:
+                return await self.patch_workflow(workflow_id, operations, workflow.version)
+            except WorkflowVersionConflict:
+                # Another worker wrote first; without an expected version, diff again
+                if expected_version is not None:
+                    raise
+    
+    async def _get_existing(self, workflow_id: str) -> Workflow:
+        """Get workflow by ID or raise if it does not exist"""
         
-        if not nodes:
-            return {"width": 800, "height": 600}
+        workflow = await self.store.get(workflow_id)
+        if workflow is None:
+            raise WorkflowNotFoundError(f"Workflow {workflow_id} not found")
+        return workflow
+    
+    def _get_history(self, workflow_id: str) -> WorkflowHistory:
+        """Get or create the revision history of a workflow"""
         
-        min_x = min(node.get("position", [0, 0])[0] for node in nodes)
-        max_x = max(node.get("position", [0, 0])[0] for node in nodes)
-        min_y = min(node.get("position", [0, 0])[1] for node in nodes)
-        max_y = max(node.get("position", [0, 0])[1] for node in nodes)
+        if workflow_id not in self.histories:
+            self.histories[workflow_id] = WorkflowHistory(settings.workflow_history_limit)
+        return self.histories[workflow_id]
+    
+    def _get_current_history(self, workflow_id: str, workflow: Workflow) -> WorkflowHistory:
+        """Get the revision history of a workflow if it was built on its current version.
+        
+        Histories are kept per worker while workflows may be written by any;
+        after such a write the recorded patches no longer match the document.
+        """
+        
+        history = self._get_history(workflow_id)
+        if history.version is not None and history.version != workflow.version:
+            self.histories.pop(workflow_id, None)
+            raise WorkflowHistoryError(
+                f"Workflow {workflow_id} changed to version {workflow.version} elsewhere; "
+                f"its undo history was cleared"
+            )
+        return history
+    
+    @staticmethod
+    def _check_version(
+        workflow_id: str, 
+        workflow: Workflow, 
+        expected_version: Optional[int]
+    ):
+        """Enforce optimistic concurrency against the current version"""
         
-        return {
-            "width": max(800, max_x - min_x + 400),
-            "height": max(600, max_y - min_y + 300)
-        }
+        if expected_version is not None and expected_version != workflow.version:
+            raise WorkflowVersionConflict(workflow_id, expected_version, workflow.version)
+    
+    @staticmethod
+    def _check_patch_paths(operations: List[Dict[str, Any]]):
+        """Reject operations on the document root or server-managed fields"""
+        
+        for operation in operations:
+            if operation.get("op") == "test":
+                continue
+            for key in ("path", "from"):
+                pointer = operation.get(key)
+                if not isinstance(pointer, str):
+                    continue
+                tokens = parse_pointer(pointer)
+                if not tokens:
+                    raise JsonPatchError("Cannot replace the whole workflow with a patch")
+                if tokens[0] in SERVER_MANAGED_FIELDS:
+                    raise JsonPatchError(f"Field {tokens[0]!r} is managed by the server")
+    
+    async def _store_revision(
+        self, 
+        workflow_id: str, 
+        current: Workflow, 
+        patched: Workflow
+    ) -> Workflow:
+        """Validate the changed parts of a patched workflow and store it as the next version"""
+        
+        if patched is current:
+            return current
+        
+        # Validate only fields whose objects changed; untouched ones are shared and already valid
+        for field in Workflow.model_fields:
+            value = getattr(patched, field)
+            if value is getattr(current, field):
+                continue
+            if field == "nodes":
+                patched.nodes = self._validate_changed_nodes(current.nodes, value)
+            else:
+                Workflow.__pydantic_validator__.validate_assignment(patched, field, value)
+        
+        patched.version = current.version + 1
+        patched.updatedAt = datetime.utcnow()
+        
+        try:
+            await self.store.save(workflow_id, patched, previous=current)
+        except StaleWorkflowError as e:
+            raise WorkflowVersionConflict(workflow_id, current.version, e.current_version)
+        self.canvas.on_revision(workflow_id, current, patched)
+        return patched
+    
+    @staticmethod
+    def _validate_changed_nodes(
+        previous_nodes: List[WorkflowNode], 
+        nodes: Any
+    ) -> List[WorkflowNode]:
+        """Validate nodes that are new or modified since the previous revision"""
+        
+        if not isinstance(nodes, list):
+            raise JsonPatchError("Workflow nodes must be an array")
+        
+        unchanged = {id(node) for node in previous_nodes}
+        return [
+            node if id(node) in unchanged
+            else WorkflowNode.model_validate(
+                node.model_dump() if isinstance(node, BaseModel) else node
+            )
+            for node in nodes
+        ]
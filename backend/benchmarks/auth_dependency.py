@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark for authenticated request overhead
+
+Compares resolving a bearer token the uncached way (JWT decode plus user
+lookup in a fresh session, as get_current_user did before the token cache)
+with the cached dependency. Uses a throwaway SQLite database.
+
+Usage: python benchmarks/auth_dependency.py [iterations]
+"""
+
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+# Add the backend directory to Python path
+backend_dir = Path(__file__).parent.parent
+sys.path.insert(0, str(backend_dir))
+
+os.environ.setdefault(
+    "DATABASE_URL", f"sqlite:///{tempfile.mkdtemp()}/auth_benchmark.db"
+)
+
+from fastapi.security import HTTPAuthorizationCredentials
+from app.core.database import AsyncSessionLocal, SessionLocal, create_tables
+from app.core.dependencies import get_current_user
+from app.core.token_cache import token_cache
+from app.models.user import User
+from app.services.user_service import UserService
+
+def report(label: str, elapsed: float, iterations: int):
+    print(f"{label:<32} {elapsed / iterations * 1e6:10.1f} us/request")
+
+async def uncached_lookup(token: str, iterations: int):
+    """The dependency chain without the token cache"""
+    for _ in range(iterations):
+        async with AsyncSessionLocal() as db:
+            user_service = UserService(db)
+            payload = user_service.verify_token(token)
+            await user_service.get_user_by_id(payload["user_id"])
+
+async def cached_lookup(credentials: HTTPAuthorizationCredentials, iterations: int):
+    for _ in range(iterations):
+        await get_current_user(credentials)
+
+async def run(iterations: int):
+    create_tables()
+    db = SessionLocal()
+    user = User(email="benchmark@8pilot.com", hashed_password="not-a-real-hash")
+    db.add(user)
+    db.commit()
+    token = UserService(db).create_access_token({"sub": user.email, "user_id": user.id})
+    db.close()
+
+    credentials = HTTPAuthorizationCredentials(scheme="Bearer", credentials=token)
+
+    await uncached_lookup(token, 1)  # open the connection pool
+    started = time.perf_counter()
+    await uncached_lookup(token, iterations)
+    report("JWT decode + user query", time.perf_counter() - started, iterations)
+
+    token_cache.clear()
+    await cached_lookup(credentials, 1)  # populate the cache
+    started = time.perf_counter()
+    await cached_lookup(credentials, iterations)
+    report("cached get_current_user", time.perf_counter() - started, iterations)
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    asyncio.run(run(iterations))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+Memory held by a long chat session
+
+Builds a session of alternating user prompts and assistant replies (some
+carrying workflow JSON) and measures, with tracemalloc, what its messages
+occupy as a plain list of Message objects and as a MessageLog with recent
+messages kept as records and older ones packed into compressed segments.
+
+Usage: python benchmarks/chat_memory.py [messages]
+"""
+
+import json
+import random
+import sys
+import time
+import tracemalloc
+import uuid
+from datetime import datetime, timedelta
+from pathlib import Path
+
+# Add the backend directory to Python path
+backend_dir = Path(__file__).parent.parent
+sys.path.insert(0, str(backend_dir))
+
+from app.models.chat import Message
+from app.services.message_log import MessageLog, MessageRecord, SegmentCodec, to_epoch_ms, zstandard
+
+PROMPTS = [
+    "Create a workflow that posts new Gmail messages to a Slack channel",
+    "Add an IF node that only forwards emails from our customers",
+    "Why does the HTTP Request node return a 401 error?",
+    "Change the schedule to run every 15 minutes on weekdays",
+    "Can you store the results in a Google Sheet as well?",
+]
+
+def workflow_json(rng: random.Random) -> str:
+    nodes = [
+        {
+            "parameters": {"url": f"https://api.example.com/{rng.randint(1, 999)}", "method": "POST"},
+            "id": str(uuid.uuid4()),
+            "name": f"Step {index}",
+            "type": rng.choice(["n8n-nodes-base.httpRequest", "n8n-nodes-base.set", "n8n-nodes-base.if"]),
+            "typeVersion": 1,
+            "position": [index * 220, 300]
+        }
+        for index in range(rng.randint(3, 8))
+    ]
+    connections = {
+        nodes[index]["name"]: {"main": [[{"node": nodes[index + 1]["name"], "type": "main", "index": 0}]]}
+        for index in range(len(nodes) - 1)
+    }
+    return json.dumps({"name": "Generated", "nodes": nodes, "connections": connections}, indent=2)
+
+def make_messages(count: int):
+    rng = random.Random(42)
+    started = datetime(2026, 1, 1)
+    messages = []
+    for index in range(count):
+        if index % 2 == 0:
+            role, content = "user", rng.choice(PROMPTS)
+        elif rng.random() < 0.3:
+            role = "assistant"
+            content = "Here is the workflow:\n```json\n" + workflow_json(rng) + "\n```\nImport it and add your credentials."
+        else:
+            role = "assistant"
+            content = "This workflow will trigger when the node receives data. " * rng.randint(2, 10)
+        messages.append(Message(
+            role=role,
+            content=content,
+            timestamp=started + timedelta(seconds=index),
+            message_id=str(uuid.uuid4())
+        ))
+    return messages
+
+def measure(build):
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    started = time.perf_counter()
+    result = build()
+    elapsed = time.perf_counter() - started
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    size = sum(stat.size_diff for stat in after.compare_to(before, "filename"))
+    return result, size, elapsed
+
+def main(count: int):
+    print(f"zstandard: {'yes' if zstandard is not None else 'no (zlib fallback)'}")
+    messages = make_messages(count)
+    text_bytes = sum(len(message.content.encode()) for message in messages)
+    print(f"{count} messages, {text_bytes / 1024:.0f} KiB of text")
+
+    # Messages are rebuilt from encoded text inside each measurement, so
+    # their strings are counted as they would be in a live session
+    raw = [
+        (message.role, message.content.encode(), message.timestamp, message.message_id.encode())
+        for message in messages
+    ]
+
+    def rebuild():
+        for role, content, timestamp, message_id in raw:
+            yield Message(role=role, content=content.decode(), timestamp=timestamp, message_id=message_id.decode())
+
+    def rebuild_records():
+        for role, content, timestamp, message_id in raw:
+            yield MessageRecord(role, content.decode(), to_epoch_ms(timestamp), message_id.decode())
+
+    # A worker that has been running for a while has trained its dictionary
+    codec = SegmentCodec()
+    while codec.samples is not None:
+        warmup = MessageLog([], hot_limit=16, segment_size=32, codec=codec)
+        for message in messages:
+            warmup.append(MessageRecord.from_message(message))
+    warmup = None
+
+    def as_objects():
+        return list(rebuild())
+
+    def as_log():
+        log = MessageLog([], hot_limit=16, segment_size=32, codec=codec)
+        for record in rebuild_records():
+            log.append(record)
+        return log
+
+    _, object_size, object_time = measure(as_objects)
+    log, log_size, log_time = measure(as_log)
+
+    print(f"  {'Message objects':<18} {object_size / 1024:8.0f} KiB  {object_time * 1e3:7.1f} ms")
+    print(f"  {'MessageLog':<18} {log_size / 1024:8.0f} KiB  {log_time * 1e3:7.1f} ms  ({object_size / log_size:.1f}x smaller)")
+
+    started = time.perf_counter()
+    restored = log.messages()
+    print(f"  full history read  {(time.perf_counter() - started) * 1e3:7.1f} ms")
+    assert [message.content for message in restored] == [message.content for message in messages]
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 2000)
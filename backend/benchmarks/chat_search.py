@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Chat search latency on a large message history
+
+Fills the in-memory chat store and search index with synthetic sessions
+across many workflows, then times queries with rare and common terms,
+with and without workflow, role and time filters.
+
+Usage: python benchmarks/chat_search.py [messages]
+"""
+
+import asyncio
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+# Add the backend directory to Python path
+backend_dir = Path(__file__).parent.parent
+sys.path.insert(0, str(backend_dir))
+
+from app.core.config import settings
+from app.services.chat_search import InMemoryChatIndex
+from app.services.chat_service import ChatService
+from app.services.message_log import MessageRecord
+
+WORDS = (
+    "workflow node trigger webhook slack gmail sheet schedule http request "
+    "credentials error retry json field filter merge split loop code expression "
+    "data item output input run execution branch condition value header token"
+).split()
+
+RARE_WORDS = ["kafka", "airtable", "mattermost", "clickup", "pipedrive"]
+
+MESSAGES_PER_SESSION = 100
+
+def sentence(rng: random.Random) -> str:
+    words = rng.choices(WORDS, k=rng.randint(8, 40))
+    if rng.random() < 0.001:
+        words.append(rng.choice(RARE_WORDS))
+    return " ".join(words)
+
+async def fill(chat_service: ChatService, count: int):
+    rng = random.Random(7)
+    store, index = chat_service.store, chat_service.search_index
+    started = time.perf_counter()
+    for first in range(0, count, MESSAGES_PER_SESSION):
+        session = await chat_service.get_or_create_session(f"workflow-{first // 1000}")
+        for position in range(min(MESSAGES_PER_SESSION, count - first)):
+            record = MessageRecord.new("user" if position % 2 == 0 else "assistant", sentence(rng))
+            await store.append(session, record)
+            await index.add(session, record, position)
+    print(f"indexed {count} messages in {time.perf_counter() - started:.1f}s")
+
+async def timed(chat_service: ChatService, label: str, repeat: int = 20, **query):
+    await chat_service.search_messages(**query)
+    started = time.perf_counter()
+    for _ in range(repeat):
+        results = await chat_service.search_messages(**query)
+    elapsed = (time.perf_counter() - started) / repeat
+    print(f"  {label:<34} {elapsed * 1e3:8.2f} ms  {len(results.hits)} hits")
+
+async def run(count: int):
+    settings.chat_storage = "memory"
+    settings.chat_search = "memory"
+    settings.max_chat_history = MESSAGES_PER_SESSION
+    chat_service = ChatService()
+    assert isinstance(chat_service.search_index, InMemoryChatIndex)
+
+    await fill(chat_service, count)
+    recent = datetime.utcnow() - timedelta(seconds=1)
+    await timed(chat_service, "rare term", query="kafka")
+    await timed(chat_service, "two common terms", query="slack webhook")
+    await timed(chat_service, "common term, one workflow", query="retry", workflow_id="workflow-3")
+    await timed(chat_service, "common term, assistant only", query="gmail", role="assistant")
+    await timed(chat_service, "common term, last second", query="schedule", since=recent)
+    await timed(chat_service, "absent term", query="salesforce")
+
+if __name__ == "__main__":
+    asyncio.run(run(int(sys.argv[1]) if len(sys.argv) > 1 else 200000))
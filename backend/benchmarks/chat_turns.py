@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+Cost of one chat turn in a long session
+
+A turn is what /chat/send does around the provider call: read the recent
+history, store the user message, build the provider payload and store the
+assistant reply. Runs turns against a session already holding the given
+number of messages kept in a plain list, once with Pydantic Message objects
+as the hot path used them (validated on creation, payload dicts rebuilt on
+every request) and once with MessageRecords; then through ChatService and
+its store, which adds the session lookup and packing of older messages.
+Reports latency and, with tracemalloc, the peak memory allocated during a
+turn and the blocks still held after it.
+
+Usage: python benchmarks/chat_turns.py [messages] [turns]
+"""
+
+import asyncio
+import sys
+import time
+import tracemalloc
+import uuid
+from datetime import datetime
+from pathlib import Path
+
+# Add the backend directory to Python path
+backend_dir = Path(__file__).parent.parent
+sys.path.insert(0, str(backend_dir))
+
+from app.core.config import settings
+from app.models.chat import Message
+from app.services.ai_service import AIService
+from app.services.chat_service import ChatService
+from app.services.message_log import MessageRecord
+
+PROMPT = "Add an IF node that only forwards emails from our customers"
+REPLY = "Here is the updated workflow. The IF node checks the sender domain. " * 4
+
+ai_service = AIService()
+
+class MessageTurns:
+    """The hot path as it was: Message objects and per-request payload dicts"""
+
+    def __init__(self, count: int):
+        self.messages = [self.message("user" if i % 2 == 0 else "assistant", REPLY) for i in range(count)]
+
+    @staticmethod
+    def message(role: str, content: str) -> Message:
+        return Message(role=role, content=content, timestamp=datetime.utcnow(), message_id=str(uuid.uuid4()))
+
+    async def turn(self):
+        history = list(self.messages[-settings.chat_hot_messages:])
+        self.messages.append(self.message("user", PROMPT))
+        payload = [{"role": "system", "content": "You are an n8n assistant"}]
+        payload.extend({"role": message.role, "content": message.content} for message in history[-10:])
+        payload.append({"role": "user", "content": PROMPT})
+        self.messages.append(self.message("assistant", REPLY))
+
+class RecordListTurns:
+    """The same steps with MessageRecords and cached payload fragments"""
+
+    def __init__(self, count: int):
+        self.messages = [MessageRecord.new("user" if i % 2 == 0 else "assistant", REPLY) for i in range(count)]
+
+    async def turn(self):
+        history = list(self.messages[-settings.chat_hot_messages:])
+        self.messages.append(MessageRecord.new("user", PROMPT))
+        ai_service._prepare_messages(PROMPT, {"system_prompt": "You are an n8n assistant"}, history)
+        self.messages.append(MessageRecord.new("assistant", REPLY))
+
+class ServiceTurns:
+    """The hot path through ChatService and AIService"""
+
+    def __init__(self, count: int):
+        self.chat_service = ChatService()
+        self.count = count
+
+    async def setup(self):
+        self.session = await self.chat_service.get_or_create_session("benchmark")
+        for i in range(self.count):
+            await self.chat_service.add_message(self.session.session_id, "user" if i % 2 == 0 else "assistant", REPLY)
+
+    async def turn(self):
+        session_id = self.session.session_id
+        history = await self.chat_service.get_recent_messages(self.session)
+        await self.chat_service.add_message(session_id, "user", PROMPT)
+        ai_service._prepare_messages(PROMPT, {"system_prompt": "You are an n8n assistant"}, history)
+        await self.chat_service.add_message(session_id, "assistant", REPLY)
+
+async def measure(label: str, runner, turns: int):
+    for _ in range(turns):
+        await runner.turn()  # warm up, and compact the hot tier
+
+    started = time.perf_counter()
+    for _ in range(turns):
+        await runner.turn()
+    latency = (time.perf_counter() - started) / turns
+
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    allocated = 0
+    for _ in range(turns):
+        tracemalloc.reset_peak()
+        current, _ = tracemalloc.get_traced_memory()
+        await runner.turn()
+        allocated += tracemalloc.get_traced_memory()[1] - current
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    held = sum(stat.count_diff for stat in after.compare_to(before, "filename"))
+
+    print(
+        f"  {label:<16} {latency * 1e6:8.1f} us/turn  {allocated / turns / 1024:7.1f} KiB peak/turn  "
+        f"{held / turns:6.1f} blocks held/turn"
+    )
+
+async def run(count: int, turns: int):
+    # No trimming while measuring
+    settings.max_chat_history = count + 4 * turns
+
+    print(f"{count}-message session, {turns} turns")
+    await measure("Message objects", MessageTurns(count), turns)
+    await measure("MessageRecord", RecordListTurns(count), turns)
+    service = ServiceTurns(count)
+    await service.setup()
+    await measure("ChatService", service, turns)
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    turns = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+    asyncio.run(run(count, turns))
@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""
+JSON response serialization for large chat histories and workflows
+
+Each payload is served by routes that differ only in how the response is
+built, called in-process through the ASGI interface:
+
+  jsonable_encoder  stdlib JSONResponse after jsonable_encoder, the path
+                    older FastAPI versions take for response models
+  response_model    FastAPI's own handling of a returned response model
+  fast default      response model with FastJSONResponse as the app default
+  model response    endpoint returns FastJSONResponse(model)
+
+Usage: python benchmarks/json_responses.py [iterations]
+"""
+
+import asyncio
+import sys
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+# Add the backend directory to Python path
+backend_dir = Path(__file__).parent.parent
+sys.path.insert(0, str(backend_dir))
+
+from fastapi import FastAPI
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+from app.core.responses import JSON_ENCODER, FastJSONResponse
+from app.models.chat import ChatHistory, ChatSession, Message
+from app.models.workflow import Workflow, WorkflowNode
+
+def make_workflow(nodes: int) -> Workflow:
+    started = datetime(2026, 1, 1)
+    return Workflow(
+        id="benchmark",
+        name="Benchmark workflow",
+        nodes=[
+            WorkflowNode(
+                id=f"node-{index}",
+                name=f"Node {index}",
+                type="n8n-nodes-base.httpRequest",
+                position=[index * 220, (index % 7) * 160],
+                parameters={
+                    "url": f"https://api.example.com/items/{index}",
+                    "method": "POST",
+                    "options": {"timeout": 10000, "retry": {"maxTries": 3}},
+                    "headers": [{"name": "X-Request", "value": str(index)}],
+                }
+            )
+            for index in range(nodes)
+        ],
+        connections={
+            f"Node {index}": [{"node": f"Node {index + 1}", "type": "main", "index": "0"}]
+            for index in range(nodes - 1)
+        },
+        tags=["benchmark"],
+        version=3,
+        createdAt=started,
+        updatedAt=started + timedelta(hours=1)
+    )
+
+def make_history(sessions: int, messages: int) -> ChatHistory:
+    started = datetime(2026, 1, 1)
+    return ChatHistory(
+        workflow_id="benchmark",
+        sessions=[
+            ChatSession(
+                session_id=f"session-{session}",
+                workflow_id="benchmark",
+                messages=[
+                    Message(
+                        role="user" if index % 2 == 0 else "assistant",
+                        content=f"Message {index} of session {session}: " + "lorem ipsum " * 30,
+                        timestamp=started + timedelta(seconds=index),
+                        message_id=f"{session}-{index}"
+                    )
+                    for index in range(messages)
+                ],
+                created_at=started,
+                last_activity=started + timedelta(seconds=messages)
+            )
+            for session in range(sessions)
+        ],
+        total_messages=sessions * messages
+    )
+
+def build_app(payload, model, default_response_class=JSONResponse) -> FastAPI:
+    app = FastAPI(default_response_class=default_response_class)
+
+    @app.get("/encoder")
+    async def encoder():
+        return JSONResponse(jsonable_encoder(payload))
+
+    @app.get("/model", response_model=model)
+    async def response_model():
+        return payload
+
+    @app.get("/direct", response_model=model)
+    async def direct():
+        return FastJSONResponse(payload)
+
+    return app
+
+async def call(app, path: str) -> bytes:
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "query_string": b"",
+        "root_path": "",
+        "headers": [(b"host", b"localhost")],
+        "client": ("127.0.0.1", 50000),
+        "server": ("localhost", 8000),
+    }
+    body = []
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        if message["type"] == "http.response.body":
+            body.append(message.get("body", b""))
+
+    await app(scope, receive, send)
+    return b"".join(body)
+
+async def measure(label: str, payload, model, iterations: int):
+    default_app = build_app(payload, model)
+    fast_app = build_app(payload, model, FastJSONResponse)
+    size = len(await call(default_app, "/model"))
+    print(f"== {label} ({size / 1024:.0f} KiB)")
+
+    for name, app, path in (
+        ("jsonable_encoder", default_app, "/encoder"),
+        ("response_model", default_app, "/model"),
+        ("fast default", fast_app, "/model"),
+        ("model response", default_app, "/direct"),
+    ):
+        await call(app, path)
+        started = time.perf_counter()
+        for _ in range(iterations):
+            await call(app, path)
+        elapsed = time.perf_counter() - started
+        print(f"  {name:<18} {elapsed / iterations * 1e3:8.3f} ms/request")
+
+async def main(iterations: int):
+    print(f"JSON encoder: {JSON_ENCODER}")
+    await measure("workflow, 500 nodes", make_workflow(500), Workflow, iterations)
+    await measure("chat history, 20 sessions x 100 messages", make_history(20, 100), ChatHistory, iterations)
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 200))
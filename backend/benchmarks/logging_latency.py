@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Latency of logging calls in the request path
+
+Times individual logger.info calls during a burst, once with the console
+and rotating file handlers attached to the logger directly (as
+setup_logging used to do) and once through the bounded queue that
+setup_logging now installs. The file rotates every 256 KiB, so the burst
+includes rotations. Output goes to a temporary directory; console output
+to /dev/null.
+
+Usage: python benchmarks/logging_latency.py [records]
+"""
+
+import logging
+import os
+import queue
+import sys
+import tempfile
+import time
+from logging.handlers import RotatingFileHandler
+from pathlib import Path
+
+# Add the backend directory to Python path
+backend_dir = Path(__file__).parent.parent
+sys.path.insert(0, str(backend_dir))
+
+from app.core.logging import DroppingQueueHandler, RequestIdFilter, _QueueListener
+
+FORMAT = "%(asctime)s - %(name)s - %(levelname)s - [%(request_id)s] %(message)s"
+
+def handlers(directory: str):
+    console = logging.StreamHandler(open(os.devnull, "w"))
+    file = RotatingFileHandler(os.path.join(directory, "app.log"), maxBytes=256 * 1024, backupCount=3)
+    for handler in (console, file):
+        handler.setFormatter(logging.Formatter(FORMAT))
+    return [console, file]
+
+def burst(logger: logging.Logger, count: int):
+    timings = []
+    for index in range(count):
+        started = time.perf_counter_ns()
+        logger.info("Created new chat session %s for workflow %s", index, "workflow-1")
+        timings.append(time.perf_counter_ns() - started)
+    timings.sort()
+    return timings
+
+def report(label: str, timings, extra: str = ""):
+    def percentile(fraction: float) -> float:
+        return timings[min(int(len(timings) * fraction), len(timings) - 1)] / 1000
+
+    print(
+        f"  {label:<10} p50 {percentile(0.5):7.1f} us  p99 {percentile(0.99):7.1f} us  "
+        f"p99.9 {percentile(0.999):8.1f} us  max {timings[-1] / 1000:8.1f} us{extra}"
+    )
+
+def main(count: int):
+    print(f"{count} records")
+    with tempfile.TemporaryDirectory() as directory:
+        logger = logging.getLogger("benchmark.direct")
+        logger.propagate = False
+        logger.setLevel(logging.INFO)
+        for handler in handlers(directory):
+            handler.addFilter(RequestIdFilter())
+            logger.addHandler(handler)
+        report("direct", burst(logger, count))
+        for handler in logger.handlers:
+            handler.close()
+
+    with tempfile.TemporaryDirectory() as directory:
+        logger = logging.getLogger("benchmark.queued")
+        logger.propagate = False
+        logger.setLevel(logging.INFO)
+        log_queue = queue.Queue(maxsize=10000)
+        queue_handler = DroppingQueueHandler(log_queue)
+        queue_handler.addFilter(RequestIdFilter())
+        logger.addHandler(queue_handler)
+        listener = _QueueListener(log_queue, *handlers(directory))
+        listener.start()
+        timings = burst(logger, count)
+        listener.stop()
+        for handler in listener.handlers:
+            handler.close()
+        dropped = sum(queue_handler.dropped.values())
+        report("queued", timings, f"  ({dropped} dropped)")
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 50000)
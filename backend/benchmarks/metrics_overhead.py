@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Cost of the metrics instrumentation
+
+Times a histogram observation (from one thread and from four observing
+the same series), a timed block, the wrapper around timed coroutines and
+a chat store lookup with and without it. Then renders /metrics with the
+given number of labelled series, twice: the first render builds the
+label text that later ones reuse.
+
+Usage: python benchmarks/metrics_overhead.py [series]
+"""
+
+import asyncio
+import sys
+import threading
+import time
+from pathlib import Path
+
+# Add the backend directory to Python path
+backend_dir = Path(__file__).parent.parent
+sys.path.insert(0, str(backend_dir))
+
+from app.core.metrics import MetricsRegistry, timed
+from app.models.chat import ChatSession
+from app.services.chat_repository import InMemoryChatStore
+
+ITERATIONS = 200000
+
+def per_call(function, iterations: int = ITERATIONS) -> float:
+    started = time.perf_counter()
+    for _ in range(iterations):
+        function()
+    return (time.perf_counter() - started) / iterations * 1e9
+
+async def per_await(function, iterations: int = ITERATIONS) -> float:
+    started = time.perf_counter()
+    for _ in range(iterations):
+        await function()
+    return (time.perf_counter() - started) / iterations * 1e9
+
+def threaded(function, threads: int = 4) -> float:
+    def run():
+        for _ in range(ITERATIONS):
+            function()
+
+    workers = [threading.Thread(target=run) for _ in range(threads)]
+    started = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return (time.perf_counter() - started) / (ITERATIONS * threads) * 1e9
+
+async def run(series_count: int):
+    registry = MetricsRegistry()
+    histogram = registry.histogram("benchmark_seconds", "Benchmark", ["operation"])
+    series = histogram.labels("observe")
+
+    def block():
+        with series.time():
+            pass
+
+    async def nothing():
+        pass
+
+    timed_nothing = timed(series)(nothing)
+
+    print(f"  {'observe':<28} {per_call(lambda: series.observe(0.001)):8.0f} ns")
+    print(f"  {'observe, 4 threads':<28} {threaded(lambda: series.observe(0.001)):8.0f} ns")
+    print(f"  {'timed block':<28} {per_call(block):8.0f} ns")
+    baseline = await per_await(nothing)
+    print(f"  {'timed coroutine (overhead)':<28} {await per_await(timed_nothing) - baseline:8.0f} ns")
+
+    store = InMemoryChatStore(16, 32)
+    session = ChatSession(session_id="benchmark", workflow_id="benchmark")
+    await store.add(session)
+    untimed_get = InMemoryChatStore.get.__wrapped__
+    print(f"  {'store get, untimed':<28} {await per_await(lambda: untimed_get(store, 'benchmark')):8.0f} ns")
+    print(f"  {'store get, timed':<28} {await per_await(lambda: store.get('benchmark')):8.0f} ns")
+
+    for index in range(series_count):
+        histogram.labels(f"operation-{index}").observe(0.001)
+    for label in ("first", "next"):
+        started = time.perf_counter()
+        text = registry.render()
+        print(f"  render {series_count} series, {label}: {(time.perf_counter() - started) * 1e3:6.1f} ms, {len(text) // 1024} KiB")
+
+if __name__ == "__main__":
+    asyncio.run(run(int(sys.argv[1]) if len(sys.argv) > 1 else 500))
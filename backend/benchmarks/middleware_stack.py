@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+Middleware stack overhead: requests/sec and streaming time to first byte
+
+Compares the previous stack (BaseHTTPMiddleware CORS plus TrustedHostMiddleware
+allowing "*") with the pure ASGI CORS middleware. Requests are driven
+directly through the ASGI interface, so only the application and its
+middleware are measured, not HTTP parsing.
+
+Usage: python benchmarks/middleware_stack.py [requests]
+"""
+
+import asyncio
+import statistics
+import sys
+import time
+from pathlib import Path
+
+# Add the backend directory to Python path
+backend_dir = Path(__file__).parent.parent
+sys.path.insert(0, str(backend_dir))
+
+from fastapi import FastAPI, Request
+from fastapi.middleware.trustedhost import TrustedHostMiddleware
+from fastapi.responses import StreamingResponse
+from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.responses import Response
+
+from app.core.middleware import CORSMiddleware
+
+# Delay between streamed chunks, roughly an AI provider's token cadence
+CHUNK_INTERVAL = 0.005
+CHUNKS = 20
+
+class LegacyCORSMiddleware(BaseHTTPMiddleware):
+    """The CORS middleware app.main used before"""
+
+    async def dispatch(self, request: Request, call_next):
+        if request.method == "OPTIONS":
+            response = Response()
+            response.headers["Access-Control-Allow-Origin"] = "*"
+            response.headers["Access-Control-Allow-Methods"] = "GET, POST, PUT, DELETE, OPTIONS"
+            response.headers["Access-Control-Allow-Headers"] = "*"
+            response.headers["Access-Control-Max-Age"] = "600"
+            return response
+
+        response = await call_next(request)
+        response.headers["Access-Control-Allow-Origin"] = "*"
+        response.headers["Access-Control-Allow-Methods"] = "GET, POST, PUT, DELETE, OPTIONS"
+        response.headers["Access-Control-Allow-Headers"] = "*"
+        return response
+
+def build_app(legacy: bool) -> FastAPI:
+    app = FastAPI()
+
+    if legacy:
+        app.add_middleware(LegacyCORSMiddleware)
+        app.add_middleware(TrustedHostMiddleware, allowed_hosts=["*"])
+    else:
+        app.add_middleware(CORSMiddleware)
+
+    @app.get("/health")
+    async def health_check():
+        return {"status": "healthy", "service": "8pilot-backend"}
+
+    @app.get("/stream")
+    async def stream():
+        async def events():
+            for index in range(CHUNKS):
+                yield f"data: {index}\n\n"
+                await asyncio.sleep(CHUNK_INTERVAL)
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    return app
+
+async def request(app, method: str, path: str):
+    """Send one request and return (status, time to first body byte)"""
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": method,
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "query_string": b"",
+        "root_path": "",
+        "headers": [(b"host", b"localhost"), (b"origin", b"chrome-extension://benchmark")],
+        "client": ("127.0.0.1", 50000),
+        "server": ("localhost", 8000),
+    }
+    started = time.perf_counter()
+    first_byte = None
+    status = None
+    request_sent = False
+    response_complete = asyncio.Event()
+
+    async def receive():
+        nonlocal request_sent
+        if not request_sent:
+            request_sent = True
+            return {"type": "http.request", "body": b"", "more_body": False}
+        # Like a server, report the disconnect once the response is done
+        await response_complete.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        nonlocal first_byte, status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+        elif message["type"] == "http.response.body":
+            if first_byte is None:
+                first_byte = time.perf_counter() - started
+            if not message.get("more_body", False):
+                response_complete.set()
+
+    await app(scope, receive, send)
+    return status, first_byte
+
+async def measure(label: str, app, requests: int):
+    for method, path in (("GET", "/health"), ("OPTIONS", "/health")):
+        await request(app, method, path)  # warm up
+        started = time.perf_counter()
+        for _ in range(requests):
+            await request(app, method, path)
+        elapsed = time.perf_counter() - started
+        print(f"{label:<8} {method:<8} {path:<8} {requests / elapsed:10.0f} req/s")
+
+    ttfb = []
+    for _ in range(max(requests // 100, 10)):
+        _, first_byte = await request(app, "GET", "/stream")
+        ttfb.append(first_byte * 1e3)
+    print(f"{label:<8} stream TTFB p50 {statistics.median(ttfb):.3f} ms, max {max(ttfb):.3f} ms")
+
+async def main(requests: int):
+    await measure("before", build_app(legacy=True), requests)
+    await measure("after", build_app(legacy=False), requests)
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 5000))
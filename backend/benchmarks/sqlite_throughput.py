@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+Concurrent register/login throughput on SQLite
+
+Runs the auth endpoints in-process against a throwaway SQLite database,
+once with the default rollback journal and a single shared connection
+(SQLITE_WAL=false) and once with the WAL profile. bcrypt is set to its
+minimum cost so the database, not hashing, dominates.
+
+Usage: python benchmarks/sqlite_throughput.py [users] [concurrency]
+"""
+
+import asyncio
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+# Add the backend directory to Python path
+backend_dir = Path(__file__).parent.parent
+sys.path.insert(0, str(backend_dir))
+
+def report(label: str, operations: int, elapsed: float):
+    print(f"{label:<24} {operations / elapsed:10.1f} req/s  ({operations} requests, {elapsed:.2f}s)")
+
+async def run(users: int, concurrency: int):
+    import httpx
+    from fastapi import FastAPI
+    from app.api.v1.endpoints import auth
+    from app.core.database import create_tables
+
+    create_tables()
+    app = FastAPI()
+    app.include_router(auth.router, prefix="/auth")
+
+    semaphore = asyncio.Semaphore(concurrency)
+    transport = httpx.ASGITransport(app=app)
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://benchmark") as client:
+        async def call(path: str, index: int):
+            async with semaphore:
+                response = await client.post(path, json={
+                    "email": f"user{index}@8pilot.com",
+                    "password": "benchmark-password"
+                })
+                response.raise_for_status()
+
+        for path in ("/auth/register", "/auth/login"):
+            started = time.perf_counter()
+            await asyncio.gather(*(call(path, index) for index in range(users)))
+            report(path.rsplit("/", 1)[-1], users, time.perf_counter() - started)
+
+def main():
+    users = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    concurrency = int(sys.argv[2]) if len(sys.argv) > 2 else 32
+
+    if os.environ.get("BENCHMARK_CHILD"):
+        asyncio.run(run(users, concurrency))
+        return
+
+    # The engine is configured at import, so each profile runs in its own process
+    for label, wal in (("default journal", "false"), ("WAL profile", "true")):
+        print(f"== {label}")
+        env = dict(
+            os.environ,
+            BENCHMARK_CHILD="1",
+            SQLITE_WAL=wal,
+            PASSWORD_HASH_ROUNDS="4",
+            DATABASE_URL=f"sqlite:///{tempfile.mkdtemp()}/throughput.db"
+        )
+        subprocess.run([sys.executable, __file__, str(users), str(concurrency)], env=env, check=True)
+
+if __name__ == "__main__":
+    main()
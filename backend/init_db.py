@@ -4,6 +4,7 @@ Database initialization script for 8pilot backend
 Creates tables and optionally creates a default admin user
 """
 
+import asyncio
 import sys
 import os
 from pathlib import Path
@@ -14,40 +15,37 @@ sys.path.insert(0, str(backend_dir))
 
 # Import all models to ensure they are registered with Base
 from app.models.user import User, UserCreate
-from app.core.database import create_tables, SessionLocal
+from app.core.database import create_tables, AsyncSessionLocal
 from app.services.user_service import UserService
 
-def create_default_admin():
+async def create_default_admin():
     """Create a default admin user if it doesn't exist"""
-    db = SessionLocal()
     try:
-        user_service = UserService(db)
-        
-        # Check if admin user already exists
-        admin_user = user_service.get_user_by_email("admin@8pilot.com")
-        if admin_user:
-            print("Admin user already exists")
-            return
-        
-        # Create admin user
-        admin_data = UserCreate(
-            email="admin@8pilot.com",
-            password="admin123"  # Change this in production!
-        )
-        
-        user = user_service.create_user(admin_data)
-        
-        print(f"Admin user created successfully: {user.email}")
-        print("Default credentials:")
-        print("  Email: admin@8pilot.com")
-        print("  Password: admin123")
-        print("\n⚠️  IMPORTANT: Change the default password in production!")
-        
+        async with AsyncSessionLocal() as db:
+            user_service = UserService(db)
+            
+            # Check if admin user already exists
+            admin_user = await user_service.get_user_by_email("admin@8pilot.com")
+            if admin_user:
+                print("Admin user already exists")
+                return
+            
+            # Create admin user
+            admin_data = UserCreate(
+                email="admin@8pilot.com",
+                password="admin123"  # Change this in production!
+            )
+            
+            user = await user_service.create_user(admin_data)
+            
+            print(f"Admin user created successfully: {user.email}")
+            print("Default credentials:")
+            print("  Email: admin@8pilot.com")
+            print("  Password: admin123")
+            print("\n⚠️  IMPORTANT: Change the default password in production!")
+            
     except Exception as e:
         print(f"Error creating admin user: {e}")
-        db.rollback()
-    finally:
-        db.close()
 
 def main():
     """Main function"""
@@ -60,7 +58,7 @@ def main():
         
         # Create default admin user
         print("\nCreating default admin user...")
-        create_default_admin()
+        asyncio.run(create_default_admin())
         
         print("\n🎉 Database initialization completed!")
         
@@ -1027,6 +1027,7 @@ export class ChatManager {
       
       // Use streaming API
       let fullResponse = '';
+      let workflowCandidate = null;
       await this.backendApiService.streamMessage(
         message,
         this.currentWorkflowId || 'unknown',
@@ -1047,14 +1048,25 @@ export class ChatManager {
           if (chunk.session_id) {
             this.currentSessionId = chunk.session_id;
           }
+        },
+        (candidate) => {
+          // Apply the first valid workflow as soon as its JSON closes
+          if (this.isGenerationStopped || workflowCandidate || !candidate.valid) {
+            return;
+          }
+          workflowCandidate = candidate;
+          this.processWorkflowResponse(fullResponse, candidate.workflow);
         }
       );
       
       // Always finalize streaming message with current content
       this.chatMessages.finalizeStreamingMessage(streamingMessageId, fullResponse);
       
-      // CRITICAL: Process workflow after streaming is complete
-      await this.processWorkflowResponse(fullResponse);
+      // CRITICAL: Process workflow after streaming is complete, unless the
+      // backend already delivered it while streaming
+      if (!workflowCandidate) {
+        await this.processWorkflowResponse(fullResponse);
+      }
       
       // Save assistant response to local storage (even if stopped)
       if (this.currentWorkflowId && fullResponse) {
@@ -1135,17 +1147,17 @@ export class ChatManager {
     this.hideChatMessages();
   }
 
-  async processWorkflowResponse(response) {
+  async processWorkflowResponse(response, workflow = null) {
     try {
       console.log('Processing workflow response...');
       
       // Check if response contains JSON workflow
-      const workflowJson = this.extractWorkflowJson(response);
+      const workflowJson = workflow ? JSON.stringify(workflow) : this.extractWorkflowJson(response);
       if (workflowJson) {
         console.log('Workflow JSON detected in response');
         
         // Extract workflow name from response if possible
-        const workflowName = this.extractWorkflowName(response) || 'Generated Workflow';
+        const workflowName = this.extractWorkflowName(response) || (workflow && workflow.name) || 'Generated Workflow';
         
         // Automatically apply the workflow to canvas
         const applied = await this.workflowApplicator.applyWorkflowFromJson(workflowJson, workflowName);
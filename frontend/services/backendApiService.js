@@ -48,7 +48,7 @@ export class BackendApiService {
     }
   }
 
-  async streamMessage(message, workflowId, sessionId = null, provider = null, model = null, apiKeyData = {}, onChunk = null) {
+  async streamMessage(message, workflowId, sessionId = null, provider = null, model = null, apiKeyData = {}, onChunk = null, onWorkflowCandidate = null) {
     try {
       const requestData = {
         message: message,
@@ -83,25 +83,38 @@ export class BackendApiService {
 
       const reader = response.body.getReader();
       const decoder = new TextDecoder();
+      // Lines can be split across reads; keep the unfinished tail
+      let pending = '';
+      let eventType = 'message';
 
       while (true) {
         const { done, value } = await reader.read();
         
         if (done) break;
 
-        const chunk = decoder.decode(value);
-        const lines = chunk.split('\n');
+        pending += decoder.decode(value, { stream: true });
+        const lines = pending.split('\n');
+        pending = lines.pop();
 
         for (const line of lines) {
-          if (line.startsWith('data: ')) {
+          if (line.startsWith('event: ')) {
+            eventType = line.slice(7).trim();
+          } else if (line.startsWith('data: ')) {
             try {
               const data = JSON.parse(line.slice(6));
-              if (onChunk) {
+              if (eventType === 'workflow_candidate') {
+                // Already parsed and validated by the backend
+                if (onWorkflowCandidate) {
+                  onWorkflowCandidate(data);
+                }
+              } else if (onChunk) {
                 onChunk(data);
               }
             } catch (e) {
               console.warn('Failed to parse chunk:', line);
             }
+          } else if (line === '') {
+            eventType = 'message';
           }
         }
       }
@@ -112,9 +125,11 @@ export class BackendApiService {
     }
   }
 
-  async getChatHistory(workflowId) {
+  async getChatHistory(workflowId, { limit = 1, messageLimit = 100 } = {}) {
     try {
-      const response = await fetch(`${this.baseUrl}/chat/sessions/${workflowId}`);
+      // Only the latest sessions and their latest messages, not the whole history
+      const params = new URLSearchParams({ limit, message_limit: messageLimit });
+      const response = await fetch(`${this.baseUrl}/chat/sessions/${workflowId}/page?${params}`);
       
       if (!response.ok) {
         const errorData = await response.json();
@@ -130,6 +145,28 @@ export class BackendApiService {
     }
   }
 
+  async searchChatHistory(query, { workflowId, role, since, until, limit = 20 } = {}) {
+    try {
+      const params = new URLSearchParams({ q: query, limit });
+      if (workflowId) params.set('workflow_id', workflowId);
+      if (role) params.set('role', role);
+      if (since) params.set('since', since);
+      if (until) params.set('until', until);
+      const response = await fetch(`${this.baseUrl}/chat/search?${params}`);
+      
+      if (!response.ok) {
+        const errorData = await response.json();
+        throw new Error(`Backend API error: ${errorData.detail || 'Unknown error'}`);
+      }
+
+      return await response.json();
+
+    } catch (error) {
+      console.error('Error searching chat history:', error);
+      throw error;
+    }
+  }
+
   async getLatestSession(workflowId) {
     try {
       const response = await fetch(`${this.baseUrl}/chat/sessions/${workflowId}/latest`);